@@ -1,14 +1,26 @@
 # app/api/v1/endpoints/analysis.py
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Path, Query
+from fastapi import APIRouter, HTTPException, Depends, Header, Path, Query, Response
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
-from app.core.database import get_db, SessionLocal
+from app.core.config import settings
+from app.core.database import get_db
+from app.api.v1.endpoints.files import ManifestFile
+from app.services.admission import AdmissionRejected, admission_controller
+from app.services.analysis_service import IdempotencyKeyReused, analysis_service
+from app.services.archive_service import ArchiveRejected, archive_service
+from app.services.content_store import content_store
+from app.services.diff_review import DiffRejected, diff_review_service
+from app.services.dispatcher import dispatcher
+from app.services.live_session import InvalidEdit, LiveSessionConflict, LiveSessionNotFound, live_sessions
 from app.services.repository_services import repository_service
-from app.db import models
-from pydantic import BaseModel, Field
+from app.services.snapshot_service import snapshot_service
+from app.services.upload_service import UploadNotFound, upload_service
+from app import models
+from app.models import AnalysisPriority
+from pydantic import BaseModel, Field, computed_field
 
 router = APIRouter()
 
@@ -21,101 +33,215 @@ class AnalysisRequest(BaseModel):
         pattern=r"^[A-Za-z0-9_./\-]+$",
         description="Branch name or commit hash"
     )
+    priority: AnalysisPriority = Field(
+        default=AnalysisPriority.NORMAL,
+        description="Scheduling class: interactive, normal or bulk"
+    )
+    deadline_seconds: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=86400,
+        description="Cancel the analysis if it has not finished this many seconds after the trigger"
+    )
 
 class AnalysisTriggerResponse(BaseModel):
     message: str
+    analysis_id: int
     repo_id: int
     commit_hash: str
+    status: str
+    deduplicated: bool = False
+
+class BulkAnalysisTarget(BaseModel):
+    repo_id: int = Field(gt=0)
+    commit_hash: str = Field(
+        default="main",
+        min_length=1,
+        max_length=64,
+        pattern=r"^[A-Za-z0-9_./\-]+$",
+        description="Branch name or commit hash"
+    )
+
+class BulkAnalysisRequest(BaseModel):
+    targets: List[BulkAnalysisTarget] = Field(min_length=1, max_length=settings.ANALYSIS_BULK_MAX_ITEMS)
+    deadline_seconds: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=86400,
+        description="Cancel each analysis if it has not finished this many seconds after the trigger"
+    )
+
+class BulkAnalysisResult(BaseModel):
+    repo_id: int
+    ref: str
+    analysis_id: Optional[int] = None
+    commit_hash: Optional[str] = None
+    status: Optional[str] = None
+    deduplicated: bool = False
+    error: Optional[str] = None
+
+class BulkAnalysisResponse(BaseModel):
+    message: str
+    scheduled: int
+    deduplicated: int
+    failed: int
+    results: List[BulkAnalysisResult]
+
+class SnapshotTarget(BaseModel):
+    repo_id: Optional[int] = Field(default=None, gt=0, description="Upload repository to add the snapshot to; omit to create one")
+    name: Optional[str] = Field(default=None, max_length=255, description="Name of the repository to create")
+    user_id: Optional[int] = Field(default=None, gt=0, description="Owner of the repository to create")
+    priority: AnalysisPriority = Field(default=AnalysisPriority.NORMAL)
+    deadline_seconds: Optional[int] = Field(default=None, ge=1, le=86400)
+
+class ArchiveAnalysisRequest(SnapshotTarget):
+    upload_id: str = Field(min_length=1, max_length=32, description="A completed upload (see /files/uploads) of a .zip or .tar(.gz) archive")
+
+class SnapshotAnalysisRequest(SnapshotTarget):
+    files: List[ManifestFile] = Field(min_length=1, max_length=settings.SNAPSHOT_MAX_FILES)
+
+class ArchiveAnalysisResponse(AnalysisTriggerResponse):
+    files: int
+    skipped: int
+    bytes: int
 
 class AnalysisSyncResponse(BaseModel):
     status: str
     repo_id: int
     commit_hash: str
-    review: dict
+    review: list
+
+class CodeAnalysisRequest(BaseModel):
+    code: str = Field(min_length=1, max_length=200_000)
+    language: str = Field(default="javascript", max_length=32)
+    filename: Optional[str] = Field(default=None, max_length=255)
+
+class CodeIssue(BaseModel):
+    line: int
+    severity: str
+    message: str
+    category: str = "general"
+
+class CodeAnalysisResponse(BaseModel):
+    status: str
+    language: str
+    filename: Optional[str] = None
+    issues: List[CodeIssue]
+    metrics: dict
+    created_at: datetime
+    completed_at: datetime
+
+class DiffAnalysisRequest(BaseModel):
+    diff: str = Field(min_length=1, max_length=settings.DIFF_MAX_CHARS, description="Unified diff (git diff / diff -u)")
+    files: Dict[str, str] = Field(
+        default_factory=dict, description="Base (old) contents of changed files by path; read from repo_id at base_ref otherwise"
+    )
+    repo_id: Optional[int] = Field(default=None, gt=0)
+    base_ref: Optional[str] = Field(
+        default=None, min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_./\-]+$", description="Branch name or commit hash the diff is against"
+    )
+
+class DiffRegion(BaseModel):
+    path: str
+    start_line: int
+    end_line: int
+    kind: str
+    name: Optional[str] = None
+
+class DiffIssue(CodeIssue):
+    path: str
+    changed: bool  # on a line the diff added or changed, rather than elsewhere in the reviewed region
+
+class DiffAnalysisResponse(BaseModel):
+    status: str
+    files: int
+    skipped: List[str]
+    regions: List[DiffRegion]
+    regions_reviewed: int
+    issues: List[DiffIssue]
+    created_at: datetime
+    completed_at: datetime
+
+class LiveSessionRequest(BaseModel):
+    code: str = Field(max_length=settings.LIVE_SESSION_MAX_CHARS)
+    language: str = Field(default="javascript", max_length=32)
+    filename: Optional[str] = Field(default=None, max_length=255)
+
+class LiveEdit(BaseModel):
+    # A Monaco-style range (1-based lines and columns, end exclusive) and its replacement
+    start_line: int = Field(ge=1)
+    start_column: int = Field(ge=1)
+    end_line: int = Field(ge=1)
+    end_column: int = Field(ge=1)
+    text: str = Field(default="", max_length=settings.LIVE_SESSION_MAX_CHARS)
+
+class LiveEditsRequest(BaseModel):
+    base_version: int = Field(ge=0, description="Session version the edits were made against")
+    edits: List[LiveEdit] = Field(min_length=1, max_length=1000)
+
+class LiveDiagnostic(CodeIssue):
+    id: str
+
+class LiveSessionResponse(BaseModel):
+    session_id: str
+    version: int
+    added: List[LiveDiagnostic]
+    updated: List[LiveDiagnostic]
+    removed: List[str]
+    chunks_total: int
+    chunks_reviewed: int
 
 class AnalysisRead(BaseModel):
     id: int
     repository_id: int
     commit_hash: str
+    ref: Optional[str] = None
     status: str
+    priority: str
+    cancel_reason: Optional[str] = None
+    prompt_version: Optional[str] = None
+    model_name: Optional[str] = None
     results: Optional[dict] = None
+    files_total: Optional[int] = None
+    files_done: int = 0
+    chunks_total: Optional[int] = None
+    chunks_done: int = 0
+    tokens_used: int = 0
+    attempts: int = 0
     created_at: datetime
+    not_before: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    deadline_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
-# Synchronous analysis function for safe BackgroundTasks usage
-
-def run_code_analysis(repo_id: int, commit_hash: str, db: Session):
-    """
-    Run code analysis using the AIService and persist an Analysis row.
-    """
-    from app.services.ai_service import aiservice  # lazy import to avoid circulars
-    try:
-        # Get repository
-        repo = db.query(models.Repository).filter(models.Repository.id == repo_id).first()
-        if not repo:
-            print(f"Repository {repo_id} not found")
+    @computed_field
+    @property
+    def percent_complete(self) -> Optional[float]:
+        if self.status == "completed":
+            return 100.0
+        if not self.chunks_total:
+            return None if self.status == "in_progress" else 0.0
+        return round(100.0 * self.chunks_done / self.chunks_total, 1)
+
+    @computed_field
+    @property
+    def queue_wait_seconds(self) -> Optional[float]:
+        """Time spent pending before a worker picked the analysis up (so far, if still pending)."""
+        end = self.started_at or (self.completed_at if self.status != "pending" else datetime.utcnow())
+        return round((end - self.created_at).total_seconds(), 3) if end else None
+
+    @computed_field
+    @property
+    def service_seconds(self) -> Optional[float]:
+        """Time spent running (so far, if still running)."""
+        if not self.started_at:
             return None
-
-        print(f"Starting analysis for repo {repo_id} at commit {commit_hash}...")
-
-        # TODO: Pull actual code from the repository at commit/branch
-        sample_code = """
-        def add(a, b):
-            return a + b
-
-        class Calculator:
-            def multiply(self, x, y):
-                return x * y
-        """
-        # Get code review from AIService
-        review_suggestions = aiservice.get_review_for_code(sample_code)
-
-        # Save the analysis results
-        analysis = models.Analysis(
-            repository_id=repo_id,
-            commit_hash=commit_hash,
-            status="completed",
-            results={"review": review_suggestions},
-            completed_at=datetime.utcnow()
-        )
-        db.add(analysis)
-        db.commit()
-
-        print(f"Analysis completed for repo {repo_id}")
-        return review_suggestions
-
-    except Exception as e:
-        print(f"Error during analysis for repo {repo_id}: {str(e)}")
-        try:
-            db.rollback()
-        except Exception as re:
-            print(f"Rollback failed: {re}")
-        try:
-            analysis = models.Analysis(
-                repository_id=repo_id,
-                commit_hash=commit_hash,
-                status="failed",
-                results={"error": str(e)},
-                completed_at=datetime.utcnow()
-            )
-            db.add(analysis)
-            db.commit()
-        except Exception as ie:
-            print(f"Failed to persist failed analysis record: {ie}")
-        raise
-
-
-def run_code_analysis_background(repo_id: int, commit_hash: str):
-    """Background task entrypoint: manage its own DB session."""
-    db = SessionLocal()
-    try:
-        run_code_analysis(repo_id, commit_hash, db)
-    finally:
-        db.close()
-
+        end = self.completed_at or datetime.utcnow()
+        return round((end - self.started_at).total_seconds(), 3)
 
 @router.get("/test-gemini")
 def test_gemini():
@@ -134,36 +260,366 @@ def test_gemini():
 
 
 @router.post("/trigger-sync", response_model=AnalysisSyncResponse)
-def trigger_analysis_sync(request: AnalysisRequest, db: Session = Depends(get_db)):
+def trigger_analysis_sync(
+    request: AnalysisRequest,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key", max_length=255),
+):
     """Run analysis synchronously and return the review output (for manual testing)."""
     repo = repository_service.get_repository(db, repo_id=request.repo_id)
     if not repo:
         raise HTTPException(status_code=404, detail="Repository not found")
 
-    result = run_code_analysis(request.repo_id, request.commit_hash, db)
+    # The caller is waiting on the response, so this always runs in the interactive class
+    try:
+        analysis, created = analysis_service.enqueue_analysis(
+            db, repo, request.commit_hash, idempotency_key,
+            priority=AnalysisPriority.INTERACTIVE.value, claim=True, deadline_seconds=request.deadline_seconds,
+        )
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if created:
+        result = analysis_service.run_code_analysis(analysis.id, db)
+        db.refresh(analysis)
+        if analysis.status == "cancelled":
+            raise HTTPException(
+                status_code=409,
+                detail=f"Analysis {analysis.id} was cancelled ({analysis.cancel_reason})",
+            )
+    elif analysis.status == "completed":
+        result = (analysis.results or {}).get("review")
+    else:
+        raise HTTPException(
+            status_code=409,
+            detail=f"An identical analysis ({analysis.id}) is already {analysis.status}",
+        )
     if result is None:
         raise HTTPException(status_code=500, detail="Analysis failed to produce results")
-    return {"status": "success", "repo_id": request.repo_id, "commit_hash": request.commit_hash, "review": result}
+    return {"status": "success", "repo_id": request.repo_id, "commit_hash": analysis.commit_hash, "review": result}
 
 
 @router.post("/trigger", status_code=202, response_model=AnalysisTriggerResponse)
 def trigger_analysis(
     request: AnalysisRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    response: Response,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key", max_length=255),
 ):
     """
     Trigger a new code analysis for a repository.
+
+    Triggers that duplicate a pending, running, or recently completed analysis of the same
+    commit (or repeat an Idempotency-Key) return the existing analysis instead of scheduling another;
+    an Idempotency-Key repeated with a different ref is refused with 422.
+    When the queue ahead of the requested priority class is overloaded, new work is refused with
+    429 and a Retry-After estimate.
     """
     # Verify repository exists
     repo = repository_service.get_repository(db, repo_id=request.repo_id)
     if not repo:
         raise HTTPException(status_code=404, detail="Repository not found")
 
-    # Schedule background analysis with its own DB session
-    background_tasks.add_task(run_code_analysis_background, request.repo_id, request.commit_hash)
+    try:
+        analysis, created = analysis_service.enqueue_analysis(
+            db, repo, request.commit_hash, idempotency_key,
+            priority=request.priority.value, deadline_seconds=request.deadline_seconds,
+            admission=admission_controller,
+        )
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not created:
+        response.status_code = 200
+        return {
+            "message": f"An identical analysis already exists for repository {request.repo_id}.",
+            "analysis_id": analysis.id,
+            "repo_id": request.repo_id,
+            "commit_hash": analysis.commit_hash,
+            "status": analysis.status,
+            "deduplicated": True,
+        }
+
+    # Wake the dispatcher; it picks the next job by fair share across users and repositories
+    dispatcher.notify()
+
+    return {
+        "message": f"Code analysis has been scheduled for repository {request.repo_id}.",
+        "analysis_id": analysis.id,
+        "repo_id": request.repo_id,
+        "commit_hash": analysis.commit_hash,
+        "status": analysis.status,
+    }
+
+
+@router.post("/trigger-bulk", status_code=202, response_model=BulkAnalysisResponse)
+def trigger_analysis_bulk(request: BulkAnalysisRequest, db: Session = Depends(get_db)):
+    """
+    Trigger analyses for many (repository, ref) pairs in one call, in the bulk priority class.
+
+    Repositories are validated with one query and the analyses are created with multi-row inserts.
+    Pairs naming an unknown repository, or whose ref could not be resolved within
+    ANALYSIS_BULK_RESOLVE_SECONDS, are reported in `results` without failing the rest.
+    """
+    repo_ids = {t.repo_id for t in request.targets}
+    repos = {r.id: r for r in db.query(models.Repository).filter(models.Repository.id.in_(repo_ids))}
+    valid = [t for t in request.targets if t.repo_id in repos]
+    try:
+        enqueued = analysis_service.enqueue_bulk(
+            db, [(repos[t.repo_id], t.commit_hash) for t in valid],
+            deadline_seconds=request.deadline_seconds, admission=admission_controller,
+        )
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    outcomes = iter(enqueued)
+    results = []
+    for t in request.targets:
+        if t.repo_id not in repos:
+            results.append({"repo_id": t.repo_id, "ref": t.commit_hash, "error": "Repository not found"})
+            continue
+        analysis, created = next(outcomes)
+        if analysis is None:
+            results.append({"repo_id": t.repo_id, "ref": t.commit_hash, "error": "Could not resolve the ref in time; retry later"})
+            continue
+        results.append({
+            "repo_id": t.repo_id,
+            "ref": t.commit_hash,
+            "analysis_id": analysis.id,
+            "commit_hash": analysis.commit_hash,
+            "status": analysis.status,
+            "deduplicated": not created,
+        })
+    scheduled = sum(1 for _, created in enqueued if created)
+    if scheduled:
+        dispatcher.notify()
+    return {
+        "message": f"Scheduled {scheduled} analyses for {len(repos)} repositories.",
+        "scheduled": scheduled,
+        "deduplicated": sum(1 for a, created in enqueued if a is not None and not created),
+        "failed": sum(1 for r in results if r.get("error")),
+        "results": results,
+    }
+
+
+def _snapshot_repository(db: Session, target: SnapshotTarget):
+    # The upload repository named by `target`, or None if one is to be created; validates either way
+    if target.repo_id is not None:
+        repo = repository_service.get_repository(db, repo_id=target.repo_id)
+        if not repo:
+            raise HTTPException(status_code=404, detail="Repository not found")
+        if not snapshot_service.is_upload_repository(repo):
+            raise HTTPException(status_code=422, detail="Snapshots can only be added to repositories of uploaded code")
+        return repo
+    if target.user_id is None:
+        raise HTTPException(status_code=422, detail="Either repo_id or user_id is required")
+    if db.get(models.User, target.user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return None
+
+
+def _schedule_snapshot(db: Session, response: Response, target: SnapshotTarget, repo, name: str, entries, skipped: int, size: int) -> dict:
+    known = snapshot_service.find(
+        db, snapshot_service.digest(entries), repo_id=repo.id if repo else None, user_id=target.user_id,
+    )
+    try:
+        if known is None:
+            # Refused before anything is created, so a rejected (and retried) upload leaves nothing behind
+            admission_controller.check(target.priority.value)
+        elif repo is None:
+            # The same tree uploaded again goes to the upload repository that has it, and deduplicates there
+            repo = db.get(models.Repository, known.repository_id)
+        if repo is None:
+            repo = snapshot_service.create_repository(db, target.name or name, target.user_id)
+        snapshot = snapshot_service.create(db, repo, entries)
+        analysis, created = analysis_service.enqueue_analysis(
+            db, repo, "snapshot",
+            priority=target.priority.value, deadline_seconds=target.deadline_seconds,
+            admission=admission_controller, commit_hash=snapshot.digest,
+        )
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    if created:
+        dispatcher.notify()
+    else:
+        response.status_code = 200
+    return {
+        "message": f"Code analysis has been scheduled for {snapshot.file_count} files of {name}."
+        if created else f"An identical analysis already exists for repository {repo.id}.",
+        "analysis_id": analysis.id,
+        "repo_id": repo.id,
+        "commit_hash": analysis.commit_hash,
+        "status": analysis.status,
+        "deduplicated": not created,
+        "files": snapshot.file_count,
+        "skipped": skipped,
+        "bytes": size,
+    }
+
+
+@router.post("/archives", status_code=202, response_model=ArchiveAnalysisResponse)
+def trigger_archive_analysis(request: ArchiveAnalysisRequest, response: Response, db: Session = Depends(get_db)):
+    """
+    Analyze the source files of an uploaded zip or tar archive.
+
+    The archive is extracted entry by entry into the content store and recorded as a snapshot of
+    an upload repository, whose digest serves as the analysis commit; uploading the same tree
+    again (to the same repository, or for the same user) deduplicates onto the earlier analysis. Archives over the ARCHIVE_* limits (entries,
+    expanded size, compression ratio) are refused with 422.
+    """
+    try:
+        upload = upload_service.get(db, request.upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload.status != "completed":
+        raise HTTPException(status_code=409, detail="Upload is not completed yet")
+    repo = _snapshot_repository(db, request)
+
+    try:
+        extracted = archive_service.extract(upload_service.path(upload.id), upload.filename)
+    except ArchiveRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not extracted.entries:
+        raise HTTPException(status_code=422, detail="The archive contains no reviewable source files")
+    return _schedule_snapshot(
+        db, response, request, repo, upload.filename, extracted.entries, extracted.skipped, extracted.bytes_read,
+    )
+
+
+@router.post("/snapshots", status_code=202, response_model=ArchiveAnalysisResponse)
+def trigger_snapshot_analysis(request: SnapshotAnalysisRequest, response: Response, db: Session = Depends(get_db)):
+    """
+    Analyze a project assembled from blobs already in the content store (hash-first upload).
+
+    Send the manifest to /files/blobs/missing first and PUT the blobs it lists; if some are
+    still missing this answers 409 with their SHAs in `detail.missing`. Files that are not
+    reviewed are left out of the snapshot and counted in `skipped`.
+    """
+    repo = _snapshot_repository(db, request)
+    try:
+        entries, ignored = snapshot_service.normalize_manifest([(f.path, f.sha, f.size) for f in request.files])
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not entries:
+        raise HTTPException(status_code=422, detail="The manifest contains no reviewable source files")
+    missing = content_store.missing(sha for _, sha, _ in entries)
+    if missing:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": f"{len(missing)} blobs have not been uploaded", "missing": sorted(missing)},
+        )
+    name = request.name or (repo.name if repo else "snapshot")
+    return _schedule_snapshot(
+        db, response, request, repo, name, entries, len(ignored), sum(size for _, _, size in entries),
+    )
+
+
+@router.post("/analyze-code", response_model=CodeAnalysisResponse)
+def analyze_code(request: CodeAnalysisRequest):
+    """Review an editor buffer directly, without a repository. Runs in the interactive class."""
+    from app.services.ai_service import aiservice  # local import
+    started = datetime.utcnow()
+    suggestions = aiservice.get_review_for_code(request.code, priority=AnalysisPriority.INTERACTIVE.value)
+    issues = [
+        {
+            "line": s.get("line_number") or 1,
+            "severity": s.get("severity") or "info",
+            "message": s.get("comment") or "",
+        }
+        for s in suggestions
+    ]
+    return {
+        "status": "completed",
+        "language": request.language,
+        "filename": request.filename,
+        "issues": issues,
+        "metrics": {"lines_of_code": request.code.count("\n") + 1},
+        "created_at": started,
+        "completed_at": datetime.utcnow(),
+    }
+
+
+@router.post("/diff", response_model=DiffAnalysisResponse)
+def analyze_diff(request: DiffAnalysisRequest, db: Session = Depends(get_db)):
+    """
+    Review only what a unified diff changed, in the interactive class.
+
+    Each change is reviewed within its enclosing function (or class member), found by applying
+    the diff to the base file from `files` or from `repo_id` at `base_ref`; without either, only
+    the diff's own context lines are reviewed. Line numbers in the findings are new-file lines.
+    """
+    repo = None
+    if request.repo_id is not None:
+        repo = repository_service.get_repository(db, repo_id=request.repo_id)
+        if not repo:
+            raise HTTPException(status_code=404, detail="Repository not found")
+    started = datetime.utcnow()
+    try:
+        review = diff_review_service.review(db, request.diff, request.files, repo, request.base_ref)
+    except DiffRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {
+        "status": "completed",
+        "files": review.files,
+        "skipped": review.skipped,
+        "regions": [
+            {"path": c.path, "start_line": c.start_line, "end_line": c.end_line, "kind": c.kind, "name": c.name}
+            for c in review.regions
+        ],
+        "regions_reviewed": review.reviewed,
+        "issues": [
+            {
+                "path": s["file_path"],
+                "line": s["line_number"],
+                "severity": s.get("severity") or "info",
+                "message": s.get("comment") or "",
+                "category": s.get("category") or "general",
+                "changed": s["line_number"] in review.changed.get(s["file_path"], ()),
+            }
+            for s in review.suggestions
+        ],
+        "created_at": started,
+        "completed_at": datetime.utcnow(),
+    }
+
+
+@router.post("/live-sessions", status_code=201, response_model=LiveSessionResponse)
+def open_live_session(request: LiveSessionRequest, db: Session = Depends(get_db)):
+    """
+    Start live analysis of an editor buffer. The response lists every diagnostic as `added`;
+    later edits answer with changes only. Sessions live in the API process that opened them,
+    so clients should recreate theirs when an update returns 404.
+    """
+    session, diff = live_sessions.open(db, request.code, request.language, request.filename)
+    return {"session_id": session.id, "version": session.version, **diff}
+
 
-    return {"message": f"Code analysis has been scheduled for repository {request.repo_id}.", "repo_id": request.repo_id, "commit_hash": request.commit_hash}
+@router.post("/live-sessions/{session_id}/edits", response_model=LiveSessionResponse)
+def apply_live_edits(request: LiveEditsRequest, session_id: str = Path(max_length=64), db: Session = Depends(get_db)):
+    """
+    Apply a batch of buffer edits, re-review only the chunks they changed and return the diff
+    of the diagnostics. Edits based on an older version than the session's are refused with 409.
+    """
+    try:
+        session, diff = live_sessions.apply_edits(
+            db, session_id, request.base_version, [edit.model_dump() for edit in request.edits],
+        )
+    except LiveSessionNotFound:
+        raise HTTPException(status_code=404, detail="Live session not found")
+    except LiveSessionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except InvalidEdit as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"session_id": session.id, "version": session.version, **diff}
+
+
+@router.delete("/live-sessions/{session_id}", status_code=204)
+def close_live_session(session_id: str = Path(max_length=64)):
+    try:
+        live_sessions.close(session_id)
+    except LiveSessionNotFound:
+        raise HTTPException(status_code=404, detail="Live session not found")
+    return None
 
 
 @router.get("/analyses/{analysis_id}", response_model=AnalysisRead)
@@ -174,6 +630,18 @@ def get_analysis_by_id(analysis_id: int = Path(gt=0), db: Session = Depends(get_
     return analysis
 
 
+@router.post("/analyses/{analysis_id}/cancel", response_model=AnalysisRead)
+def cancel_analysis(analysis_id: int = Path(gt=0), db: Session = Depends(get_db)):
+    """Cancel a pending or running analysis; outstanding LLM calls are abandoned."""
+    analysis = db.query(models.Analysis).filter(models.Analysis.id == analysis_id).first()
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    if not analysis_service.cancel_analysis(db, analysis_id, reason="user"):
+        raise HTTPException(status_code=409, detail=f"Analysis is already {analysis.status}")
+    db.refresh(analysis)
+    return analysis
+
+
 @router.get("/repositories/{repo_id}/analyses", response_model=List[AnalysisRead])
 def list_analyses_by_repo(
     repo_id: int = Path(gt=0),
@@ -0,0 +1,200 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, Path, Query, Request, Response, UploadFile
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+
+from app.api.deps import get_db
+from app.core.config import settings
+from app.services.content_store import BlobRejected, content_store
+from app.services.snapshot_service import snapshot_service
+from app.services.upload_service import UploadConflict, UploadNotFound, UploadRejected, upload_service
+from app.utils.helpers import read_text
+
+router = APIRouter()
+
+class UploadInitiateRequest(BaseModel):
+    filename: str = Field(min_length=1, max_length=255)
+    size: int = Field(ge=0, description="Total size of the file in bytes")
+    sha256: Optional[str] = Field(default=None, description="Hex SHA-256 of the whole file, checked on completion")
+    language: Optional[str] = Field(default=None, max_length=32)
+
+class UploadRead(BaseModel):
+    upload_id: str
+    filename: str
+    language: Optional[str] = None
+    size: int
+    received: int
+    parts: int
+    status: str
+    sha256: Optional[str] = None
+    part_size: int = settings.UPLOAD_PART_BYTES
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+class UploadFileResponse(UploadRead):
+    content: Optional[str] = None
+
+class ManifestFile(BaseModel):
+    path: str = Field(min_length=1, max_length=1024)
+    sha: str = Field(min_length=40, max_length=40, description="Git blob SHA-1 of the content (`git hash-object`)")
+    size: int = Field(ge=0)
+
+class BlobManifestRequest(BaseModel):
+    files: List[ManifestFile] = Field(min_length=1, max_length=settings.SNAPSHOT_MAX_FILES)
+
+class BlobManifestResponse(BaseModel):
+    missing: List[str]  # blob SHAs to PUT before the snapshot can be analyzed
+    ignored: List[str]  # paths that are not reviewed and need not be sent
+
+class BlobRead(BaseModel):
+    sha: str
+    stored: bool  # False when the blob was already present
+
+def _read(upload) -> dict:
+    return {
+        "upload_id": upload.id,
+        "filename": upload.filename,
+        "language": upload.language,
+        "size": upload.size,
+        "received": upload.received,
+        "parts": upload.parts,
+        "status": upload.status,
+        "sha256": upload.digest or upload.sha256,
+        "created_at": upload.created_at,
+        "completed_at": upload.completed_at,
+    }
+
+def _conflict(e: UploadConflict) -> HTTPException:
+    # The header tells a resuming client where to continue from
+    return HTTPException(status_code=409, detail=str(e), headers={"Upload-Offset": str(e.received)})
+
+
+@router.post("/uploads", status_code=201, response_model=UploadRead)
+def initiate_upload(request: UploadInitiateRequest, db: Session = Depends(get_db)):
+    """
+    Start a resumable upload. Send the file in parts of about `part_size` bytes with
+    PUT /files/uploads/{upload_id}/parts?offset=..., then POST .../complete.
+    """
+    try:
+        upload = upload_service.initiate(db, request.filename, request.size, request.sha256, request.language)
+    except UploadRejected as e:
+        raise HTTPException(status_code=413 if request.size > settings.UPLOAD_MAX_BYTES else 422, detail=str(e))
+    return _read(upload)
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadRead)
+def get_upload(upload_id: str = Path(max_length=32), db: Session = Depends(get_db)):
+    """Status of an upload; `received` is the offset to resume from."""
+    try:
+        return _read(upload_service.get(db, upload_id))
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+@router.put("/uploads/{upload_id}/parts", response_model=UploadRead)
+async def upload_part(
+    request: Request,
+    upload_id: str = Path(max_length=32),
+    offset: int = Query(ge=0, description="Byte offset of this part; must equal the upload's `received`"),
+    checksum: str = Header(alias="X-Checksum-SHA256", description="Hex SHA-256 of this part"),
+):
+    """
+    Upload one part as the raw request body. The part is streamed to disk and only counts once
+    its checksum matched; on 409 continue from the offset in the Upload-Offset header.
+    """
+    try:
+        upload = await upload_service.receive_part(upload_id, offset, request.stream(), checksum)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadConflict as e:
+        raise _conflict(e)
+    except UploadRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return _read(upload)
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=UploadRead)
+def complete_upload(upload_id: str = Path(max_length=32), db: Session = Depends(get_db)):
+    """Finish an upload after its last part; fails if bytes are missing or the file's SHA-256 differs."""
+    try:
+        return _read(upload_service.complete(db, upload_id))
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadConflict as e:
+        raise _conflict(e)
+    except UploadRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.delete("/uploads/{upload_id}", status_code=204)
+def abort_upload(upload_id: str = Path(max_length=32), db: Session = Depends(get_db)):
+    try:
+        upload_service.abort(db, upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return None
+
+
+@router.post("/upload", status_code=201, response_model=UploadFileResponse)
+def upload_file(
+    file: UploadFile = File(...),
+    language: Optional[str] = Form(default=None, max_length=32),
+    db: Session = Depends(get_db),
+):
+    """
+    Upload a small file in one multipart request, as the editor's file picker does. The content
+    of reviewable text files is returned for the editor; large files should use /files/uploads.
+    """
+    upload = upload_service.initiate(db, file.filename or "upload", settings.UPLOAD_MAX_BYTES, language=language)
+    try:
+        upload = upload_service.receive_file(db, upload, file.file)
+    except UploadRejected as e:
+        upload_service.abort(db, upload.id)
+        raise HTTPException(status_code=413, detail=str(e))
+    content = read_text(upload_service.path(upload.id)) if upload.size <= settings.ANALYSIS_MAX_FILE_BYTES else None
+    return {**_read(upload), "content": content}
+
+
+@router.post("/blobs/missing", response_model=BlobManifestResponse)
+def missing_blobs(request: BlobManifestRequest):
+    """
+    First phase of a hash-first upload: given a manifest of a project's files, answer which
+    blobs the server lacks. PUT only those to /files/blobs/{sha}, then POST the same manifest to
+    /analysis/snapshots.
+    """
+    try:
+        entries, ignored = snapshot_service.normalize_manifest([(f.path, f.sha, f.size) for f in request.files])
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"missing": sorted(content_store.missing(sha for _, sha, _ in entries)), "ignored": ignored}
+
+
+@router.put("/blobs/{sha}", status_code=201, response_model=BlobRead)
+async def upload_blob(
+    request: Request,
+    response: Response,
+    sha: str = Path(pattern=r"^[0-9a-f]{40}$", description="Git blob SHA-1 of the body"),
+    content_length: Optional[int] = Header(default=None, alias="Content-Length", ge=0),
+):
+    """Store one file's raw content as the request body; it is kept only if it hashes to `sha`."""
+    if content_store.has(sha):
+        response.status_code = 200
+        return {"sha": sha, "stored": False}
+    if content_length is None:
+        raise HTTPException(status_code=411, detail="Content-Length is required")
+    if content_length > settings.ANALYSIS_MAX_FILE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Files over {settings.ANALYSIS_MAX_FILE_BYTES} bytes are not reviewed")
+    writer = content_store.writer(content_length, expected_sha=sha)
+    try:
+        async for piece in request.stream():
+            writer.write(piece)
+        writer.commit()
+    except BlobRejected as e:
+        writer.discard()
+        raise HTTPException(status_code=422, detail=str(e))
+    except BaseException:
+        writer.discard()
+        raise
+    return {"sha": sha, "stored": True}
@@ -0,0 +1,114 @@
+# app/api/v1/endpoints/webhooks.py
+
+import hashlib
+import hmac
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.config import settings
+from app.core.database import get_db
+from app.services.analysis_service import analysis_service
+from app.utils.helpers import repository_url_variants
+
+router = APIRouter()
+
+_NULL_SHA_RE = re.compile(r"^0+$")
+
+
+class PushRepository(BaseModel):
+    # GitHub, Gitea and GitLab name the remote differently; any of them may match Repository.url
+    model_config = ConfigDict(extra="allow")
+
+    url: Optional[str] = None
+    clone_url: Optional[str] = None
+    html_url: Optional[str] = None
+    ssh_url: Optional[str] = None
+    git_url: Optional[str] = None
+    git_http_url: Optional[str] = None
+    git_ssh_url: Optional[str] = None
+
+    def urls(self) -> List[str]:
+        return [
+            u for u in (
+                self.url, self.clone_url, self.html_url, self.ssh_url,
+                self.git_url, self.git_http_url, self.git_ssh_url,
+            ) if u
+        ]
+
+
+class PushEvent(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    ref: str = Field(max_length=255, description="Pushed ref, e.g. refs/heads/main")
+    after: str = Field(pattern=r"^[0-9a-fA-F]{40}$", description="Commit the ref points at after the push")
+    repository: Optional[PushRepository] = None
+    project: Optional[PushRepository] = None  # GitLab
+    repository_url: Optional[str] = Field(default=None, max_length=1024, description="Generic senders may pass the URL directly")
+
+
+class PushResult(BaseModel):
+    repo_id: int
+    analysis_id: int
+    commit_hash: str
+    outcome: str  # scheduled, coalesced, deduplicated
+    not_before: Optional[datetime] = None
+
+
+class PushEventResponse(BaseModel):
+    status: str  # accepted, ignored
+    branch: Optional[str] = None
+    results: List[PushResult] = []
+
+
+async def verify_signature(request: Request, x_hub_signature_256: Optional[str] = Header(default=None)):
+    """Check the sender's HMAC of the raw body; without WEBHOOK_SECRET only WEBHOOK_ALLOW_UNSIGNED lets events in."""
+    if not settings.WEBHOOK_SECRET:
+        if settings.WEBHOOK_ALLOW_UNSIGNED:
+            return
+        raise HTTPException(status_code=403, detail="Push webhooks are disabled until WEBHOOK_SECRET is configured")
+    expected = "sha256=" + hmac.new(settings.WEBHOOK_SECRET.encode("utf-8"), await request.body(), hashlib.sha256).hexdigest()
+    if not x_hub_signature_256 or not hmac.compare_digest(expected, x_hub_signature_256):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+
+@router.post("/push", status_code=202, response_model=PushEventResponse, dependencies=[Depends(verify_signature)])
+def receive_push(event: PushEvent, db: Session = Depends(get_db)):
+    """
+    Schedule analyses for a git push event.
+
+    The event is matched to every Repository registered with the pushed remote's URL. Pushes to
+    the same branch are debounced (see AnalysisService.enqueue_push), so a burst of pushes
+    produces one analysis of the newest head and in-flight analyses of older heads are cancelled.
+    Tag pushes and branch deletions are ignored.
+    """
+    if not event.ref.startswith("refs/heads/") or _NULL_SHA_RE.match(event.after):
+        return {"status": "ignored"}
+    branch = event.ref[len("refs/heads/"):]
+
+    urls = ([event.repository_url] if event.repository_url else []) \
+        + (event.repository.urls() if event.repository else []) \
+        + (event.project.urls() if event.project else [])
+    if not urls:
+        raise HTTPException(status_code=422, detail="Push event does not name a repository URL")
+    variants = sorted({v for u in urls for v in repository_url_variants(u)})
+    repos = db.query(models.Repository).filter(models.Repository.url.in_(variants)).order_by(models.Repository.id).all()
+    if not repos:
+        raise HTTPException(status_code=404, detail="No repository is registered for this URL")
+
+    results = []
+    for repo in repos:
+        analysis, outcome = analysis_service.enqueue_push(db, repo, branch, event.after.lower())
+        results.append({
+            "repo_id": repo.id,
+            "analysis_id": analysis.id,
+            "commit_hash": analysis.commit_hash,
+            "outcome": outcome,
+            "not_before": analysis.not_before,
+        })
+    return {"status": "accepted", "branch": branch, "results": results}
@@ -1,5 +1,9 @@
+import os
+import tempfile
+
 from pydantic_settings import BaseSettings
 from pydantic import AnyUrl, Field
+from typing import Dict
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "CodeNova Intelligent Code Review Bot"
@@ -14,6 +18,166 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-super-secret-key-change-this-in-production-min-32-chars"
     ENVIRONMENT: str = "development"
 
+    # Analysis jobs
+    # Identical (repo, commit, prompt version, model) triggers reuse a completed analysis this recent
+    ANALYSIS_DEDUP_WINDOW_MINUTES: int = 60
+    # Before resolving a branch on the remote, a trigger reuses a pending or running analysis of the
+    # same ref triggered this recently, even if the branch has moved since (0, the default, always resolves)
+    ANALYSIS_REF_DEDUP_SECONDS: int = 0
+    GIT_COMMAND_TIMEOUT_SECONDS: int = 15
+    GIT_FETCH_TIMEOUT_SECONDS: int = 300
+    GIT_RESOLVE_CONCURRENCY: int = 16  # Parallel `git ls-remote` calls when resolving refs of a bulk trigger
+    ANALYSIS_MAX_FILE_BYTES: int = 1_000_000  # Larger files are skipped (usually generated or minified)
+    ANALYSIS_MAX_CHUNK_LINES: int = 200
+    # CPU-bound parsing/chunking runs in a process pool (forkserver, modules preloaded) when a
+    # checkout has at least PARSE_POOL_MIN_BYTES of source. Files are sent in batches of about
+    # PARSE_POOL_BATCH_BYTES; workers are replaced after PARSE_POOL_MAX_TASKS_PER_CHILD batches.
+    PARSE_POOL_ENABLED: bool = True
+    PARSE_POOL_WORKERS: int = 0  # 0 means one per CPU
+    PARSE_POOL_MAX_TASKS_PER_CHILD: int = 200
+    PARSE_POOL_BATCH_BYTES: int = 1_000_000
+    PARSE_POOL_MIN_BYTES: int = 256_000
+    # Per-blob parse artifacts (chunk boundaries, ...) are cached in a local SQLite file keyed by
+    # git blob SHA and PARSER_VERSION, evicted least-recently-used above PARSE_CACHE_MAX_BYTES.
+    # An empty path disables the cache.
+    PARSE_CACHE_PATH: str = os.path.join(tempfile.gettempdir(), "codenova", "parse-cache.sqlite3")
+    PARSE_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    # Each chunk's prompt includes the signatures/docstrings of up to this many definitions it
+    # references elsewhere in the repository (0 disables), within this many characters
+    ANALYSIS_CONTEXT_MAX_SYMBOLS: int = 12
+    ANALYSIS_CONTEXT_MAX_CHARS: int = 4000
+    # Optional: review files in import-dependency order (leaf modules first, import cycles reviewed
+    # together) and give each chunk short cached summaries of the repository modules its file imports
+    ANALYSIS_DEPENDENCY_ORDER: bool = False
+    ANALYSIS_MODULE_SUMMARY_MAX_CHARS: int = 1200  # roughly 300 tokens
+    ANALYSIS_MODULE_SUMMARY_SOURCE_CHARS: int = 24_000  # module source sent to the model to summarize
+    ANALYSIS_CONTEXT_MAX_SUMMARIES: int = 4
+    # Clone detection: chunks are fingerprinted by winnowing k-grams of normalized tokens and
+    # indexed across repositories. Chunks sharing at least CLONE_MIN_SIMILARITY of their
+    # fingerprints are reported as clones and, when the same length, reviewed once. Chunks with
+    # fewer than CLONE_MIN_FINGERPRINTS take no part; fingerprints found in more than
+    # CLONE_COMMON_FINGERPRINT_LIMIT regions are treated as boilerplate.
+    CLONE_DETECTION_ENABLED: bool = True
+    CLONE_KGRAM_TOKENS: int = 25
+    CLONE_WINDOW: int = 16
+    CLONE_MIN_SIMILARITY: float = 0.9
+    CLONE_MIN_FINGERPRINTS: int = 8
+    CLONE_COMMON_FINGERPRINT_LIMIT: int = 50
+    # Live analysis of editor buffers: sessions are kept in the API process's memory, expire after
+    # LIVE_SESSION_TTL_SECONDS without an update and are evicted least-recently-used beyond LIVE_SESSION_MAX
+    LIVE_SESSION_TTL_SECONDS: int = 900
+    LIVE_SESSION_MAX: int = 500
+    LIVE_SESSION_MAX_CHARS: int = 200_000
+    LIVE_SESSION_MAX_PARALLEL_REVIEWS: int = 4  # chunks of one update reviewed at once
+    # Resumable uploads are spooled to disk part by part (never held in memory) and verified by
+    # SHA-256 per part and as a whole. Uploads are deleted after UPLOAD_TTL_SECONDS untouched.
+    UPLOAD_SPOOL_DIR: str = os.path.join(tempfile.gettempdir(), "codenova", "uploads")
+    UPLOAD_MAX_BYTES: int = 512 * 1024 * 1024
+    UPLOAD_PART_BYTES: int = 8 * 1024 * 1024  # suggested part size
+    UPLOAD_MAX_PART_BYTES: int = 64 * 1024 * 1024
+    UPLOAD_TTL_SECONDS: int = 24 * 3600
+    # Files of uploaded snapshots (archives, manifests), stored once per git blob SHA
+    CONTENT_STORE_DIR: str = os.path.join(tempfile.gettempdir(), "codenova", "content")
+    # Blobs no snapshot lists are deleted once unused (not written or asked about) for
+    # CONTENT_STORE_TTL_SECONDS, by a sweep each API process runs every CONTENT_STORE_GC_INTERVAL_SECONDS
+    CONTENT_STORE_TTL_SECONDS: int = 7 * 24 * 3600
+    CONTENT_STORE_GC_INTERVAL_SECONDS: int = 3600
+    SNAPSHOT_MAX_FILES: int = 50_000  # files per manifest sent for hash-first upload
+    # Archive limits against zip bombs: entries, total uncompressed bytes, and how many times
+    # larger than its compressed form an entry (zip) or the stream read so far (tar) may be
+    ARCHIVE_MAX_ENTRIES: int = 50_000
+    ARCHIVE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    ARCHIVE_MAX_RATIO: int = 100
+    # POST /analysis/diff: diffs up to DIFF_MAX_CHARS; changed declarations are reviewed whole up to
+    # DIFF_MAX_CHUNK_LINES (larger ones per member), changed module-level lines with DIFF_CONTEXT_LINES around them
+    DIFF_MAX_CHARS: int = 2_000_000
+    DIFF_MAX_CHUNK_LINES: int = 80
+    DIFF_CONTEXT_LINES: int = 10
+    DIFF_MAX_PARALLEL_REVIEWS: int = 4
+    # Progress counters are written to the analysis row at most this often
+    ANALYSIS_PROGRESS_FLUSH_SECONDS: float = 2.0
+
+    # Job dispatcher (runs in every API process unless disabled; see app/worker.py for dedicated workers)
+    ANALYSIS_DISPATCHER_ENABLED: bool = True
+    ANALYSIS_WORKERS: int = 4
+    ANALYSIS_POLL_INTERVAL_SECONDS: float = 2.0
+    # Fair-share weights per UserRole: a tenant with weight 2 is dispatched twice as often as weight 1
+    ANALYSIS_ROLE_WEIGHTS: Dict[str, float] = {"admin": 4.0, "developer": 2.0, "reviewer": 2.0, "guest": 1.0}
+    # Max analyses running at once per user (by role) and per repository, across the whole fleet
+    ANALYSIS_ROLE_MAX_RUNNING: Dict[str, int] = {"admin": 8, "developer": 4, "reviewer": 4, "guest": 2}
+    ANALYSIS_MAX_RUNNING_PER_REPO: int = 1
+    # Interactive analyses skip the caps above, but no user runs more than this many of them at once
+    ANALYSIS_INTERACTIVE_MAX_RUNNING_PER_USER: int = 2
+    # Worker threads reserved for a priority class; they also serve higher classes. The rest serve any class.
+    ANALYSIS_RESERVED_WORKERS: Dict[str, int] = {"interactive": 1, "normal": 1}
+    # Analyses still unfinished this long after being triggered are cancelled (clients may ask for less)
+    ANALYSIS_DEFAULT_DEADLINE_SECONDS: int = 3600
+    # Running analyses heartbeat this often; one without a heartbeat for ANALYSIS_LEASE_SECONDS is
+    # requeued (resuming from its reviewed chunks) until it has been tried ANALYSIS_MAX_ATTEMPTS times
+    ANALYSIS_HEARTBEAT_SECONDS: float = 30.0
+    ANALYSIS_LEASE_SECONDS: int = 300
+    ANALYSIS_MAX_ATTEMPTS: int = 3
+    # Analyses whose source files add up to at least two shards' worth are split into shards that
+    # idle workers help with; "bytes" balances shard sizes, "directory" keeps top-level directories together
+    ANALYSIS_SHARDING_ENABLED: bool = True
+    ANALYSIS_SHARD_TARGET_BYTES: int = 2_000_000
+    ANALYSIS_MAX_SHARDS: int = 32
+    ANALYSIS_SHARD_STRATEGY: str = "bytes"
+    # A worker helping with shards keeps its checkout of the commit for further shards until unused this long
+    ANALYSIS_SHARD_CHECKOUT_IDLE_SECONDS: int = 120
+
+    # Admission control on /analysis/trigger: reject with 429 when the work already queued at or
+    # above the requested priority class exceeds these limits (classes without a limit are unbounded)
+    ANALYSIS_ADMISSION_MAX_QUEUE_DEPTH: Dict[str, int] = {"interactive": 100, "normal": 2000, "bulk": 20000}
+    ANALYSIS_ADMISSION_MAX_QUEUE_AGE_SECONDS: Dict[str, int] = {"interactive": 60, "normal": 1800, "bulk": 21600}
+    LLM_ADMISSION_MAX_WAITING: int = 64  # LLM calls waiting for a limiter slot in this process
+    ANALYSIS_ADMISSION_RATE_WINDOW_SECONDS: int = 300  # Drain rate behind Retry-After is measured over this window
+    ANALYSIS_ADMISSION_DEFAULT_RETRY_SECONDS: int = 30  # Retry-After when the drain rate is unknown
+    ANALYSIS_ADMISSION_MAX_RETRY_AFTER_SECONDS: int = 3600
+    ANALYSIS_ADMISSION_STATS_TTL_SECONDS: float = 1.0
+    ANALYSIS_BULK_MAX_ITEMS: int = 5000  # (repository, ref) pairs accepted by one /analysis/trigger-bulk call
+    # Refs of a bulk trigger are resolved for at most this long; pairs of repositories not resolved by
+    # then are reported as failed instead of holding up the request
+    ANALYSIS_BULK_RESOLVE_SECONDS: float = 20.0
+
+    # Push webhooks: an analysis waits this long for further pushes to the same branch, which
+    # replace its head and restart the wait, up to the max delay after the first push
+    ANALYSIS_PUSH_DEBOUNCE_SECONDS: int = 30
+    ANALYSIS_PUSH_DEBOUNCE_MAX_SECONDS: int = 300
+    # Push events must carry an X-Hub-Signature-256 HMAC of the body made with this secret. Without a
+    # secret they are refused, unless WEBHOOK_ALLOW_UNSIGNED is set (e.g. for local development)
+    WEBHOOK_SECRET: str = ""
+    WEBHOOK_ALLOW_UNSIGNED: bool = False
+
+    # Periodic re-analysis of repositories whose latest analysis is older than the max age or was
+    # made with another prompt version or model. Every process runs the scheduler; a Postgres
+    # advisory lock lets only one of them (the leader) schedule. New jobs are spread over the jitter.
+    ANALYSIS_RESCAN_ENABLED: bool = True
+    ANALYSIS_RESCAN_INTERVAL_SECONDS: int = 300
+    ANALYSIS_RESCAN_MAX_AGE_SECONDS: int = 7 * 24 * 3600
+    ANALYSIS_RESCAN_JITTER_SECONDS: int = 1800
+    ANALYSIS_RESCAN_BATCH_SIZE: int = 500  # Repositories scheduled per scheduler run at most
+
+    # LLM concurrency limiter shared by every analysis in the process
+    LLM_MAX_CONCURRENCY: int = 8
+    # Slots only the given priority class may use; bulk work soaks up whatever is left unreserved
+    LLM_RESERVED_SLOTS: Dict[str, int] = {"interactive": 2, "normal": 1}
+    # A single review call is abandoned after this long
+    LLM_CALL_TIMEOUT_SECONDS: float = 120.0
+    # "gemini", or "stub" for a local deterministic stand-in (development, load tests; see StubProvider)
+    LLM_PROVIDER: str = "gemini"
+    LLM_STUB_MALFORMED_RATIO: float = 0.0  # share of stub responses cut off mid-array
+    # Structured output: review calls pass a response schema and the JSON MIME type to the provider and
+    # validate the answer; a chunk whose answer fails validation is asked again up to this many times
+    LLM_STRUCTURED_OUTPUT: bool = False
+    LLM_STRUCTURED_MAX_RETRIES: int = 1
+    # Cassette: "record" appends every LLM call (prompt hash, response, latency) to LLM_CASSETTE_PATH,
+    # "replay" answers calls from it instead of the provider, taking the recorded latency times
+    # LLM_CASSETTE_LATENCY_SCALE (0 answers at once) and caching reviews under "replay:<model>"; "" disables it
+    LLM_CASSETTE_MODE: str = ""
+    LLM_CASSETTE_PATH: str = os.path.join(tempfile.gettempdir(), "codenova", "llm-cassette.jsonl")
+    LLM_CASSETTE_LATENCY_SCALE: float = 1.0
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -2,8 +2,14 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.api.v1.router import api_router
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.dispatcher import dispatcher
+from app.services.parse_pool import parse_pool
+from app.services.scheduler import stale_analysis_scheduler
+from app.services.snapshot_service import snapshot_service
 
 # --- DB startup (dev convenience) ---
 from app.core.database import Base, engine
@@ -33,6 +39,41 @@ async def startup_create_tables():
         # Avoid crashing the app; log and continue
         print(f"DB startup create_all skipped/failed: {e}")
 
+# Run queued analyses in this process unless dedicated workers (app/worker.py) handle them
+@app.on_event("startup")
+async def startup_dispatcher():
+    if settings.ANALYSIS_DISPATCHER_ENABLED:
+        dispatcher.start()
+    else:
+        dispatcher.start_heartbeat()  # inline /trigger-sync runs still need their lease kept alive
+
+@app.on_event("shutdown")
+async def shutdown_dispatcher():
+    dispatcher.stop()
+
+# Every process competes for the scheduler lock; only the leader queues re-analyses
+@app.on_event("startup")
+async def startup_scheduler():
+    if settings.ANALYSIS_RESCAN_ENABLED:
+        stale_analysis_scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown_scheduler():
+    stale_analysis_scheduler.stop()
+
+# Uploaded blobs land in this process's content store; sweep out the ones no snapshot uses
+@app.on_event("startup")
+async def startup_content_store_gc():
+    snapshot_service.start_gc()
+
+@app.on_event("shutdown")
+async def shutdown_content_store_gc():
+    snapshot_service.stop_gc()
+
+@app.on_event("shutdown")
+async def shutdown_parse_pool():
+    parse_pool.shutdown()
+
 # Mount the API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -40,6 +81,10 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 def read_root():
     return {"message": f"Welcome to {settings.PROJECT_NAME}"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    return metrics.render()
+
 @app.get("/test-cors")
 def test_cors():
     return {"message": "CORS test successful", "timestamp": "2024-01-01"}
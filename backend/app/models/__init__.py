@@ -1,12 +1,22 @@
 from .repository import Repository
-from .analysis import Analysis
+from .analysis import Analysis, AnalysisPriority, AnalysisShard
+from .chunk_review import ChunkReview
+from .clone_fingerprint import CloneFingerprint
+from .upload import Upload
+from .snapshot import Snapshot
 from .users import User
 from .review import Review, ReviewSuggestion, Feedback, SeverityLevel
 
-# Enables: from app.models import Repository, Analysis, User, Review, ReviewSuggestion, Feedback, SeverityLevel
+# Enables: from app.models import Repository, Analysis, AnalysisPriority, AnalysisShard, ChunkReview, CloneFingerprint, Upload, Snapshot, User, Review, ReviewSuggestion, Feedback, SeverityLevel
 __all__ = [
     "Repository",
     "Analysis",
+    "AnalysisPriority",
+    "AnalysisShard",
+    "ChunkReview",
+    "CloneFingerprint",
+    "Upload",
+    "Snapshot",
     "User",
     "Review",
     "ReviewSuggestion",
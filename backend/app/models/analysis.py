@@ -1,18 +1,82 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 import datetime
+from enum import Enum as PyEnum
+
+class AnalysisPriority(str, PyEnum):
+    # Ordered from highest to lowest priority
+    INTERACTIVE = "interactive"
+    NORMAL = "normal"
+    BULK = "bulk"
 
 class Analysis(Base):
     __tablename__ = "analyses"
+    __table_args__ = (
+        # A client-supplied Idempotency-Key maps to exactly one analysis per repository
+        UniqueConstraint("repository_id", "idempotency_key", name="uq_analyses_repo_idempotency_key"),
+        # The dispatcher scans pending/in_progress rows on every poll
+        Index("ix_analyses_status_created_at", "status", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     repository_id = Column(Integer, ForeignKey("repositories.id"), nullable=False)
-    commit_hash = Column(String(64), nullable=False)
-    status = Column(String(20), default="pending")  # pending, in_progress, completed, failed
+    commit_hash = Column(String(64), nullable=False)  # Resolved commit (falls back to the ref if unresolvable)
+    ref = Column(String(255), nullable=True)  # Branch name or commit as requested by the client
+    status = Column(String(20), default="pending")  # pending, in_progress, completed, failed, cancelled
+    cancel_reason = Column(String(32), nullable=True)  # user, superseded, deadline_exceeded
+    priority = Column(String(16), default=AnalysisPriority.NORMAL.value, nullable=False)  # AnalysisPriority value
+    prompt_version = Column(String(32), nullable=True)
+    model_name = Column(String(128), nullable=True)
+    idempotency_key = Column(String(255), nullable=True)
+    # Hash of (repository, commit, prompt version, model); unique while the analysis can be reused.
+    # Cleared once the analysis fails or falls outside the dedup window so a fresh run can claim it.
+    dedup_key = Column(String(64), nullable=True, unique=True)
     results = Column(JSON, nullable=True)  # Store the full analysis results
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Progress counters, flushed in batches while the analysis runs
+    files_total = Column(Integer, nullable=True)
+    files_done = Column(Integer, default=0, nullable=False)
+    chunks_total = Column(Integer, nullable=True)
+    chunks_done = Column(Integer, default=0, nullable=False)
+    tokens_used = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)  # Queued
+    not_before = Column(DateTime, nullable=True)  # Not dispatched before this time (push debounce)
+    started_at = Column(DateTime, nullable=True)  # Picked up by a worker
+    deadline_at = Column(DateTime, nullable=True)  # Cancelled if not finished by then
     completed_at = Column(DateTime, nullable=True)
+    # Refreshed by the process running the analysis; a stale heartbeat means its worker died
+    heartbeat_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)  # Times the analysis was requeued after a lost worker
 
     # Relationships
     repository = relationship("Repository", back_populates="analyses")
+
+class AnalysisShard(Base):
+    """
+    A slice of a large analysis's files, reviewed independently so several workers can share it.
+
+    Shards are claimed with SELECT ... FOR UPDATE SKIP LOCKED, by the analysis's coordinator and by
+    any idle worker, and merged into the parent analysis once all of them completed.
+    """
+    __tablename__ = "analysis_shards"
+    __table_args__ = (
+        UniqueConstraint("analysis_id", "index", name="uq_analysis_shards_analysis_index"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    analysis_id = Column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"), nullable=False)
+    index = Column(Integer, nullable=False)
+    paths = Column(JSON, nullable=False)  # Relative paths of the files in this shard
+    bytes = Column(Integer, nullable=False)
+    status = Column(String(20), default="pending", nullable=False)  # pending, in_progress, completed, failed
+    worker = Column(String(255), nullable=True)  # host:pid of the process running it
+    attempts = Column(Integer, default=0, nullable=False)  # Bumped on every claim; fences off earlier claimants
+    files_done = Column(Integer, default=0, nullable=False)
+    chunks_total = Column(Integer, nullable=True)
+    chunks_done = Column(Integer, default=0, nullable=False)
+    tokens_used = Column(Integer, default=0, nullable=False)
+    results = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
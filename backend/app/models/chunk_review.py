@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, UniqueConstraint
+from app.core.database import Base
+import datetime
+
+class ChunkReview(Base):
+    """
+    Cached review of one chunk of code, shared by every analysis that sees the same chunk.
+
+    Written as soon as a chunk is reviewed, so it doubles as the checkpoint a retried analysis
+    resumes from. Suggestions are stored with `line_offset` (relative to the chunk's first line)
+    instead of absolute line numbers and without a file path, so a chunk that moved or was copied
+    reuses the review.
+    """
+    __tablename__ = "chunk_reviews"
+    __table_args__ = (
+        UniqueConstraint("content_hash", "prompt_version", "model_name", name="uq_chunk_reviews_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), nullable=False)  # sha256 of the chunk's language and text
+    prompt_version = Column(String(32), nullable=False)
+    model_name = Column(String(128), nullable=False)
+    suggestions = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
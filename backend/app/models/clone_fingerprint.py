@@ -0,0 +1,29 @@
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, String
+from app.core.database import Base
+import datetime
+
+class CloneFingerprint(Base):
+    """
+    One winnowed fingerprint of one reviewed chunk (see app/utils/fingerprint.py), indexed across
+    every analysed repository to find copies of a region of code.
+
+    Each repository keeps the rows of its latest analysis of each file. `fingerprint_count` is
+    the chunk's total number of fingerprints, so the share of a region matched by another can be
+    computed from the matching rows alone; `review_key` is the chunk's review cache key, through
+    which a copy can reuse the region's review.
+    """
+    __tablename__ = "clone_fingerprints"
+    __table_args__ = (
+        Index("ix_clone_fingerprints_repository_path", "repository_id", "path"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(BigInteger, nullable=False, index=True)
+    repository_id = Column(Integer, ForeignKey("repositories.id", ondelete="CASCADE"), nullable=False)
+    analysis_id = Column(Integer, nullable=True)
+    path = Column(String(1024), nullable=False)
+    start_line = Column(Integer, nullable=False)
+    end_line = Column(Integer, nullable=False)
+    fingerprint_count = Column(Integer, nullable=False)
+    review_key = Column(String(64), nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -8,7 +8,7 @@ class Repository(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
-    url = Column(String(1024), nullable=False)
+    url = Column(String(1024), nullable=False, index=True)  # Push webhooks look repositories up by URL
     description = Column(Text, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, DateTime, ForeignKey, BigInteger, Integer, JSON, String, UniqueConstraint
+from app.core.database import Base
+import datetime
+
+class Snapshot(Base):
+    """
+    A set of files uploaded for analysis instead of fetched from git (an archive, or a manifest
+    of blobs the client sent), analysed as the commit `digest` of its upload repository.
+
+    The files themselves live in the content store; `manifest` lists [path, git blob SHA, size]
+    per file, and `digest` is the SHA-256 of the sorted manifest, so re-uploading the same tree
+    deduplicates onto the same analysis.
+    """
+    __tablename__ = "snapshots"
+    __table_args__ = (
+        UniqueConstraint("repository_id", "digest", name="uq_snapshots_repository_digest"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    repository_id = Column(Integer, ForeignKey("repositories.id", ondelete="CASCADE"), nullable=False)
+    digest = Column(String(64), nullable=False)
+    manifest = Column(JSON, nullable=False)
+    file_count = Column(Integer, nullable=False)
+    total_bytes = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,26 @@
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String
+from app.core.database import Base
+import datetime
+
+class Upload(Base):
+    """
+    A resumable file upload, received in parts and spooled to UPLOAD_SPOOL_DIR/<id>.
+
+    `received` is how many bytes were written and verified so far, i.e. the offset the next part
+    (or a resumed upload) starts at. `digest` is the SHA-256 of the whole file once completed,
+    checked against the client's `sha256` when it gave one.
+    """
+    __tablename__ = "uploads"
+
+    id = Column(String(32), primary_key=True)
+    filename = Column(String(255), nullable=False)
+    language = Column(String(32), nullable=True)
+    size = Column(BigInteger, nullable=False)  # declared by the client when initiating
+    sha256 = Column(String(64), nullable=True)  # expected digest, if the client gave one
+    received = Column(BigInteger, default=0, nullable=False)
+    parts = Column(Integer, default=0, nullable=False)
+    digest = Column(String(64), nullable=True)
+    status = Column(String(16), default="uploading", nullable=False)  # uploading, completed
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    completed_at = Column(DateTime, nullable=True)
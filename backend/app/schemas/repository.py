@@ -16,6 +16,7 @@ class RepositoryUpdate(BaseModel):
     description: Optional[str] = None
 
 class RepositoryRead(RepositoryBase):
+    url: str  # also upload://... for repositories of uploaded code
     id: int
     created_at: datetime
     updated_at: datetime
@@ -0,0 +1,134 @@
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import metrics
+from app.models import Analysis
+from app.services.llm_limiter import PRIORITY_ORDER, llm_limiter
+
+queue_depth = metrics.gauge("analysis_admission_queue_depth", "Pending analyses per priority class, as last seen by admission control")
+oldest_pending_seconds = metrics.gauge(
+    "analysis_admission_oldest_pending_seconds", "Age of the oldest pending analysis per priority class"
+)
+drain_rate = metrics.gauge("analysis_admission_drain_rate", "Analyses finished per second over the admission rate window")
+admission_threshold = metrics.gauge(
+    "analysis_admission_threshold", "Admission control limits, per signal and priority class"
+)
+rejected_total = metrics.counter("analysis_admission_rejected_total", "Triggers rejected with 429, per priority class and reason")
+
+
+class AdmissionRejected(Exception):
+    """The system is overloaded for this priority class; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Analysis queue overloaded ({reason}); retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Decides whether a new analysis may be queued, from the work already ahead of it.
+
+    A trigger of a given class competes with pending work of that class and every higher one,
+    so queue depth, oldest pending age and LLM limiter waiters are all counted at or above its
+    class. Any signal over its threshold rejects the trigger. Retry-After is estimated from how
+    fast analyses finished over the last ANALYSIS_ADMISSION_RATE_WINDOW_SECONDS.
+
+    Queue statistics are shared by all requests for ANALYSIS_ADMISSION_STATS_TTL_SECONDS, so a
+    burst of triggers costs one query per interval rather than one per request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Optional[Tuple[Dict[str, int], Dict[str, datetime], float]] = None
+        self._stats_at = 0.0
+        for priority in PRIORITY_ORDER:
+            for signal, limits in (
+                ("queue_depth", settings.ANALYSIS_ADMISSION_MAX_QUEUE_DEPTH),
+                ("oldest_pending_seconds", settings.ANALYSIS_ADMISSION_MAX_QUEUE_AGE_SECONDS),
+            ):
+                if priority in limits:
+                    admission_threshold.set(limits[priority], signal=signal, priority=priority)
+        admission_threshold.set(settings.LLM_ADMISSION_MAX_WAITING, signal="llm_waiting", priority="all")
+
+    def _queue_stats(self) -> Tuple[Dict[str, int], Dict[str, datetime], float]:
+        with self._lock:
+            if self._stats is not None and time.monotonic() - self._stats_at < settings.ANALYSIS_ADMISSION_STATS_TTL_SECONDS:
+                return self._stats
+            # Own session: admission runs in the middle of the caller's transaction
+            db = SessionLocal()
+            try:
+                depth, oldest, rate = self._query_stats(db)
+            finally:
+                db.close()
+            now = datetime.utcnow()
+            for priority in PRIORITY_ORDER:
+                queue_depth.set(depth.get(priority, 0), priority=priority)
+                age = (now - oldest[priority]).total_seconds() if oldest.get(priority) else 0.0
+                oldest_pending_seconds.set(age, priority=priority)
+            drain_rate.set(rate)
+            self._stats = (depth, oldest, rate)
+            self._stats_at = time.monotonic()
+            return self._stats
+
+    def _query_stats(self, db: Session) -> Tuple[Dict[str, int], Dict[str, datetime], float]:
+        now = datetime.utcnow()
+        depth: Dict[str, int] = {}
+        oldest: Dict[str, datetime] = {}
+        for priority, count, created_at in (
+            db.query(Analysis.priority, func.count(Analysis.id), func.min(Analysis.created_at))
+            .filter(Analysis.status == "pending")
+            .group_by(Analysis.priority)
+        ):
+            depth[priority] = count
+            oldest[priority] = created_at
+        window = settings.ANALYSIS_ADMISSION_RATE_WINDOW_SECONDS
+        finished = (
+            db.query(func.count(Analysis.id))
+            .filter(Analysis.started_at.isnot(None), Analysis.completed_at >= now - timedelta(seconds=window))
+            .scalar()
+        )
+        return depth, oldest, (finished or 0) / window
+
+    def check(self, priority: str, incoming: int = 1) -> None:
+        """Raise AdmissionRejected if `incoming` new analyses of `priority` should not be queued right now."""
+        if priority not in PRIORITY_ORDER:
+            return
+        ahead = PRIORITY_ORDER[: PRIORITY_ORDER.index(priority) + 1]
+        depth, oldest, rate = self._queue_stats()
+        now = datetime.utcnow()
+
+        breaches: Dict[str, float] = {}
+        max_depth = settings.ANALYSIS_ADMISSION_MAX_QUEUE_DEPTH.get(priority)
+        depth_ahead = sum(depth.get(p, 0) for p in ahead)
+        if max_depth is not None and depth_ahead + incoming > max_depth:
+            # Time to drain the queue far enough to fit the new work
+            excess = depth_ahead + incoming - max_depth
+            breaches["queue_depth"] = excess / rate if rate > 0 else settings.ANALYSIS_ADMISSION_DEFAULT_RETRY_SECONDS
+        max_age = settings.ANALYSIS_ADMISSION_MAX_QUEUE_AGE_SECONDS.get(priority)
+        oldest_ahead = min((oldest[p] for p in ahead if oldest.get(p)), default=None)
+        if max_age is not None and oldest_ahead is not None:
+            age = (now - oldest_ahead).total_seconds()
+            if age >= max_age:
+                breaches["oldest_pending_seconds"] = max(age - max_age, settings.ANALYSIS_ADMISSION_DEFAULT_RETRY_SECONDS)
+        waiting = llm_limiter.snapshot()["waiting"]
+        if sum(waiting.get(p, 0) for p in ahead) >= settings.LLM_ADMISSION_MAX_WAITING:
+            breaches["llm_waiting"] = settings.ANALYSIS_ADMISSION_DEFAULT_RETRY_SECONDS
+
+        if not breaches:
+            return
+        reason = max(breaches, key=breaches.get)
+        retry_after = int(min(max(math.ceil(breaches[reason]), 1), settings.ANALYSIS_ADMISSION_MAX_RETRY_AFTER_SECONDS))
+        rejected_total.inc(priority=priority, reason=reason)
+        raise AdmissionRejected(reason, retry_after)
+
+
+admission_controller = AdmissionController()
@@ -1,86 +1,218 @@
-import google.generativeai as genai
 from app.core.config import settings
-import json
+from app.core.metrics import metrics
+from app.services.job_control import JobCancelled, JobContext
+from app.services.llm_limiter import llm_limiter, LLMLimiterTimeout
+from app.services.llm_providers import REVIEW_RESPONSE_SCHEMA, create_provider, review_response_validator
+from app.utils.json_extract import extract_json_array
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from pydantic import ValidationError
 import re
+import time
+
+# Gemini calls run here so a caller can stop waiting on one (timeout/cancel) without blocking on it.
+# Sized above the limiter so abandoned calls that are still winding down do not starve new ones.
+_llm_executor = ThreadPoolExecutor(max_workers=settings.LLM_MAX_CONCURRENCY * 2, thread_name_prefix="llm-call")
+
+llm_responses_parsed_total = metrics.counter(
+  "llm_responses_parsed_total",
+  "Review responses by how their JSON was read (free form: complete/repaired/salvaged/unparsed; structured: valid/invalid)"
+)
+
+@dataclass
+class ReviewResult:
+  suggestions: list
+  # False for mock, error and unparsed responses, which must not be cached as the chunk's review
+  cacheable: bool = True
 
 class AIService:
+  # Bump whenever _construct_prompt changes so stored analyses are not reused across prompt revisions
+  PROMPT_VERSION = "v3"
+
   def __init__(self):
-    # Configure API key
-    if settings.GEMINI_API_KEY:
-      genai.configure(api_key=settings.GEMINI_API_KEY)
     # Choose a supported model (override via settings.GEMINI_MODEL if provided)
     self.model_name = getattr(settings, "GEMINI_MODEL", "models/gemini-1.5-flash")
-    print(f"Using Gemini model: {self.model_name}")
-    self.model = genai.GenerativeModel(self.model_name)
+    self.provider = create_provider(self.model_name)
+    if self.provider.name != "gemini":
+      # Reviews from another provider must not be served from the cache as this model's, or the reverse
+      self.model_name = f"{self.provider.name}:{self.model_name}"
+    print(f"Using {self.provider.name} model: {self.model_name}")
 
-  def get_review_for_code(self, code_snippet:str)-> list:
+  def get_review_for_code(
+    self, code_snippet:str, priority: str | None = None, ctx: JobContext | None = None, file_path: str | None = None,
+    context: str | None = None,
+  )-> list:
     # Sends a code snippet to Google Gemini and returns structured suggestions.
-    if not settings.GEMINI_API_KEY:
+    return self.review_code(code_snippet, priority, ctx, file_path, context).suggestions
+
+  def review_code(
+    self, code_snippet:str, priority: str | None = None, ctx: JobContext | None = None, file_path: str | None = None,
+    context: str | None = None,
+  )-> ReviewResult:
+    # Like get_review_for_code, but also tells whether the suggestions are a real review worth caching.
+    # `priority` is an AnalysisPriority value; it decides which LLM limiter lane the call waits in.
+    # `ctx` carries the job's cancellation/deadline; JobCancelled propagates instead of becoming a suggestion.
+    # `context` holds definitions the snippet references (see SymbolIndex.context_for), shown but not reviewed.
+    if ctx is not None:
+      ctx.raise_if_done()
+    if not self.provider.available:
       print("WARN: GEMINI_API_KEY not set. Returning mock AI response.")
-      return [
+      return ReviewResult([
         {"file_path": "example.py", "line_number": 1, "comment": "This is a mock AI suggestion."}
-      ]
+      ], cacheable=False)
 
-    prompt=self._construct_prompt(code_snippet)
+    prompt=self._construct_prompt(code_snippet, file_path, context)
+    structured = settings.LLM_STRUCTURED_OUTPUT
 
     try: 
-      response=self.model.generate_content(prompt)
-      raw_text = getattr(response, 'text', None) or ""
-      print("\n=== Raw Gemini response ===\n" + raw_text)
-
-      # Try to parse JSON
-      suggestions = []
-
-      # 1) If response includes a fenced JSON block, extract and parse it first
-      fenced_json = self._extract_fenced_json(raw_text)
-      if fenced_json:
+      # In structured mode an answer failing validation is asked again, for this chunk only
+      for attempt in range(1 + (settings.LLM_STRUCTURED_MAX_RETRIES if structured else 0)):
+        response = self._generate(prompt, priority, ctx, REVIEW_RESPONSE_SCHEMA if structured else None)
+        if ctx is not None and ctx.progress is not None:
+          usage = getattr(response, "usage_metadata", None)
+          ctx.progress.add(tokens_used=getattr(usage, "total_token_count", 0) or 0)
+        raw_text = getattr(response, 'text', None) or ""
+        print("\n=== Raw Gemini response ===\n" + raw_text)
+        if not structured:
+          break
         try:
-          suggestions = json.loads(fenced_json)
-        except Exception as e:
-          print(f"Failed to parse fenced JSON: {e}")
+          suggestions = review_response_validator.validate_json(raw_text)
+        except ValidationError as e:
+          llm_responses_parsed_total.inc(result="invalid")
+          print(f"Structured response failed validation (attempt {attempt + 1}): {e.error_count()} errors")
+          continue
+        llm_responses_parsed_total.inc(result="valid")
+        return ReviewResult(self._ensure_suggestion(suggestions))
 
-      # 2) If still empty, try parsing the entire text as JSON
-      if not suggestions:
-        try:
-          suggestions = json.loads(raw_text)
-          if not isinstance(suggestions, list):
-            raise ValueError("Parsed response is not a list")
-        except Exception as parse_err:
-          print(f"JSON parse failed: {parse_err}")
-
-      # 3) Fallback: wrap raw response into a single suggestion without forcing severity
-      if not suggestions:
-        cleaned = self._strip_fences(raw_text).strip()
-        suggestions = [{
-          "file_path": "response.txt",
-          "line_number": 1,
-          "comment": cleaned if cleaned else "No response text returned by Gemini."
-        }]
-
-      # Normalize severities ONLY if present (do not set defaults)
-      suggestions = self._normalize_severities(suggestions)
-
-      # Ensure at least one suggestion (no default severity)
-      if not suggestions:
-        suggestions = [{
-          "file_path": "summary",
-          "line_number": 1,
-          "comment": "No issues found or model returned an empty list."
-        }]
-
-      return suggestions 
+      # Free-form answers, and structured ones that never validated, are read as leniently as possible
+      result = self._parse_free_form(raw_text)
+      if structured:
+        result.cacheable = False
+      return result
+    except JobCancelled:
+      raise
     except Exception as e:
       print(f"Error calling Gemini API: {e}")
-      return [{
+      return ReviewResult([{
         "file_path": "error.txt",
         "line_number": 1,
         "comment": f"Gemini API error: {str(e)}"
+      }], cacheable=False)
+
+  def _parse_free_form(self, raw_text: str) -> ReviewResult:
+    # One pass over the response finds the JSON array, fenced or not, and keeps what is readable of it
+    cacheable = True
+    extracted = extract_json_array(raw_text)
+    if extracted is None or (not extracted.items and not extracted.complete):
+      # Fallback: wrap raw response into a single suggestion without forcing severity
+      outcome = "unparsed"
+      cacheable = False
+      cleaned = self._strip_fences(raw_text).strip()
+      suggestions = [{
+        "file_path": "response.txt",
+        "line_number": 1,
+        "comment": cleaned if cleaned else "No response text returned by Gemini."
+      }]
+    elif not extracted.complete:
+      # Cut off or broken mid-array: keep the whole suggestions, but let a later run ask again
+      outcome = "salvaged"
+      cacheable = False
+      suggestions = extracted.items
+      print(f"Salvaged {len(suggestions)} suggestions from an incomplete JSON response")
+    else:
+      outcome = "repaired" if extracted.repaired else "complete"
+      suggestions = extracted.items
+    llm_responses_parsed_total.inc(result=outcome)
+
+    # Normalize severities ONLY if present (do not set defaults)
+    return ReviewResult(self._ensure_suggestion(self._normalize_severities(suggestions)), cacheable)
+
+  def _ensure_suggestion(self, suggestions: list) -> list:
+    # Ensure at least one suggestion (no default severity)
+    if not suggestions:
+      suggestions = [{
+        "file_path": "summary",
+        "line_number": 1,
+        "comment": "No issues found or model returned an empty list."
       }]
-  
-  def _construct_prompt(self, code_snippet: str) -> str:
+    return suggestions
+
+  def summarize_module(
+    self, path: str, source: str, priority: str | None = None, ctx: JobContext | None = None
+  ) -> str | None:
+    # A short plain-text summary of a module's public API, given to reviews of the modules importing it.
+    # None when the model is unavailable or fails; callers fall back to the module's signatures.
+    if ctx is not None:
+      ctx.raise_if_done()
+    if not self.provider.available:
+      return None
+    limit = settings.ANALYSIS_MODULE_SUMMARY_MAX_CHARS
+    prompt = f"""
+      Summarize the public API of the module {path} for someone reviewing code that imports it.
+      For each public class, function and constant give its purpose, important arguments and return values,
+      raised errors and side effects. Skip private helpers. Plain text only, at most {limit} characters.
+
+      Module source:
+      ```
+      {source}
+      ```
+    """
+    try:
+      response = self._generate(prompt, priority, ctx)
+      if ctx is not None and ctx.progress is not None:
+        usage = getattr(response, "usage_metadata", None)
+        ctx.progress.add(tokens_used=getattr(usage, "total_token_count", 0) or 0)
+      summary = self._strip_fences(getattr(response, "text", None) or "").strip()
+    except JobCancelled:
+      raise
+    except Exception as e:
+      print(f"Error summarizing {path}: {e}")
+      return None
+    return (summary if len(summary) <= limit else summary[:limit - 3] + "...") or None
+
+  def _generate(self, prompt: str, priority: str | None, ctx: JobContext | None, response_schema: dict | None = None):
+    # Wait for a limiter slot, then for the call itself, giving up on per-call timeout, deadline or cancel.
+    # With `response_schema` the provider is asked for JSON constrained to it (structured output mode).
+    # Giving up releases the limiter slot right away; the abandoned HTTP call ends on its own request timeout.
+    call_timeout = settings.LLM_CALL_TIMEOUT_SECONDS
+    should_abort = ctx.is_done if ctx is not None else None
+    try:
+      acquired = llm_limiter.acquire(priority, timeout=ctx.remaining() if ctx else None, should_abort=should_abort)
+    except LLMLimiterTimeout:
+      if ctx is not None and ctx.is_done():
+        raise JobCancelled(ctx.reason or "cancelled")
+      raise
+    try:
+      future = _llm_executor.submit(self.provider.generate, prompt, call_timeout, response_schema)
+      started = time.monotonic()
+      while True:
+        limit = call_timeout - (time.monotonic() - started)
+        if ctx is not None:
+          remaining = ctx.remaining()
+          limit = min(limit, 0.5) if remaining is None else min(limit, remaining, 0.5)
+        try:
+          return future.result(timeout=max(limit, 0))
+        except FutureTimeoutError:
+          if ctx is not None and ctx.is_done():
+            future.cancel()
+            raise JobCancelled(ctx.reason or "cancelled")
+          if time.monotonic() - started >= call_timeout:
+            future.cancel()
+            raise TimeoutError(f"Gemini call timed out after {call_timeout:.0f}s")
+    finally:
+      llm_limiter.release(acquired)
+
+  def _construct_prompt(self, code_snippet: str, file_path: str | None = None, context: str | None = None) -> str:
     # Prompt engineering: ask for a specific JSON structure. Always return at least one element.
+    location = f"The code comes from the file {file_path}. Lines are prefixed with their line number and ' | '; report that number as line_number.\n" if file_path else ""
+    references = f"""
+      Definitions from elsewhere in the repository that the code references, for reference only (do not review them):
+      ```
+      {context}
+      ```
+""" if context else ""
     return f"""
-      Analyse the following code snippet for bugs, style issues, and performance bottlenecks.
+      {location}Analyse the following code snippet for bugs, style issues, and performance bottlenecks.
       Respond ONLY with JSON (no prose). Always return AT LEAST ONE array element. If there are no issues, return a single element with a helpful summary comment.
       Use one of these lowercase severity levels exactly when you assign severity: "info", "low", "medium", "high", "critical", "suggestion".
       JSON array elements must use this exact schema:
@@ -92,7 +224,7 @@ class AIService:
           "severity": "info" | "low" | "medium" | "high" | "critical" | "suggestion"
         }}
       ]
-
+{references}
       Code:
       ```
       {code_snippet}
@@ -101,14 +233,6 @@ class AIService:
       JSON Response:
     """
 
-  def _extract_fenced_json(self, text: str) -> str | None:
-    # Match ```json ... ``` or ``` ... ``` and capture content
-    pattern = r"```(?:json)?\s*(\[.*?\])\s*```"
-    m = re.search(pattern, text, flags=re.DOTALL | re.IGNORECASE)
-    if m:
-      return m.group(1)
-    return None
-
   def _strip_fences(self, text: str) -> str:
     # Remove leading/trailing fenced blocks if present
     return re.sub(r"^```[a-zA-Z0-9_-]*\n|\n```$", "", text.strip())
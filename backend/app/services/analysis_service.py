@@ -1,4 +1,37 @@
-from backend.app.api.v1.endpoints import analysis
+import hashlib
+import random
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models import Analysis, AnalysisPriority, Repository
+from app.services.admission import AdmissionController
+from app.services.clone_index import clone_index, clone_reviews_reused_total
+from app.services.job_control import JobCancelled, JobContext, ProgressTracker, job_registry
+from app.services.module_graph import ModuleGraph, ModuleSummaries
+from app.services.parse_cache import parse_cache
+from app.services.repository_services import repository_service
+from app.services.review_cache import ReviewCacheWriter, review_cache
+from app.services.symbol_index import SymbolIndex, symbol_indexer
+from app.utils.ast_parser import CodeChunk
+from app.utils.helpers import detect_language, iter_source_files
+
+ACTIVE_STATUSES = ("pending", "in_progress")
+
+# Rows per multi-row INSERT; keeps bind parameters well under the Postgres limit of 65535
+_BULK_INSERT_BATCH = 1000
+
+
+class IdempotencyKeyReused(ValueError):
+  """An Idempotency-Key was repeated with a different ref or commit than it was first used for."""
 
 
 class AnalysisService:
@@ -6,20 +39,670 @@ class AnalysisService:
     #In the future, we can inject database sessions or AI alients here.
     pass
 
-  def start_new_code_analysis(self, repo_id: int, commit_hash: str):
+  def dedup_key(self, repo_id: int, commit_hash: str, prompt_version: str, model_name: str) -> str:
+    raw = f"{repo_id}:{commit_hash}:{prompt_version}:{model_name}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+  def enqueue_analysis(
+    self,
+    db: Session,
+    repo,
+    ref: str,
+    idempotency_key: Optional[str] = None,
+    priority: str = AnalysisPriority.NORMAL.value,
+    claim: bool = False,
+    deadline_seconds: Optional[int] = None,
+    admission: Optional[AdmissionController] = None,
+    commit_hash: Optional[str] = None,
+    not_before: Optional[datetime] = None,
+    _retried: bool = False,
+  ) -> Tuple[Analysis, bool]:
+    '''
+    Create a pending Analysis for `repo` at `ref`, or return the one it duplicates.
+
+    Returns (analysis, created). An existing analysis is reused when the client repeats an
+    Idempotency-Key, or when a pending, running, or recently completed analysis exists for the
+    same resolved commit, prompt version and model. The unique constraints on `dedup_key` and
+    (`repository_id`, `idempotency_key`) make this hold across API workers. A still-pending
+    duplicate is promoted to `priority` if that is a higher class than it was queued with.
+    With `claim=True` a newly created analysis starts as in_progress so the dispatcher leaves it
+    to the caller, which is expected to run it inline. Repeating an Idempotency-Key with another
+    ref or commit raises IdempotencyKeyReused.
+
+    With ANALYSIS_REF_DEDUP_SECONDS set, a pending or running analysis of the same branch or tag
+    triggered within that window is reused without resolving the ref, so repeated triggers cost no
+    `git ls-remote` in the request. The price is staleness: a commit pushed inside the window is
+    not analysed by that trigger, which is why the window is off by default.
+
+    A new analysis of a branch cancels in-flight analyses of the same branch at an older commit,
+    and is itself cancelled if still unfinished `deadline_seconds` after being triggered.
+
+    With `admission`, a trigger that would create a new analysis raises AdmissionRejected when
+    the queue is overloaded; triggers that deduplicate onto an existing analysis are always let through.
+    A branch with no analysis it could deduplicate onto is refused before it is resolved.
+    `commit_hash` skips resolving `ref` when the caller already knows its commit (e.g. from a push
+    event), and `not_before` keeps the dispatcher from starting the analysis before that time.
+    '''
+    from app.services.ai_service import AIService  # lazy import to avoid configuring Gemini at import time
+
+    prompt_version = AIService.PROMPT_VERSION
+    model_name = settings.GEMINI_MODEL
+    if idempotency_key:
+      existing = self._find_by_idempotency_key(db, repo.id, idempotency_key)
+      if existing:
+        self._check_idempotent(existing, ref, commit_hash)
+        return self._promote(db, existing, priority), False
+
+    requested_commit = commit_hash
+    admitted = False
+    if commit_hash is None and repository_service.is_remote_ref(repo, ref):
+      latest = self._latest_for_ref(db, repo.id, ref, prompt_version, model_name)
+      since = datetime.utcnow() - timedelta(seconds=settings.ANALYSIS_REF_DEDUP_SECONDS)
+      if settings.ANALYSIS_REF_DEDUP_SECONDS and latest is not None and latest.status in ACTIVE_STATUSES and latest.created_at >= since:
+        print(f"[AnalysisService] Deduplicated trigger for repo {repo.id} at {ref} -> analysis {latest.id}")
+        return self._promote(db, latest, priority), False
+      if admission is not None and latest is None:
+        # Nothing this ref could deduplicate onto: refuse new work before asking the remote
+        admission.check(priority)
+        admitted = True
+
+    commit_hash = commit_hash or repository_service.resolve_ref(repo, ref)
+    key = self.dedup_key(repo.id, commit_hash, prompt_version, model_name)
+
+    self._release_dedup_claims(db, [key])
+
+    if admission is not None and not admitted and db.query(Analysis.id).filter(Analysis.dedup_key == key).first() is None:
+      admission.check(priority)
+
+    now = datetime.utcnow()
+    deadline_seconds = deadline_seconds or settings.ANALYSIS_DEFAULT_DEADLINE_SECONDS
+    stmt = (
+      pg_insert(Analysis)
+      .values(
+        repository_id=repo.id,
+        commit_hash=commit_hash,
+        ref=ref,
+        status="in_progress" if claim else "pending",
+        priority=priority,
+        prompt_version=prompt_version,
+        model_name=model_name,
+        idempotency_key=idempotency_key,
+        dedup_key=key,
+        created_at=now,
+        not_before=not_before,
+        deadline_at=now + timedelta(seconds=deadline_seconds),
+      )
+      .on_conflict_do_nothing()
+      .returning(Analysis.id)
+    )
+    inserted_id = db.execute(stmt).scalar()
+    db.commit()
+
+    if inserted_id is not None:
+      if commit_hash != ref:
+        self._cancel_superseded(db, {(repo.id, ref): commit_hash})
+      return db.get(Analysis, inserted_id), True
+
+    existing = None
+    if idempotency_key:
+      existing = self._find_by_idempotency_key(db, repo.id, idempotency_key)
+      if existing is not None:
+        self._check_idempotent(existing, ref, requested_commit)
+    if existing is None:
+      existing = db.query(Analysis).filter(Analysis.dedup_key == key).first()
+    if existing is None:
+      if _retried:
+        raise RuntimeError(f"Could not enqueue or find an analysis for repo {repo.id} at {commit_hash}")
+      # The conflicting row released its claim between our insert and this lookup; try once more
+      return self.enqueue_analysis(
+        db, repo, ref, idempotency_key, priority, claim, deadline_seconds, admission, commit_hash, not_before,
+        _retried=True,
+      )
+    print(f"[AnalysisService] Deduplicated trigger for repo {repo.id} at {commit_hash} -> analysis {existing.id}")
+    return self._promote(db, existing, priority), False
+
+  def _release_dedup_claims(self, db: Session, keys: List[str]) -> None:
+    # Release the dedup claim of analyses that may no longer be reused so a fresh run can take it
+    cutoff = datetime.utcnow() - timedelta(minutes=settings.ANALYSIS_DEDUP_WINDOW_MINUTES)
+    db.query(Analysis).filter(
+      Analysis.dedup_key.in_(keys),
+      or_(
+        Analysis.status.in_(("failed", "cancelled")),
+        and_(Analysis.status == "completed", Analysis.completed_at < cutoff),
+      ),
+    ).update({Analysis.dedup_key: None}, synchronize_session=False)
+
+  def enqueue_push(self, db: Session, repo: Repository, branch: str, commit_hash: str) -> Tuple[Analysis, str]:
     '''
-    The core business logic to initiate a code review .
+    Schedule an analysis for a push of `commit_hash` to `branch`, debounced per branch.
+
+    The analysis waits ANALYSIS_PUSH_DEBOUNCE_SECONDS before it may start. Further pushes to the
+    branch within that time move the waiting analysis to the newest head and restart the wait
+    (but never past ANALYSIS_PUSH_DEBOUNCE_MAX_SECONDS after the first push), so a burst of pushes
+    yields one analysis. Analyses of heads the branch has moved past are cancelled.
 
-    1. Clones the repository
-    2. Uses ast_parser to analyse the code
-    3. Calls ai_service to get suggestions from Gemini.
-    4. Saves the results to the database via repository/review service.
+    Returns (analysis, outcome) with outcome "scheduled", "coalesced" or "deduplicated".
     '''
-    print(f"[AnalysisService] Initiating analysis for repo: {repo_id}, commit: {commit_hash}")
-    #This is where we would integrate with other modules like `ast_parser` and `ai_service`.
-      #For now, we just print a message.
-      #TODO: Implement the full analysis pipeline.
-    print(f"[AnalysisService] Analysis pipeline finished for repo: {repo_id}")
-    return {"status": "completed", "suggestions_found": 0}
+    from app.services.ai_service import AIService  # lazy import to avoid configuring Gemini at import time
+
+    now = datetime.utcnow()
+    not_before = now + timedelta(seconds=settings.ANALYSIS_PUSH_DEBOUNCE_SECONDS)
+    # Lock the branch's waiting analysis so concurrent deliveries coalesce one after the other
+    waiting = (
+      db.query(Analysis)
+      .filter(
+        Analysis.repository_id == repo.id,
+        Analysis.ref == branch,
+        Analysis.status == "pending",
+        Analysis.not_before > now,
+      )
+      .order_by(Analysis.created_at.desc())
+      .with_for_update()
+      .first()
+    )
+    if waiting is None:
+      analysis, created = self.enqueue_analysis(db, repo, branch, commit_hash=commit_hash, not_before=not_before)
+      return analysis, "scheduled" if created else "deduplicated"
+    if waiting.commit_hash == commit_hash:
+      db.commit()
+      return waiting, "deduplicated"
+
+    key = self.dedup_key(repo.id, commit_hash, AIService.PROMPT_VERSION, settings.GEMINI_MODEL)
+    self._release_dedup_claims(db, [key])
+    existing = db.query(Analysis).filter(Analysis.dedup_key == key).first()
+    if existing is not None:
+      # The new head was analysed already; the waiting analysis is simply outdated
+      db.commit()
+      self._cancel_superseded(db, {(repo.id, branch): commit_hash})
+      return existing, "deduplicated"
+
+    first_push = waiting.created_at or now
+    waiting.commit_hash = commit_hash
+    waiting.dedup_key = key
+    waiting.not_before = min(not_before, first_push + timedelta(seconds=settings.ANALYSIS_PUSH_DEBOUNCE_MAX_SECONDS))
+    try:
+      db.commit()
+    except IntegrityError:
+      # A concurrent trigger of the new head took its dedup key first; reuse that analysis instead
+      db.rollback()
+      existing = db.query(Analysis).filter(Analysis.dedup_key == key).first()
+      db.commit()
+      if existing is None:
+        raise
+      self._cancel_superseded(db, {(repo.id, branch): commit_hash})
+      return existing, "deduplicated"
+    self._cancel_superseded(db, {(repo.id, branch): commit_hash})
+    db.refresh(waiting)
+    print(f"[AnalysisService] Coalesced push of {branch} at {commit_hash} into analysis {waiting.id}")
+    return waiting, "coalesced"
+
+  def enqueue_bulk(
+    self,
+    db: Session,
+    targets: List[Tuple[Repository, str]],
+    deadline_seconds: Optional[int] = None,
+    admission: Optional[AdmissionController] = None,
+    jitter_seconds: float = 0.0,
+  ) -> List[Tuple[Optional[Analysis], bool]]:
+    '''
+    enqueue_analysis for many (repository, ref) pairs at once, in the bulk priority class.
+
+    Refs are resolved with one `git ls-remote` per repository (run concurrently), and all new
+    analyses are created with multi-row inserts. Deduplication works as in enqueue_analysis,
+    including between pairs of the same call. Returns (analysis, created) in the order of `targets`;
+    the analysis is None for pairs whose repository could not be resolved within
+    ANALYSIS_BULK_RESOLVE_SECONDS, which are left out rather than holding up the whole call.
+    With `admission`, the whole call is rejected if the new analyses would overload the queue.
+    With `jitter_seconds`, each new analysis is held back (not_before) by a random delay up to that
+    long, with its deadline counted from then, so a large batch does not hit the workers all at once.
+    '''
+    from app.services.ai_service import AIService  # lazy import to avoid configuring Gemini at import time
+
+    if not targets:
+      return []
+    refs_by_repo: Dict[int, List[str]] = {}
+    repos = {}
+    for repo, ref in targets:
+      repos[repo.id] = repo
+      refs_by_repo.setdefault(repo.id, []).append(ref)
+    pool = ThreadPoolExecutor(max_workers=settings.GIT_RESOLVE_CONCURRENCY)
+    futures = {
+      pool.submit(repository_service.resolve_refs, repos[repo_id], refs): repo_id for repo_id, refs in refs_by_repo.items()
+    }
+    done, _ = wait(futures, timeout=settings.ANALYSIS_BULK_RESOLVE_SECONDS)
+    # Calls still running end on their own git timeout; the ones not started are dropped
+    pool.shutdown(wait=False, cancel_futures=True)
+    resolved = {futures[f]: f.result() for f in done}
+    if len(resolved) < len(refs_by_repo):
+      print(f"[AnalysisService] Bulk trigger: {len(refs_by_repo) - len(resolved)} repositories not resolved in time")
+    targets_in_time = [(repo, ref) for repo, ref in targets if repo.id in resolved]
+
+    prompt_version = AIService.PROMPT_VERSION
+    model_name = settings.GEMINI_MODEL
+    keys = []
+    rows: Dict[str, dict] = {}
+    now = datetime.utcnow()
+    deadline = timedelta(seconds=deadline_seconds or settings.ANALYSIS_DEFAULT_DEADLINE_SECONDS)
+    for repo, ref in targets_in_time:
+      commit_hash = resolved[repo.id][ref]
+      key = self.dedup_key(repo.id, commit_hash, prompt_version, model_name)
+      keys.append(key)
+      not_before = now + timedelta(seconds=random.uniform(0, jitter_seconds)) if jitter_seconds > 0 else None
+      rows.setdefault(key, dict(
+        repository_id=repo.id,
+        commit_hash=commit_hash,
+        ref=ref,
+        status="pending",
+        priority=AnalysisPriority.BULK.value,
+        prompt_version=prompt_version,
+        model_name=model_name,
+        dedup_key=key,
+        created_at=now,
+        not_before=not_before,
+        deadline_at=(not_before or now) + deadline,
+      ))
+
+    self._release_dedup_claims(db, list(rows))
+    ids_by_key = dict(db.query(Analysis.dedup_key, Analysis.id).filter(Analysis.dedup_key.in_(list(rows))).all())
+
+    new_rows = [row for key, row in rows.items() if key not in ids_by_key]
+    if admission is not None and new_rows:
+      admission.check(AnalysisPriority.BULK.value, incoming=len(new_rows))
+
+    created_keys = set()
+    for i in range(0, len(new_rows), _BULK_INSERT_BATCH):
+      inserted = db.execute(
+        pg_insert(Analysis).values(new_rows[i:i + _BULK_INSERT_BATCH]).on_conflict_do_nothing()
+        .returning(Analysis.dedup_key, Analysis.id)
+      ).all()
+      ids_by_key.update(dict(inserted))
+      created_keys.update(key for key, _ in inserted)
+    db.commit()
+
+    # Rows that lost an insert race to a concurrent trigger
+    missing = [key for key in rows if key not in ids_by_key]
+    if missing:
+      ids_by_key.update(dict(db.query(Analysis.dedup_key, Analysis.id).filter(Analysis.dedup_key.in_(missing)).all()))
+      if len(ids_by_key) < len(rows):
+        raise RuntimeError(f"Could not enqueue or find {len(rows) - len(ids_by_key)} bulk analyses")
+
+    self._cancel_superseded(db, {
+      (rows[key]["repository_id"], rows[key]["ref"]): rows[key]["commit_hash"]
+      for key in created_keys if rows[key]["commit_hash"] != rows[key]["ref"]
+    })
+    analyses = {a.id: a for a in db.query(Analysis).filter(Analysis.id.in_(list(ids_by_key.values())))}
+    print(f"[AnalysisService] Bulk trigger: {len(created_keys)} new analyses, {len(rows) - len(created_keys)} deduplicated")
+    # Only the first pair of a key created it; repeats within the call count as deduplicated
+    result, seen = [], set()
+    keys_in_order = iter(keys)
+    for repo, _ in targets:
+      if repo.id not in resolved:
+        result.append((None, False))
+        continue
+      key = next(keys_in_order)
+      result.append((analyses[ids_by_key[key]], key in created_keys and key not in seen))
+      seen.add(key)
+    return result
+
+  def _promote(self, db: Session, analysis: Analysis, priority: str) -> Analysis:
+    order = [p.value for p in AnalysisPriority]
+    if analysis.status == "pending" and priority in order and analysis.priority in order \
+        and order.index(priority) < order.index(analysis.priority):
+      db.query(Analysis).filter(Analysis.id == analysis.id, Analysis.status == "pending").update(
+        {Analysis.priority: priority}, synchronize_session=False
+      )
+      db.commit()
+      db.refresh(analysis)
+    return analysis
+
+  def _cancel_superseded(self, db: Session, heads: Dict[Tuple[int, str], str]) -> None:
+    # `heads` maps (repository id, branch) to the commit it now points at
+    if not heads:
+      return
+    active = db.query(Analysis.id, Analysis.repository_id, Analysis.ref, Analysis.commit_hash).filter(
+      tuple_(Analysis.repository_id, Analysis.ref).in_(list(heads)),
+      Analysis.status.in_(ACTIVE_STATUSES),
+    )
+    superseded = {row.id: row for row in active if row.commit_hash != heads[(row.repository_id, row.ref)]}
+    for analysis_id in self.cancel_analyses(db, list(superseded), reason="superseded"):
+      row = superseded[analysis_id]
+      print(f"[AnalysisService] Cancelled analysis {analysis_id}: {row.ref} moved to {heads[(row.repository_id, row.ref)]}")
+
+  def cancel_analysis(self, db: Session, analysis_id: int, reason: str = "user") -> bool:
+    '''
+    Cancel a pending or running analysis. Returns False if it had already finished.
+
+    The database row is marked cancelled right away, which releases its dedup claim and keeps
+    the dispatcher from picking it up. A run in this process is signalled directly; runs in other
+    processes notice the row on their next check and abandon outstanding LLM calls.
+    '''
+    return bool(self.cancel_analyses(db, [analysis_id], reason))
+
+  def cancel_analyses(self, db: Session, analysis_ids: List[int], reason: str) -> List[int]:
+    """Cancel several analyses in one statement; returns the ids that were still pending or running."""
+    if not analysis_ids:
+      return []
+    cancelled = db.execute(
+      update(Analysis)
+      .where(Analysis.id.in_(analysis_ids), Analysis.status.in_(ACTIVE_STATUSES))
+      .values(status="cancelled", cancel_reason=reason, completed_at=datetime.utcnow(), dedup_key=None)
+      .returning(Analysis.id)
+      .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    for analysis_id in cancelled:
+      job_registry.cancel(analysis_id, reason)
+    return list(cancelled)
+
+  def _finish(self, db: Session, analysis_id: int, attempt: Optional[int] = None, **values) -> bool:
+    # Only an in_progress analysis may finish; a cancellation that won the race is left alone, and so
+    # is a run that was requeued after this worker lost its lease (`attempt` no longer matches)
+    query = db.query(Analysis).filter(Analysis.id == analysis_id, Analysis.status == "in_progress")
+    if attempt is not None:
+      query = query.filter(Analysis.attempts == attempt)
+    updated = (
+      query
+      .update({getattr(Analysis, k): v for k, v in values.items()}, synchronize_session=False)
+    )
+    db.commit()
+    return bool(updated)
+
+  def run_code_analysis(self, analysis_id: int, db: Session):
+    """
+    Run code analysis using the AIService and store the results on the pending Analysis row.
+    Returns None if the analysis does not exist, was cancelled, or passed its deadline.
+
+    Every reviewed chunk is checkpointed in the review cache, so a run that is retried after
+    its worker died (see AnalysisDispatcher) only reviews the chunks that are still missing.
+    Large checkouts are split into shards that idle workers help review (see ShardService).
+    """
+    from app.services.sharding import shard_service  # lazy import to avoid circulars
+    analysis = db.query(Analysis).filter(Analysis.id == analysis_id).first()
+    if not analysis:
+      print(f"Analysis {analysis_id} not found")
+      return None
+    repo_id = analysis.repository_id
+    attempt = analysis.attempts
+
+    def poll_cancel_reason():
+      row = db.query(Analysis.status, Analysis.cancel_reason, Analysis.attempts).filter(Analysis.id == analysis_id).first()
+      db.commit()  # end the read transaction so the next poll sees fresh data
+      if row is None or row.status == "cancelled":
+        return (row.cancel_reason if row else None) or "cancelled"
+      if row.attempts != attempt:
+        return "lease_lost"  # requeued as abandoned; the new attempt owns the row now
+      return None
+
+    progress = ProgressTracker(
+      lambda values: self._write_progress(analysis_id, attempt, values), settings.ANALYSIS_PROGRESS_FLUSH_SECONDS
+    )
+    checkpoints = self.checkpoint_writer(analysis)
+    ctx = JobContext(analysis_id, analysis.deadline_at, poll_cancel_reason, progress=progress)
+    job_registry.register(ctx)
+    try:
+      print(f"Starting analysis {analysis_id} for repo {repo_id} at commit {analysis.commit_hash}...")
+      started = (
+        db.query(Analysis)
+        .filter(Analysis.id == analysis_id, Analysis.status.in_(ACTIVE_STATUSES))
+        .update(
+          {
+            Analysis.status: "in_progress",
+            Analysis.started_at: func.coalesce(Analysis.started_at, datetime.utcnow()),
+            Analysis.heartbeat_at: datetime.utcnow(),
+          },
+          synchronize_session=False,
+        )
+      )
+      db.commit()
+      if not started:
+        print(f"Analysis {analysis_id} was cancelled before it started")
+        return None
+      ctx.raise_if_done()
+
+      repo = db.get(Repository, repo_id)
+      with repository_service.checkout(repo, analysis.commit_hash) as workdir:
+        ctx.raise_if_done()
+        shards = shard_service.plan(workdir) if settings.ANALYSIS_SHARDING_ENABLED else None
+        if shards or shard_service.has_shards(db, analysis_id):
+          # Counters are rolled up from the shards as they progress
+          review_suggestions = shard_service.coordinate(db, analysis, ctx, workdir, shards or [])
+          counters = {}
+        else:
+          files = self._chunk_checkout(workdir)
+          progress.set_totals(len(files), sum(len(chunks) for chunks in files))
+          review_suggestions = self.review_chunks(
+            db, analysis, files, ctx, progress, checkpoints, self.symbol_index(workdir),
+          )
+          counters = progress.values
+      ctx.raise_if_done()
+
+      # Save the analysis results
+      if not self._finish(
+        db, analysis_id, attempt,
+        status="completed", results={"review": review_suggestions}, completed_at=datetime.utcnow(),
+        **counters,
+      ):
+        print(f"Analysis {analysis_id} was cancelled while running; discarding results")
+        return None
+      shard_service.discard(db, analysis_id)
+
+      print(f"Analysis completed for repo {repo_id}")
+      return review_suggestions
+
+    except JobCancelled as c:
+      print(f"Analysis {analysis_id} stopped: {c.reason}")
+      db.rollback()
+      if self._finish(
+        db, analysis_id, attempt,
+        status="cancelled", cancel_reason=c.reason, completed_at=datetime.utcnow(), dedup_key=None,
+      ):
+        shard_service.discard(db, analysis_id)
+      return None
+
+    except Exception as e:
+      print(f"Error during analysis for repo {repo_id}: {str(e)}")
+      try:
+        db.rollback()
+      except Exception as re:
+        print(f"Rollback failed: {re}")
+      try:
+        # Failed runs must not block a retry of the same commit
+        if self._finish(
+          db, analysis_id, attempt,
+          status="failed", results={"error": str(e)}, completed_at=datetime.utcnow(), dedup_key=None,
+        ):
+          shard_service.discard(db, analysis_id)
+      except Exception as ie:
+        print(f"Failed to persist failed analysis record: {ie}")
+      raise
+    finally:
+      # Keep what was reviewed even when the run stops early, so a rerun resumes from there
+      checkpoints.flush(force=True)
+      job_registry.unregister(ctx)
+
+  def checkpoint_writer(self, analysis: Analysis) -> ReviewCacheWriter:
+    """Review cache writer for the prompt version and model `analysis` was queued with."""
+    from app.services.ai_service import AIService  # lazy import to avoid configuring Gemini at import time
+    return review_cache.writer(
+      analysis.prompt_version or AIService.PROMPT_VERSION,
+      analysis.model_name or settings.GEMINI_MODEL,
+      settings.ANALYSIS_PROGRESS_FLUSH_SECONDS,
+    )
+
+  def review_chunks(
+    self,
+    db: Session,
+    analysis: Analysis,
+    files: List[List[CodeChunk]],
+    ctx: JobContext,
+    progress: ProgressTracker,
+    checkpoints: ReviewCacheWriter,
+    symbols: Optional[SymbolIndex] = None,
+  ) -> list:
+    """
+    Review every chunk of `files` for `analysis`, taking already reviewed chunks from the cache.
+    With a symbol index, each prompt also carries the definitions its chunk references; with
+    ANALYSIS_DEPENDENCY_ORDER, files are reviewed leaf modules first and prompts also carry
+    summaries of the modules the file imports.
+    """
+    from app.services.ai_service import aiservice  # lazy import to avoid circulars
+
+    summaries = None
+    if symbols is not None and settings.ANALYSIS_DEPENDENCY_ORDER:
+      graph = ModuleGraph(symbols)
+      files = graph.schedule(files)
+      summaries = ModuleSummaries(symbols, graph, analysis.priority, ctx)
+      summaries.prepare(chunks[0].path for chunks in files)
+    all_chunks = [chunk for chunks in files for chunk in chunks]
+    contexts = {
+      id(chunk): "\n\n".join(filter(None, (
+        symbols.context_for(chunk) if symbols is not None else "",
+        summaries.context_for(chunk.path) if summaries is not None else "",
+      )))
+      for chunk in all_chunks
+    }
+    # Keyed on the imported modules' blobs rather than their summaries' text (see ModuleSummaries.key_for)
+    keys = {
+      id(chunk): review_cache.chunk_key(chunk, "\n\n".join(filter(None, (
+        symbols.context_for(chunk) if symbols is not None else "",
+        summaries.key_for(chunk.path) if summaries is not None else "",
+      ))))
+      for chunk in all_chunks
+    }
+    clones = clone_index.plan(db, analysis.repository_id, all_chunks) if settings.CLONE_DETECTION_ENABLED else None
+    # Chunks reviewed before (by an earlier attempt, in other code, or as a clone elsewhere) come from the cache
+    cached = review_cache.lookup(
+      db,
+      list(keys.values()) + (list(clones.external_keys.values()) if clones is not None else []),
+      checkpoints.prompt_version, checkpoints.model_name,
+    )
+    db.commit()
+
+    # Get code review from AIService, one call per remaining chunk; near-identical copies share one review
+    review_suggestions = []
+    reviewed: Dict[int, list] = {}  # id(chunk) -> its suggestions, relative (see ReviewCache.compact)
+    for chunks in files:
+      for chunk in chunks:
+        key = keys[id(chunk)]
+        representative = clones.representative.get(id(chunk)) if clones is not None else None
+        external_key = clones.external_keys.get(id(chunk)) if clones is not None else None
+        if key in cached:
+          reviewed[id(chunk)] = cached[key]
+        elif representative is not None and id(representative) in reviewed:
+          reviewed[id(chunk)] = reviewed[id(representative)]
+          clone_reviews_reused_total.inc(source="local")
+        elif external_key in cached:
+          reviewed[id(chunk)] = cached[external_key]
+          clone_reviews_reused_total.inc(source="external")
+        else:
+          result = aiservice.review_code(
+            chunk.numbered_text(), priority=analysis.priority, ctx=ctx, file_path=chunk.path,
+            context=contexts[id(chunk)] or None,
+          )
+          placed = self._place_suggestions(chunk, result.suggestions)
+          review_suggestions.extend(placed)
+          if result.cacheable:
+            reviewed[id(chunk)] = cached[key] = review_cache.compact(chunk, placed)
+            checkpoints.add(key, cached[key])
+          progress.add(chunks_done=1)
+          continue
+        # A review borrowed from a clone serves this run only; it is not cached under this chunk's key
+        review_suggestions.extend(review_cache.expand(chunk, reviewed[id(chunk)]))
+        progress.add(chunks_done=1)
+      progress.add(files_done=1)
+
+    if clones is not None:
+      review_suggestions.extend(clone_index.findings(clones))
+      try:
+        # Other repositories reuse a region's review only if it is cached under the region's own key
+        own_keys = {chunk_id: key for chunk_id, key in keys.items() if key in cached}
+        clone_index.record(db, analysis.repository_id, analysis.id, all_chunks, own_keys)
+      except Exception as e:
+        # The index only saves later work; an analysis does not fail over it
+        db.rollback()
+        print(f"Failed to index clone fingerprints of analysis {analysis.id}: {e}")
+    return review_suggestions
+
+  def symbol_index(self, workdir: str) -> Optional[SymbolIndex]:
+    # Context for the prompts; the whole checkout is indexed even when reviewing one shard of it
+    if not settings.ANALYSIS_CONTEXT_MAX_SYMBOLS:
+      return None
+    return symbol_indexer.build(workdir)
+
+  def _chunk_checkout(self, workdir: str, paths: Optional[List[str]] = None) -> List[List[CodeChunk]]:
+    # All reviewable files, or only `paths` (one shard's files)
+    if paths is None:
+      listing = iter_source_files(workdir, settings.ANALYSIS_MAX_FILE_BYTES)
+    else:
+      listing = ((path, detect_language(path)) for path in paths)
+    items = [(path, language, None) for path, language in listing]
+    blob_shas = repository_service.blob_shas(workdir)
+    # Files whose blob was parsed before reuse cached chunk boundaries; the rest go to the process pool
+    parsed = parse_cache.chunk_files(workdir, items, settings.ANALYSIS_MAX_CHUNK_LINES, blob_shas)
+    if settings.CLONE_DETECTION_ENABLED:
+      fingerprinted = parse_cache.fingerprint_files(
+        workdir, items, settings.CLONE_KGRAM_TOKENS, settings.CLONE_WINDOW, blob_shas,
+      )
+      for (_, chunks), (_, prints) in zip(parsed, fingerprinted):
+        lines = [line for _, line in prints]  # non-decreasing: fingerprints come in token order
+        for chunk in chunks:
+          lo, hi = bisect_left(lines, chunk.start_line), bisect_right(lines, chunk.end_line)
+          chunk.fingerprints = sorted({h for h, _ in prints[lo:hi]})
+    return [chunks for _, chunks in parsed if chunks]
+
+  def _place_suggestions(self, chunk: CodeChunk, suggestions: list) -> list:
+    # The chunk, not the model, is authoritative for the file; keep lines inside the chunk
+    for s in suggestions:
+      s["file_path"] = chunk.path
+      try:
+        line = int(s.get("line_number"))
+      except (TypeError, ValueError):
+        line = chunk.start_line
+      s["line_number"] = line if chunk.start_line <= line <= chunk.end_line else chunk.start_line
+    return suggestions
+
+  def _write_progress(self, analysis_id: int, attempt: int, values: Dict[str, int]) -> None:
+    # Own session: progress may be flushed from whichever thread finished the chunk
+    db = SessionLocal()
+    try:
+      db.query(Analysis).filter(
+        Analysis.id == analysis_id, Analysis.status == "in_progress", Analysis.attempts == attempt
+      ).update(
+        {getattr(Analysis, k): v for k, v in values.items()}, synchronize_session=False
+      )
+      db.commit()
+    finally:
+      db.close()
+
+  def _check_idempotent(self, existing: Analysis, ref: str, commit_hash: Optional[str]) -> None:
+    # A repeated Idempotency-Key must come with the request it was first used for
+    if (existing.ref is not None and existing.ref != ref) or (commit_hash is not None and existing.commit_hash != commit_hash):
+      raise IdempotencyKeyReused(
+        f"Idempotency-Key was already used for analysis {existing.id} of {existing.ref or existing.commit_hash}"
+      )
+
+  def _latest_for_ref(
+    self, db: Session, repo_id: int, ref: str, prompt_version: str, model_name: str,
+  ) -> Optional[Analysis]:
+    # The newest analysis of `ref` that still holds its dedup claim, i.e. that a trigger may be a duplicate of
+    return (
+      db.query(Analysis)
+      .filter(
+        Analysis.repository_id == repo_id,
+        Analysis.ref == ref,
+        Analysis.prompt_version == prompt_version,
+        Analysis.model_name == model_name,
+        Analysis.dedup_key.isnot(None),
+      )
+      .order_by(Analysis.created_at.desc())
+      .first()
+    )
+
+  def _find_by_idempotency_key(self, db: Session, repo_id: int, idempotency_key: str) -> Optional[Analysis]:
+    return (
+      db.query(Analysis)
+      .filter(Analysis.repository_id == repo_id, Analysis.idempotency_key == idempotency_key)
+      .first()
+    )
 
-analysis_service=AnalysisService()
\ No newline at end of file
+analysis_service=AnalysisService()
@@ -0,0 +1,159 @@
+import stat
+import tarfile
+import zipfile
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.content_store import BlobRejected, content_store
+from app.services.snapshot_service import ManifestEntry, snapshot_service
+
+archive_entries_total = metrics.counter("archive_entries_total", "Archive entries read, by outcome (stored/skipped)")
+archives_rejected_total = metrics.counter("archives_rejected_total", "Archives refused, by reason")
+
+_READ_BLOCK = 256 * 1024
+# The tar compression ratio is only checked past this many uncompressed bytes; tiny archives compress oddly
+_RATIO_FLOOR_BYTES = 1024 * 1024
+
+
+class ArchiveRejected(ValueError):
+    """The archive is unreadable or exceeds the ARCHIVE_* limits."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason  # entries, size, ratio, unreadable
+
+
+@dataclass
+class ExtractedArchive:
+    entries: List[ManifestEntry] = field(default_factory=list)
+    skipped: int = 0  # entries that are not reviewable source files
+    bytes_read: int = 0  # uncompressed
+
+
+class ArchiveService:
+    """
+    Extracts uploaded .zip / .tar(.gz/.bz2/.xz) archives into the content store.
+
+    Entries are decompressed one at a time in blocks and written straight to the store, hashed
+    on the way, so neither the archive nor its tree is ever in memory. Only reviewable source
+    files (by extension, outside vendored directories, not binary, at most
+    ANALYSIS_MAX_FILE_BYTES) are kept; zip entries that are not are never decompressed. The
+    ARCHIVE_* limits on entry count, total size and compression ratio reject zip bombs as soon
+    as they are crossed.
+    """
+
+    def extract(self, path: str, filename: str) -> ExtractedArchive:
+        """Store the reviewable files of the archive at `path`; raises ArchiveRejected."""
+        try:
+            if zipfile.is_zipfile(path):
+                result = self._extract_zip(path)
+            else:
+                try:
+                    result = self._extract_tar(path)
+                except (tarfile.TarError, EOFError, OSError) as e:
+                    raise ArchiveRejected(f"{filename} is not a readable zip or tar archive: {e}", "unreadable")
+        except ArchiveRejected as e:
+            archives_rejected_total.inc(reason=e.reason)
+            raise
+        self._strip_common_root(result)
+        return result
+
+    def _extract_zip(self, path: str) -> ExtractedArchive:
+        result = ExtractedArchive()
+        entries: Dict[str, ManifestEntry] = {}
+        try:
+            with zipfile.ZipFile(path) as archive:
+                infos = archive.infolist()
+                if len(infos) > settings.ARCHIVE_MAX_ENTRIES:
+                    raise ArchiveRejected(f"Archive has more than {settings.ARCHIVE_MAX_ENTRIES} entries", "entries")
+                for info in infos:
+                    is_link = stat.S_ISLNK(info.external_attr >> 16)
+                    name = snapshot_service.reviewable_path(info.filename)
+                    if info.is_dir() or is_link or name is None or info.file_size > settings.ANALYSIS_MAX_FILE_BYTES:
+                        result.skipped += 1
+                        archive_entries_total.inc(outcome="skipped")
+                        continue
+                    if info.compress_size and info.file_size / info.compress_size > settings.ARCHIVE_MAX_RATIO:
+                        raise ArchiveRejected(f"{info.filename} expands more than {settings.ARCHIVE_MAX_RATIO}x", "ratio")
+                    with archive.open(info) as stream:
+                        sha = self._store(stream, info.file_size, result)
+                    self._record(entries, result, name, sha, info.file_size)
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, EOFError) as e:
+            raise ArchiveRejected(f"Unreadable zip archive: {e}", "unreadable")
+        result.entries = list(entries.values())
+        return result
+
+    def _extract_tar(self, path: str) -> ExtractedArchive:
+        result = ExtractedArchive()
+        entries: Dict[str, ManifestEntry] = {}
+        count = 0
+        with open(path, "rb") as raw:
+            # Stream mode ("r|*") reads the archive strictly front to back, decompressing as it goes
+            with tarfile.open(fileobj=raw, mode="r|*") as archive:
+                for member in archive:
+                    count += 1
+                    if count > settings.ARCHIVE_MAX_ENTRIES:
+                        raise ArchiveRejected(f"Archive has more than {settings.ARCHIVE_MAX_ENTRIES} entries", "entries")
+                    self._check_tar_stream(archive.offset, raw.tell())
+                    name = snapshot_service.reviewable_path(member.name)
+                    if not member.isfile() or name is None or member.size > settings.ANALYSIS_MAX_FILE_BYTES:
+                        result.skipped += 1
+                        archive_entries_total.inc(outcome="skipped")
+                        continue
+                    stream = archive.extractfile(member)
+                    sha = self._store(stream, member.size, result, lambda: self._check_tar_stream(archive.offset, raw.tell()))
+                    self._record(entries, result, name, sha, member.size)
+        result.entries = list(entries.values())
+        return result
+
+    def _check_tar_stream(self, uncompressed: int, compressed: int) -> None:
+        if uncompressed > settings.ARCHIVE_MAX_BYTES:
+            raise ArchiveRejected(f"Archive expands beyond {settings.ARCHIVE_MAX_BYTES} bytes", "size")
+        if uncompressed > _RATIO_FLOOR_BYTES and uncompressed > compressed * settings.ARCHIVE_MAX_RATIO:
+            raise ArchiveRejected(f"Archive expands more than {settings.ARCHIVE_MAX_RATIO}x", "ratio")
+
+    def _store(self, stream: BinaryIO, size: int, result: ExtractedArchive, check: Optional[Callable[[], None]] = None) -> Optional[str]:
+        # Copy one entry into the content store; None if it turned out to be binary
+        writer = content_store.writer(size)
+        try:
+            while True:
+                block = stream.read(_READ_BLOCK)
+                if not block:
+                    break
+                result.bytes_read += len(block)
+                if result.bytes_read > settings.ARCHIVE_MAX_BYTES:
+                    raise ArchiveRejected(f"Archive expands beyond {settings.ARCHIVE_MAX_BYTES} bytes", "size")
+                if check is not None:
+                    check()
+                if b"\0" in block:
+                    writer.discard()
+                    return None
+                writer.write(block)
+            return writer.commit()
+        except BlobRejected as e:
+            writer.discard()
+            raise ArchiveRejected(f"Corrupt archive entry: {e}", "unreadable")
+        except BaseException:
+            writer.discard()
+            raise
+
+    def _record(self, entries: Dict[str, ManifestEntry], result: ExtractedArchive, name: str, sha: Optional[str], size: int) -> None:
+        if sha is None:
+            result.skipped += 1
+            archive_entries_total.inc(outcome="skipped")
+            return
+        entries[name] = (name, sha, size)  # a later entry for the same path replaces the earlier one
+        archive_entries_total.inc(outcome="stored")
+
+    def _strip_common_root(self, result: ExtractedArchive) -> None:
+        # Archives of a project usually wrap it in one directory (e.g. "project-main/"); drop it
+        if not result.entries:
+            return
+        roots = {path.split("/", 1)[0] for path, _, _ in result.entries}
+        if len(roots) == 1 and all("/" in path for path, _, _ in result.entries):
+            result.entries = [(path.split("/", 1)[1], sha, size) for path, sha, size in result.entries]
+
+
+archive_service = ArchiveService()
@@ -0,0 +1,236 @@
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models import CloneFingerprint, Repository
+from app.utils.ast_parser import CodeChunk
+
+clone_clusters_total = metrics.counter("clone_clusters_found_total", "Clone clusters reported by analyses")
+clone_reviews_reused_total = metrics.counter(
+    "clone_reviews_reused_total", "Chunk reviews copied from a clone instead of calling the model, by where the clone is (local/external)"
+)
+
+# Keep IN lists and multi-row inserts well below driver/statement limits
+_QUERY_BATCH = 1000
+_INSERT_BATCH = 5000
+# Copies listed in a clone finding's comment; all of them are in its `copies`
+_LISTED_COPIES = 5
+
+# An indexed region elsewhere: (repository_id, path, start_line, end_line)
+Region = Tuple[int, str, int, int]
+
+
+class ClonePlan:
+    """Clones among the chunks of one analysis run, and between them and the owner's other repositories."""
+
+    def __init__(self, repository_id: int):
+        self.repository_id = repository_id
+        # id(chunk) -> an earlier chunk of the run whose review it reuses (same length, and identical or
+        # directly similar to it, not merely in the same cluster)
+        self.representative: Dict[int, CodeChunk] = {}
+        # id(chunk) -> review cache key of a near-identical region in another repository
+        self.external_keys: Dict[int, str] = {}
+        # (local chunks, external regions, lowest similarity in the cluster)
+        self.clusters: List[Tuple[List[CodeChunk], List[Region], float]] = []
+
+
+class CloneIndex:
+    """
+    Clone detection over the winnowed fingerprints of reviewed chunks (CodeChunk.fingerprints).
+
+    Two chunks are clones when they share at least CLONE_MIN_SIMILARITY of the larger one's
+    fingerprints. Within a run, clones are grouped into clusters; a copy that is as long as an
+    earlier member it is itself similar to reuses that member's review. Chunks are also matched
+    against the persisted index of the same user's other repositories (never other users', whose
+    code a finding would otherwise reveal), whose regions' reviews are reused through the review
+    cache. Each cluster is reported as one "duplicate_code" finding.
+    """
+
+    def plan(self, db: Session, repository_id: int, chunks: List[CodeChunk]) -> ClonePlan:
+        plan = ClonePlan(repository_id)
+        eligible = [c for c in chunks if c.fingerprints and len(c.fingerprints) >= settings.CLONE_MIN_FINGERPRINTS]
+        if not eligible:
+            return plan
+        sets = [set(c.fingerprints) for c in eligible]
+        postings: Dict[int, List[int]] = defaultdict(list)
+        for i, prints in enumerate(sets):
+            for f in prints:
+                postings[f].append(i)
+
+        # Local pairs, counted through shared fingerprints; boilerplate fingerprints are skipped
+        shared: Dict[Tuple[int, int], int] = defaultdict(int)
+        for members in postings.values():
+            if 1 < len(members) <= settings.CLONE_COMMON_FINGERPRINT_LIMIT:
+                for pair in combinations(members, 2):
+                    shared[pair] += 1
+        parent = list(range(len(eligible)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        similarity: Dict[int, float] = {}  # lowest similarity per cluster root, filled below
+        edges = []
+        adjacent: Dict[int, set] = defaultdict(set)
+        for (a, b), count in shared.items():
+            score = count / max(len(sets[a]), len(sets[b]))
+            if score >= settings.CLONE_MIN_SIMILARITY:
+                edges.append((a, b, score))
+                adjacent[a].add(b)
+                adjacent[b].add(a)
+                parent[find(a)] = find(b)
+
+        # Regions of the owner's other repositories
+        matches: Dict[int, Dict[Region, float]] = defaultdict(dict)
+        region_keys: Dict[Region, Optional[str]] = {}
+        for (i, region), (count, total, key) in self._external_counts(db, repository_id, postings).items():
+            region_keys[region] = key
+            score = count / max(len(sets[i]), total)
+            if score >= settings.CLONE_MIN_SIMILARITY:
+                matches[i][region] = score
+
+        clusters: Dict[int, List[int]] = defaultdict(list)
+        for i in range(len(eligible)):
+            clusters[find(i)].append(i)
+        for a, b, score in edges:
+            root = find(a)
+            similarity[root] = min(similarity.get(root, 1.0), score)
+
+        for root, members in clusters.items():
+            external: Dict[Region, float] = {}
+            for i in members:
+                for region, score in matches.get(i, {}).items():
+                    external[region] = max(external.get(region, 0.0), score)
+            if len(members) < 2 and not external:
+                continue
+            lowest = min([similarity.get(root, 1.0)] + list(external.values()))
+            local = [eligible[i] for i in members]
+            plan.clusters.append((local, sorted(external), lowest))
+
+            # A copy reuses the review of an equally long, earlier member it matches directly (clusters
+            # are transitive, so two members may have little in common); line offsets carry over
+            reviewers_of_length: Dict[int, List[int]] = defaultdict(list)
+            for i in members:
+                chunk = eligible[i]
+                candidates = reviewers_of_length[chunk.end_line - chunk.start_line]
+                match = next((j for j in candidates if j in adjacent[i] or eligible[j].text == chunk.text), None)
+                if match is not None:
+                    plan.representative[id(chunk)] = eligible[match]
+                else:
+                    candidates.append(i)
+            for i in members:
+                best = [
+                    (score, region) for region, score in matches.get(i, {}).items()
+                    if region_keys.get(region) and region[3] - region[2] == eligible[i].end_line - eligible[i].start_line
+                ]
+                if best:
+                    plan.external_keys[id(eligible[i])] = region_keys[max(best)[1]]
+        clone_clusters_total.inc(len(plan.clusters))
+        return plan
+
+    def _external_counts(
+        self, db: Session, repository_id: int, postings: Dict[int, List[int]],
+    ) -> Dict[Tuple[int, Region], Tuple[int, int, Optional[str]]]:
+        # (local chunk index, region) -> (shared fingerprints, region's fingerprint count, review key)
+        counts: Dict[Tuple[int, Region], Tuple[int, int, Optional[str]]] = {}
+        prints = list(postings)
+        owner = db.query(Repository.user_id).filter(Repository.id == repository_id).scalar()
+        if owner is None:
+            return counts
+        for i in range(0, len(prints), _QUERY_BATCH):
+            rows = (
+                db.query(
+                    CloneFingerprint.fingerprint, CloneFingerprint.repository_id, CloneFingerprint.path,
+                    CloneFingerprint.start_line, CloneFingerprint.end_line,
+                    CloneFingerprint.fingerprint_count, CloneFingerprint.review_key,
+                )
+                .join(Repository, Repository.id == CloneFingerprint.repository_id)
+                .filter(
+                    CloneFingerprint.fingerprint.in_(prints[i:i + _QUERY_BATCH]),
+                    CloneFingerprint.repository_id != repository_id,
+                    Repository.user_id == owner,
+                )
+                .all()
+            )
+            regions_of: Dict[int, list] = defaultdict(list)
+            for f, repo_id, path, start, end, total, key in rows:
+                regions_of[f].append(((repo_id, path, start, end), total, key))
+            for f, regions in regions_of.items():
+                if len(regions) > settings.CLONE_COMMON_FINGERPRINT_LIMIT:
+                    continue
+                for local in postings[f]:
+                    for region, total, key in regions:
+                        count = counts.get((local, region), (0, total, key))[0]
+                        counts[(local, region)] = (count + 1, total, key)
+        db.commit()
+        return counts
+
+    def findings(self, plan: ClonePlan) -> list:
+        """One "duplicate_code" suggestion per clone cluster, placed on its first chunk."""
+        findings = []
+        for local, external, lowest in plan.clusters:
+            first = local[0]
+            copies = [
+                {"repository_id": plan.repository_id, "file_path": c.path, "start_line": c.start_line, "end_line": c.end_line}
+                for c in local[1:]
+            ] + [
+                {"repository_id": repo_id, "file_path": path, "start_line": start, "end_line": end}
+                for repo_id, path, start, end in external
+            ]
+            listed = ", ".join(
+                (f"{c['file_path']}" if c["repository_id"] == plan.repository_id else f"repository {c['repository_id']}: {c['file_path']}")
+                + f":{c['start_line']}-{c['end_line']}"
+                for c in copies[:_LISTED_COPIES]
+            )
+            more = f" and {len(copies) - _LISTED_COPIES} more" if len(copies) > _LISTED_COPIES else ""
+            findings.append({
+                "file_path": first.path,
+                "line_number": first.start_line,
+                "severity": "info",
+                "category": "duplicate_code",
+                "comment": (
+                    f"Lines {first.start_line}-{first.end_line} are duplicated in {len(copies)} other "
+                    f"place{'s' if len(copies) != 1 else ''} (at least {lowest:.0%} similar): {listed}{more}. "
+                    "Consider extracting the shared code."
+                ),
+                "copies": copies,
+            })
+        return findings
+
+    def record(
+        self, db: Session, repository_id: int, analysis_id: int, chunks: List[CodeChunk], review_keys: Dict[int, str],
+    ) -> None:
+        """Replace the repository's indexed regions for the files of `chunks` with these chunks."""
+        paths = sorted({c.path for c in chunks})
+        for i in range(0, len(paths), _QUERY_BATCH):
+            db.query(CloneFingerprint).filter(
+                CloneFingerprint.repository_id == repository_id, CloneFingerprint.path.in_(paths[i:i + _QUERY_BATCH]),
+            ).delete(synchronize_session=False)
+        rows = [
+            {
+                "fingerprint": f,
+                "repository_id": repository_id,
+                "analysis_id": analysis_id,
+                "path": c.path,
+                "start_line": c.start_line,
+                "end_line": c.end_line,
+                "fingerprint_count": len(c.fingerprints),
+                "review_key": review_keys.get(id(c)),
+            }
+            for c in chunks
+            if c.fingerprints and len(c.fingerprints) >= settings.CLONE_MIN_FINGERPRINTS
+            for f in c.fingerprints
+        ]
+        for i in range(0, len(rows), _INSERT_BATCH):
+            db.execute(insert(CloneFingerprint), rows[i:i + _INSERT_BATCH])
+        db.commit()
+
+
+clone_index = CloneIndex()
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from typing import Iterable, Optional, Set
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+content_store_writes_total = metrics.counter("content_store_writes_total", "Blobs written to the content store, by result (stored/existing/rejected)")
+content_store_pruned_total = metrics.counter("content_store_pruned_total", "Unreferenced blobs deleted from the content store")
+
+
+class BlobRejected(ValueError):
+    """The bytes written to a BlobWriter did not match its declared size (or expected SHA)."""
+
+
+class BlobWriter:
+    """
+    Streams one blob into the content store, hashing it as written. The blob's git SHA needs its
+    size up front, so it is declared when opening the writer and enforced on close.
+    """
+
+    def __init__(self, store: "ContentStore", size: int, expected_sha: Optional[str] = None):
+        self.store = store
+        self.size = size
+        self.expected_sha = expected_sha
+        self.written = 0
+        self._hasher = hashlib.sha1(b"blob %d\0" % size)
+        os.makedirs(store.root, exist_ok=True)
+        self._fd, self._tmp = tempfile.mkstemp(dir=store.root, prefix=".incoming-")
+        self._file = os.fdopen(self._fd, "wb")
+
+    def write(self, data: bytes) -> None:
+        self.written += len(data)
+        if self.written > self.size:
+            raise BlobRejected(f"Blob is larger than its declared {self.size} bytes")
+        self._file.write(data)
+        self._hasher.update(data)
+
+    def commit(self) -> str:
+        """Move the blob into place and return its git SHA; an existing copy is kept."""
+        self._file.close()
+        sha = self._hasher.hexdigest()
+        try:
+            if self.written != self.size:
+                raise BlobRejected(f"Blob has {self.written} bytes, not the declared {self.size}")
+            if self.expected_sha and sha != self.expected_sha:
+                raise BlobRejected(f"Blob SHA is {sha}, not {self.expected_sha}")
+            path = self.store.path(sha)
+            if self.store.has(sha):
+                content_store_writes_total.inc(result="existing")
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(self._tmp, path)
+                content_store_writes_total.inc(result="stored")
+        except BlobRejected:
+            content_store_writes_total.inc(result="rejected")
+            raise
+        finally:
+            if os.path.exists(self._tmp):
+                os.remove(self._tmp)
+        return sha
+
+    def discard(self) -> None:
+        self._file.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+
+class ContentStore:
+    """
+    Files of uploaded snapshots, stored once on disk under CONTENT_STORE_DIR by git blob SHA
+    (the key the parse cache uses too), so identical files across uploads share one copy and
+    snapshots are checked out by hard-linking.
+
+    A blob's mtime records when it was last written or asked about (`has`, `missing`), so a blob
+    a client was just told the server has survives until the snapshot listing it is created;
+    `prune` deletes the unlisted ones unused for longer than a TTL.
+    """
+
+    @property
+    def root(self) -> str:
+        return settings.CONTENT_STORE_DIR
+
+    def path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha[2:])
+
+    def has(self, sha: str) -> bool:
+        try:
+            os.utime(self.path(sha))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def missing(self, shas: Iterable[str]) -> Set[str]:
+        return {sha for sha in set(shas) if not self.has(sha)}
+
+    def writer(self, size: int, expected_sha: Optional[str] = None) -> BlobWriter:
+        return BlobWriter(self, size, expected_sha)
+
+    def link(self, sha: str, dest: str) -> None:
+        """Place the blob at `dest`, by hard link where the filesystem allows it."""
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            os.link(self.path(sha), dest)
+        except OSError:
+            shutil.copyfile(self.path(sha), dest)
+
+    def prune(self, referenced: Set[str], max_age: float) -> int:
+        """Delete blobs (and abandoned partial writes) not in `referenced` and unused for `max_age` seconds."""
+        if not os.path.isdir(self.root):
+            return 0
+        cutoff = time.time() - max_age
+        removed = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            prefix = os.path.relpath(dirpath, self.root)
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if prefix + name in referenced:
+                    continue
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        removed += not name.startswith(".incoming-")
+                except FileNotFoundError:
+                    pass  # removed concurrently
+        content_store_pruned_total.inc(removed)
+        return removed
+
+
+content_store = ContentStore()
@@ -0,0 +1,160 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models import AnalysisPriority
+from app.services.review_cache import review_cache
+from app.utils.ast_parser import CodeChunk, chunk_file
+from app.utils.diff_parser import FilePatch, PatchRejected, apply_patch, hunk_regions, parse_unified_diff
+from app.utils.helpers import detect_language, read_text
+
+diff_regions_total = metrics.counter(
+    "diff_review_regions_total", "Regions of diffs selected for review, by how their review was obtained (cache/model)"
+)
+
+
+class DiffRejected(ValueError):
+    """The diff is malformed, does not apply to its base, or needs a base file that was not given."""
+
+
+@dataclass
+class DiffReview:
+    regions: List[CodeChunk] = field(default_factory=list)
+    # Per file: new-file lines the diff added or changed
+    changed: Dict[str, Set[int]] = field(default_factory=dict)
+    suggestions: List[dict] = field(default_factory=list)
+    files: int = 0
+    skipped: List[str] = field(default_factory=list)  # deleted, binary or non-source files
+    reviewed: int = 0  # regions sent to the model; the rest came from the review cache
+
+
+class DiffReviewService:
+    """
+    Reviews only what a unified diff changed.
+
+    Each file's patch is applied to its base (given by the client, or read from a checkout of
+    the repository at the base ref), the new file is chunked along its declarations, and only
+    the chunks containing changed lines are reviewed: a change inside a function is reviewed
+    as that function, a change among module-level statements as the changed lines with
+    DIFF_CONTEXT_LINES around them. Without a base, the hunks' own context is all there is to
+    review. Regions share the per-chunk review cache with repository analyses, so re-posting a
+    diff or reviewing a change already analyzed in its repository costs no model call.
+    """
+
+    def review(
+        self, db: Session, diff: str, base_files: Optional[Dict[str, str]] = None, repo=None, base_ref: Optional[str] = None,
+    ) -> DiffReview:
+        from app.services.repository_services import repository_service  # lazy import to avoid circulars
+
+        result = DiffReview()
+        base_files = base_files or {}
+        with ExitStack() as stack:
+            workdir = None
+            try:
+                for patch in parse_unified_diff(io.StringIO(diff)):
+                    language = detect_language(patch.path) if patch.new_path else None
+                    if patch.binary or language is None or not patch.hunks:
+                        result.skipped.append(patch.path)
+                        continue
+                    base = None
+                    if patch.old_path is None:
+                        base = ""
+                    elif patch.old_path in base_files:
+                        base = base_files[patch.old_path]
+                    elif repo is not None:
+                        if workdir is None:
+                            try:
+                                workdir = stack.enter_context(repository_service.checkout(repo, base_ref or "main"))
+                            except RuntimeError as e:
+                                raise DiffRejected(f"Could not read the base files: {e}")
+                        base = self._read_base(workdir, patch.old_path)
+                    result.files += 1
+                    self._select(result, patch, language, base)
+            except PatchRejected as e:
+                raise DiffRejected(str(e))
+        self._review(db, result)
+        return result
+
+    def _read_base(self, workdir: str, path: str) -> str:
+        full = os.path.realpath(os.path.join(workdir, *path.split("/")))
+        if not full.startswith(os.path.realpath(workdir) + os.sep) or not os.path.isfile(full):
+            raise DiffRejected(f"{path} does not exist at the base ref")
+        text = read_text(full)
+        if text is None:
+            raise DiffRejected(f"{path} is binary at the base ref")
+        return text
+
+    def _select(self, result: DiffReview, patch: FilePatch, language: str, base: Optional[str]) -> None:
+        # Add the regions of one file that contain changed lines
+        path = patch.new_path
+        if base is None:
+            for start, text, added, removed_at in hunk_regions(patch):
+                end = start + text.count("\n")
+                if added or removed_at:
+                    result.regions.append(CodeChunk(path, language, start, end, text, "hunk"))
+                    result.changed.setdefault(path, set()).update(added)
+            return
+        text, added, removed_at = apply_patch(patch, base)
+        touched = added | removed_at
+        if not touched:
+            return
+        result.changed.setdefault(path, set()).update(added)
+        lines = text.split("\n")
+        for chunk in chunk_file(path, text, language, settings.DIFF_MAX_CHUNK_LINES):
+            inside = sorted(line for line in touched if chunk.start_line <= line <= chunk.end_line)
+            if not inside:
+                continue
+            if chunk.kind in ("module", "block"):
+                # Module-level statements are not one unit; keep the changed lines and some context
+                chunk.start_line = max(chunk.start_line, inside[0] - settings.DIFF_CONTEXT_LINES)
+                chunk.end_line = min(chunk.end_line, inside[-1] + settings.DIFF_CONTEXT_LINES)
+                chunk.text = "\n".join(lines[chunk.start_line - 1:chunk.end_line])
+            result.regions.append(chunk)
+
+    def _review(self, db: Session, result: DiffReview) -> None:
+        from app.services.ai_service import AIService, aiservice  # lazy import to avoid circulars
+        from app.services.analysis_service import analysis_service
+
+        keys = {id(chunk): review_cache.chunk_key(chunk) for chunk in result.regions}
+        reviews = review_cache.lookup(db, set(keys.values()), AIService.PROMPT_VERSION, aiservice.model_name) if keys else {}
+        db.commit()
+        to_review = list({keys[id(c)]: c for c in result.regions if keys[id(c)] not in reviews}.values())
+        diff_regions_total.inc(len(result.regions) - len(to_review), source="cache")
+        diff_regions_total.inc(len(to_review), source="model")
+
+        def review(chunk: CodeChunk):
+            return chunk, aiservice.review_code(
+                chunk.numbered_text(), priority=AnalysisPriority.INTERACTIVE.value, file_path=chunk.path,
+            )
+
+        if to_review:
+            fresh = []
+            with ThreadPoolExecutor(max_workers=min(settings.DIFF_MAX_PARALLEL_REVIEWS, len(to_review))) as pool:
+                for chunk, reviewed in pool.map(review, to_review):
+                    key = keys[id(chunk)]
+                    reviews[key] = review_cache.compact(chunk, analysis_service._place_suggestions(chunk, reviewed.suggestions))
+                    if reviewed.cacheable:
+                        fresh.append({
+                            "content_hash": key,
+                            "prompt_version": AIService.PROMPT_VERSION,
+                            "model_name": aiservice.model_name,
+                            "suggestions": reviews[key],
+                        })
+            try:
+                review_cache.store(fresh)
+            except Exception as e:
+                print(f"[DiffReviewService] Failed to store {len(fresh)} chunk reviews: {e}")
+        result.reviewed = len(to_review)
+
+        for chunk in result.regions:
+            result.suggestions.extend(review_cache.expand(chunk, reviews[keys[id(chunk)]]))
+
+
+diff_review_service = DiffReviewService()
@@ -0,0 +1,362 @@
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import metrics
+from app.models import Analysis, AnalysisPriority, Repository, User
+from app.services.analysis_service import analysis_service
+from app.services.job_control import job_registry
+from app.services.sharding import shard_service
+from app.services.llm_limiter import PRIORITY_ORDER
+
+queue_wait_seconds = metrics.histogram(
+    "analysis_queue_wait_seconds",
+    "Time analyses spent pending before a worker picked them up, per priority class and owner's role",
+)
+# Tenants are broken down by role (bounded, and what weights and caps are set per) rather than by user id
+jobs_dispatched_total = metrics.counter(
+    "analysis_jobs_dispatched_total", "Analyses handed to a worker, per priority class and owner's role"
+)
+jobs_running = metrics.gauge("analysis_jobs_running", "Analyses currently running in this process")
+jobs_requeued_total = metrics.counter("analysis_jobs_requeued_total", "Running analyses whose worker stopped heartbeating, by outcome")
+cap_conflicts_total = metrics.counter(
+    "analysis_claim_cap_conflicts_total", "Picks dropped because another dispatcher filled the user's or repository's cap first"
+)
+
+# pg advisory lock classes (first key of the two-key form) serializing claims per user and per repository
+_USER_CLAIM_LOCK = int.from_bytes(b"CNus", "big") & 0x7FFFFFFF
+_REPO_CLAIM_LOCK = int.from_bytes(b"CNrp", "big") & 0x7FFFFFFF
+
+
+class AnalysisDispatcher:
+    """
+    Pulls pending analyses from the database and runs them on a pool of worker threads.
+
+    Higher priority classes always go first. Some worker threads are reserved for the interactive
+    and normal classes (ANALYSIS_RESERVED_WORKERS) so they never wait behind bulk scans; the
+    remaining threads serve any class, which lets bulk work soak up idle capacity.
+
+    Within a class, jobs are picked with start-time fair queuing: each user (Repository.user_id)
+    carries a virtual finish time that advances by 1/weight per dispatched job, with the weight taken
+    from the user's role, and the user with the earliest start tag goes next. Repositories of the same user are
+    interleaved the same way with equal weights. Per-user and per-repository concurrency caps are
+    checked against in_progress rows, and checked again when claiming under Postgres advisory locks
+    on the user and the repository, so they hold across every process sharing the database.
+    Interactive jobs are exempt from those caps but have their own, smaller per-user cap
+    (ANALYSIS_INTERACTIVE_MAX_RUNNING_PER_USER), so asking for the interactive class cannot be
+    used to get around fair share.
+
+    Every process heartbeats the analyses it runs. An in_progress analysis whose heartbeat is older
+    than ANALYSIS_LEASE_SECONDS lost its worker; it is put back to pending with `attempts` bumped and
+    resumes from its checkpointed chunks, or fails once ANALYSIS_MAX_ATTEMPTS is reached.
+
+    A worker with nothing to claim helps review shards of large running analyses (see ShardService).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._heartbeat: Optional[threading.Thread] = None
+        # Virtual clock and per-tenant finish tags for start-time fair queuing
+        self._vclock = 0.0
+        self._user_finish: Dict[int, float] = defaultdict(float)
+        self._repo_finish: Dict[int, float] = defaultdict(float)
+
+    def start(self, workers: Optional[int] = None) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i, lanes in enumerate(self._worker_lanes(workers or settings.ANALYSIS_WORKERS)):
+            t = threading.Thread(target=self._worker_loop, args=(lanes,), name=f"analysis-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        self.start_heartbeat()
+        print(f"[Dispatcher] Started {len(self._threads)} analysis workers")
+
+    def start_heartbeat(self) -> None:
+        """Heartbeat analyses running in this process; also needed without workers (inline /trigger-sync runs)."""
+        if self._heartbeat is not None:
+            return
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="analysis-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self.notify()
+        for t in self._threads + ([self._heartbeat] if self._heartbeat else []):
+            t.join(timeout=timeout)
+        self._threads = []
+        self._heartbeat = None
+        shard_service.prune_checkouts(max_idle=0)
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(settings.ANALYSIS_HEARTBEAT_SECONDS):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"[Dispatcher] Heartbeat failed: {e}")
+
+    def heartbeat(self) -> None:
+        ids = job_registry.ids()
+        if not ids:
+            return
+        db = SessionLocal()
+        try:
+            db.query(Analysis).filter(Analysis.id.in_(ids), Analysis.status == "in_progress").update(
+                {Analysis.heartbeat_at: datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+            shard_service.heartbeat(db)
+        finally:
+            db.close()
+
+    def _worker_lanes(self, workers: int) -> List[List[str]]:
+        """Priority classes each worker thread may serve; reserved threads also serve higher classes."""
+        lanes = []
+        for rank, priority in enumerate(PRIORITY_ORDER):
+            for _ in range(settings.ANALYSIS_RESERVED_WORKERS.get(priority, 0)):
+                if len(lanes) < workers - 1:  # always keep one thread that serves every class
+                    lanes.append(PRIORITY_ORDER[: rank + 1])
+        while len(lanes) < workers:
+            lanes.append(list(PRIORITY_ORDER))
+        return lanes
+
+    def notify(self) -> None:
+        """Wake idle workers, e.g. right after a job was enqueued."""
+        with self._wake:
+            self._wake.notify_all()
+
+    def _worker_loop(self, lanes: List[str]) -> None:
+        while not self._stop.is_set():
+            analysis_id = None
+            try:
+                analysis_id = self.claim_next(lanes)
+            except Exception as e:
+                print(f"[Dispatcher] Failed to claim next analysis: {e}")
+            if analysis_id is None:
+                # Nothing queued: help with a shard of a running analysis instead of idling
+                if settings.ANALYSIS_SHARDING_ENABLED and self._steal_shard(lanes):
+                    continue
+                with self._wake:
+                    self._wake.wait(timeout=settings.ANALYSIS_POLL_INTERVAL_SECONDS)
+                continue
+            self._run(analysis_id)
+
+    def _steal_shard(self, lanes: List[str]) -> bool:
+        db = SessionLocal()
+        try:
+            claimed = shard_service.claim(db, lanes=lanes)
+            if claimed is None:
+                return False
+            jobs_running.inc()
+            try:
+                shard_service.run_stolen(db, *claimed)
+            finally:
+                jobs_running.dec()
+            return True
+        except Exception as e:
+            print(f"[Dispatcher] Failed to run a shard: {e}")
+            return False
+        finally:
+            db.close()
+
+    def _run(self, analysis_id: int) -> None:
+        jobs_running.inc()
+        db = SessionLocal()
+        try:
+            analysis_service.run_code_analysis(analysis_id, db)
+        except Exception as e:
+            print(f"[Dispatcher] Analysis {analysis_id} failed: {e}")
+        finally:
+            db.close()
+            jobs_running.dec()
+
+    def claim_next(self, lanes: Optional[List[str]] = None) -> Optional[int]:
+        """
+        Pick the next pending analysis among the `lanes` priority classes (default: all), by
+        priority and then fair share, and mark it in_progress. Returns its id.
+        """
+        lanes = lanes or list(PRIORITY_ORDER)
+        with self._lock:
+            db = SessionLocal()
+            try:
+                self._expire_overdue(db)
+                self._requeue_abandoned(db)
+                # A competing process may claim our pick first; re-select a few times before giving up
+                for _ in range(3):
+                    pick = self._select(db, lanes)
+                    if pick is None:
+                        return None
+                    analysis_id, repo_id, user_id, role_name, priority, created_at, start_tag, weight = pick
+                    if self._claim(db, analysis_id, repo_id, user_id, role_name, priority):
+                        self._vclock = start_tag
+                        self._user_finish[user_id] = start_tag + 1.0 / weight
+                        self._repo_finish[repo_id] = max(self._vclock, self._repo_finish[repo_id]) + 1.0
+                        wait = (datetime.utcnow() - created_at).total_seconds() if created_at else 0.0
+                        queue_wait_seconds.observe(wait, priority=priority, role=role_name)
+                        jobs_dispatched_total.inc(priority=priority, role=role_name)
+                        return analysis_id
+                return None
+            finally:
+                db.close()
+
+    def _within_caps(self, role_name: str, priority: str, user_running: int, user_interactive: int, repo_running: int) -> bool:
+        if priority == AnalysisPriority.INTERACTIVE.value:
+            # Interactive jobs skip the role and repository caps, but only so many of a user's run at once
+            return user_interactive < settings.ANALYSIS_INTERACTIVE_MAX_RUNNING_PER_USER
+        user_cap = settings.ANALYSIS_ROLE_MAX_RUNNING.get(role_name)
+        if user_cap is not None and user_running >= user_cap:
+            return False
+        return repo_running < settings.ANALYSIS_MAX_RUNNING_PER_REPO
+
+    def _claim(self, db: Session, analysis_id: int, repo_id: int, user_id: int, role_name: str, priority: str) -> bool:
+        # Mark the pick in_progress if it is still pending and still within its caps. The counts
+        # _select saw may be stale by now; the advisory locks (held until commit, always user
+        # before repository) make recount and claim one step for every dispatcher in the fleet.
+        db.execute(text("SELECT pg_advisory_xact_lock(:space, :id)"), {"space": _USER_CLAIM_LOCK, "id": user_id})
+        db.execute(text("SELECT pg_advisory_xact_lock(:space, :id)"), {"space": _REPO_CLAIM_LOCK, "id": repo_id})
+        running = db.query(Analysis.id).join(Repository, Repository.id == Analysis.repository_id).filter(
+            Analysis.status == "in_progress"
+        )
+        by_user = running.filter(Repository.user_id == user_id)
+        if not self._within_caps(
+            role_name, priority,
+            by_user.count(),
+            by_user.filter(Analysis.priority == AnalysisPriority.INTERACTIVE.value).count(),
+            running.filter(Analysis.repository_id == repo_id).count(),
+        ):
+            db.rollback()
+            cap_conflicts_total.inc()
+            return False
+        claimed = (
+            db.query(Analysis)
+            .filter(Analysis.id == analysis_id, Analysis.status == "pending")
+            .update(
+                {Analysis.status: "in_progress", Analysis.started_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return bool(claimed)
+
+    def _expire_overdue(self, db: Session) -> None:
+        # Pending analyses past their deadline would only be abandoned once started; drop them now
+        expired = (
+            db.query(Analysis)
+            .filter(Analysis.status == "pending", Analysis.deadline_at < datetime.utcnow())
+            .update(
+                {
+                    Analysis.status: "cancelled",
+                    Analysis.cancel_reason: "deadline_exceeded",
+                    Analysis.completed_at: datetime.utcnow(),
+                    Analysis.dedup_key: None,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if expired:
+            print(f"[Dispatcher] Cancelled {expired} pending analyses past their deadline")
+
+    def _requeue_abandoned(self, db: Session) -> None:
+        now = datetime.utcnow()
+        stale = (
+            Analysis.status == "in_progress",
+            func.coalesce(Analysis.heartbeat_at, Analysis.started_at, Analysis.created_at)
+            < now - timedelta(seconds=settings.ANALYSIS_LEASE_SECONDS),
+        )
+        exhausted = Analysis.attempts + 1 >= settings.ANALYSIS_MAX_ATTEMPTS
+        failed = (
+            db.query(Analysis)
+            .filter(*stale, exhausted)
+            .update(
+                {
+                    Analysis.status: "failed",
+                    Analysis.results: {"error": "Worker lost too many times"},
+                    Analysis.completed_at: now,
+                    Analysis.dedup_key: None,
+                },
+                synchronize_session=False,
+            )
+        )
+        # Bumping attempts fences off the old run should it still be alive; its writes stop matching
+        requeued = (
+            db.query(Analysis)
+            .filter(*stale, ~exhausted)
+            .update(
+                {Analysis.status: "pending", Analysis.attempts: Analysis.attempts + 1, Analysis.heartbeat_at: None},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if requeued:
+            jobs_requeued_total.inc(requeued, outcome="requeued")
+            print(f"[Dispatcher] Requeued {requeued} analyses whose worker stopped heartbeating")
+        if failed:
+            jobs_requeued_total.inc(failed, outcome="failed")
+            print(f"[Dispatcher] Failed {failed} analyses that lost their worker {settings.ANALYSIS_MAX_ATTEMPTS} times")
+
+    def _select(self, db: Session, lanes: List[str]) -> Optional[Tuple[int, int, int, str, str, datetime, float, float]]:
+        # Oldest pending analysis of every (repository, priority class), with the owning user and role
+        candidates = (
+            db.query(
+                Analysis.id, Analysis.repository_id, Analysis.priority, Analysis.created_at,
+                Repository.user_id, User.role,
+            )
+            .join(Repository, Repository.id == Analysis.repository_id)
+            .join(User, User.id == Repository.user_id)
+            .filter(
+                Analysis.status == "pending",
+                Analysis.priority.in_(lanes),
+                or_(Analysis.not_before.is_(None), Analysis.not_before <= datetime.utcnow()),
+            )
+            .distinct(Analysis.repository_id, Analysis.priority)
+            .order_by(Analysis.repository_id, Analysis.priority, Analysis.created_at, Analysis.id)
+            .all()
+        )
+        if not candidates:
+            return None
+
+        running_by_user: Dict[int, int] = defaultdict(int)
+        interactive_by_user: Dict[int, int] = defaultdict(int)
+        running_by_repo: Dict[int, int] = defaultdict(int)
+        running = (
+            db.query(Repository.user_id, Analysis.repository_id, Analysis.priority, func.count(Analysis.id))
+            .join(Repository, Repository.id == Analysis.repository_id)
+            .filter(Analysis.status == "in_progress")
+            .group_by(Repository.user_id, Analysis.repository_id, Analysis.priority)
+            .all()
+        )
+        for user_id, repo_id, priority, count in running:
+            running_by_user[user_id] += count
+            running_by_repo[repo_id] += count
+            if priority == AnalysisPriority.INTERACTIVE.value:
+                interactive_by_user[user_id] += count
+
+        best = None
+        for analysis_id, repo_id, priority, created_at, user_id, role in candidates:
+            role_name = role.value if role is not None else "guest"
+            if not self._within_caps(
+                role_name, priority, running_by_user[user_id], interactive_by_user[user_id], running_by_repo[repo_id],
+            ):
+                continue
+            rank = PRIORITY_ORDER.index(priority) if priority in PRIORITY_ORDER else len(PRIORITY_ORDER)
+            weight = max(settings.ANALYSIS_ROLE_WEIGHTS.get(role_name, 1.0), 1e-6)
+            start_tag = max(self._vclock, self._user_finish[user_id])
+            repo_tag = max(self._vclock, self._repo_finish[repo_id])
+            key = (rank, start_tag, repo_tag, created_at or datetime.min, analysis_id)
+            if best is None or key < best[0]:
+                best = (key, (analysis_id, repo_id, user_id, role_name, priority, created_at, start_tag, weight))
+        return best[1] if best else None
+
+
+dispatcher = AnalysisDispatcher()
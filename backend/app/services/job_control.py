@@ -0,0 +1,155 @@
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+
+class JobCancelled(Exception):
+    """Raised inside a running analysis once it was cancelled or ran past its deadline."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class ProgressTracker:
+    """
+    In-memory progress counters of a running analysis, flushed through `flush` in batches.
+
+    Counters are updated on every chunk but only written out when `flush_interval` seconds have
+    passed since the last write (or when forced), so progress reporting stays off the hot path.
+    """
+
+    def __init__(self, flush: Callable[[Dict[str, int]], None], flush_interval: float):
+        self._flush = flush
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._dirty = False
+        self.values: Dict[str, int] = {"files_done": 0, "chunks_done": 0, "tokens_used": 0}
+
+    def set_totals(self, files: int, chunks: int) -> None:
+        with self._lock:
+            self.values["files_total"] = files
+            self.values["chunks_total"] = chunks
+        self.flush(force=True)
+
+    def add(self, files_done: int = 0, chunks_done: int = 0, tokens_used: int = 0) -> None:
+        with self._lock:
+            self.values["files_done"] += files_done
+            self.values["chunks_done"] += chunks_done
+            self.values["tokens_used"] += tokens_used
+            self._dirty = True
+        self.flush()
+
+    def flush(self, force: bool = False) -> None:
+        with self._lock:
+            if not force and (not self._dirty or time.monotonic() - self._last_flush < self._flush_interval):
+                return
+            snapshot = dict(self.values)
+            self._dirty = False
+            self._last_flush = time.monotonic()
+        try:
+            self._flush(snapshot)
+        except Exception as e:
+            # Progress is best effort; never fail the analysis over it
+            print(f"[ProgressTracker] Failed to flush progress: {e}")
+
+
+class JobContext:
+    """
+    Cancellation, deadline and progress state of one running analysis, passed down to every stage.
+
+    Cancellation requested in this process is seen immediately; cancellation recorded in the
+    database by another process is picked up through `poll_cancel_reason`, at most once per
+    `poll_interval` seconds so checking between chunks stays cheap.
+    """
+
+    def __init__(
+        self,
+        analysis_id: Optional[int] = None,
+        deadline: Optional[datetime] = None,
+        poll_cancel_reason: Optional[Callable[[], Optional[str]]] = None,
+        poll_interval: float = 1.0,
+        progress: Optional[ProgressTracker] = None,
+    ):
+        self.analysis_id = analysis_id
+        self.deadline = deadline
+        self.progress = progress
+        self._poll = poll_cancel_reason
+        self._poll_interval = poll_interval
+        self._last_poll = 0.0
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline, or None when the job has no deadline."""
+        if self.deadline is None:
+            return None
+        return (self.deadline - datetime.utcnow()).total_seconds()
+
+    def is_done(self) -> bool:
+        if self._event.is_set():
+            return True
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self.cancel("deadline_exceeded")
+            return True
+        if self._poll is not None and time.monotonic() - self._last_poll >= self._poll_interval:
+            self._last_poll = time.monotonic()
+            reason = self._poll()
+            if reason:
+                self.cancel(reason)
+                return True
+        return False
+
+    def raise_if_done(self) -> None:
+        if self.is_done():
+            raise JobCancelled(self.reason or "cancelled")
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to `timeout` seconds, waking early on local cancellation. Returns is_done()."""
+        self._event.wait(timeout)
+        return self.is_done()
+
+
+class JobRegistry:
+    """
+    Contexts of the analyses running in this process, so a cancel request can reach them directly.
+    A sharded analysis may have several contexts here (its coordinator and any shards run locally).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, List[JobContext]] = {}
+
+    def register(self, ctx: JobContext) -> None:
+        with self._lock:
+            self._jobs.setdefault(ctx.analysis_id, []).append(ctx)
+
+    def unregister(self, ctx: JobContext) -> None:
+        with self._lock:
+            contexts = self._jobs.get(ctx.analysis_id, [])
+            if ctx in contexts:
+                contexts.remove(ctx)
+            if not contexts:
+                self._jobs.pop(ctx.analysis_id, None)
+
+    def ids(self) -> List[int]:
+        with self._lock:
+            return list(self._jobs)
+
+    def cancel(self, analysis_id: int, reason: str) -> bool:
+        with self._lock:
+            contexts = list(self._jobs.get(analysis_id, []))
+        for ctx in contexts:
+            ctx.cancel(reason)
+        return bool(contexts)
+
+
+job_registry = JobRegistry()
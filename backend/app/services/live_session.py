@@ -0,0 +1,254 @@
+import ast
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models import AnalysisPriority
+from app.services.review_cache import review_cache
+from app.utils.ast_parser import CodeChunk, chunk_file
+
+live_sessions_active = metrics.gauge("live_sessions_active", "Open live-analysis sessions in this process")
+live_chunks_total = metrics.counter(
+    "live_session_chunks_total", "Chunks of live-analysis buffers after an update, by how their review was obtained (session/cache/model)"
+)
+
+# Reviews of buffers (not repository files) are placed on this path unless the client names one
+_DEFAULT_FILENAME = "buffer"
+
+
+class LiveSessionNotFound(Exception):
+    """The session expired, was closed, or lives in another API process."""
+
+
+class LiveSessionConflict(Exception):
+    """An edit batch was based on an older version of the buffer than the session holds."""
+
+    def __init__(self, version: int):
+        super().__init__(f"Session is at version {version}; resend the buffer or edits based on it")
+        self.version = version
+
+
+class InvalidEdit(ValueError):
+    """An edit's range lies outside the buffer."""
+
+
+class LiveSession:
+    """
+    An editor buffer under review, with its current chunk map and each chunk's review.
+
+    Reviews are held per chunk key (content and language), relative to the chunk's first line,
+    so a chunk that only moved keeps its review and its diagnostics keep their ids.
+    """
+
+    def __init__(self, session_id: str, language: str, filename: Optional[str], text: str):
+        self.id = session_id
+        self.language = language
+        self.filename = filename or _DEFAULT_FILENAME
+        self.text = text
+        self.version = 0
+        self.chunks: List[CodeChunk] = []
+        self.reviews: Dict[str, list] = {}  # chunk key -> suggestions relative to the chunk (see ReviewCache.compact)
+        self.diagnostics: Dict[str, dict] = {}  # id -> diagnostic, as last returned to the client
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+
+class LiveSessionManager:
+    """
+    Live analysis of editor buffers. A client opens a session with its buffer and then sends
+    only its edits; each update re-chunks the buffer, reviews only the chunks whose text is new
+    (the edited functions) and answers with what changed in the diagnostics.
+
+    Unchanged chunks keep their review from the session, or from the per-chunk review cache
+    shared with repository analyses, which new reviews are also written to. While a Python
+    buffer does not parse (mid-edit), the previous chunk boundaries are shifted by the edits
+    instead of falling back to line windows, so one typo does not re-review the whole buffer.
+
+    Sessions live in memory in the API process that opened them, expire after
+    LIVE_SESSION_TTL_SECONDS without use and are evicted least-recently-used beyond
+    LIVE_SESSION_MAX; a client whose session is gone opens a new one.
+    """
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, LiveSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, db: Session, text: str, language: str, filename: Optional[str] = None) -> Tuple[LiveSession, dict]:
+        session = LiveSession(uuid.uuid4().hex, language, filename, text)
+        with session.lock:
+            with self._lock:
+                self._expire()
+                self._sessions[session.id] = session
+                while len(self._sessions) > settings.LIVE_SESSION_MAX:
+                    self._sessions.popitem(last=False)
+                live_sessions_active.set(len(self._sessions))
+            diff = self._refresh(db, session, chunk_file(session.filename, text, language, settings.ANALYSIS_MAX_CHUNK_LINES))
+        return session, diff
+
+    def get(self, session_id: str) -> LiveSession:
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise LiveSessionNotFound(session_id)
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session
+
+    def close(self, session_id: str) -> None:
+        with self._lock:
+            if self._sessions.pop(session_id, None) is None:
+                raise LiveSessionNotFound(session_id)
+            live_sessions_active.set(len(self._sessions))
+
+    def apply_edits(self, db: Session, session_id: str, base_version: int, edits: List[dict]) -> Tuple[LiveSession, dict]:
+        """
+        Apply `edits` (dicts with 1-based start_line, start_column, end_line, end_column and the
+        replacement text, applied in order, each to the result of the previous one) and review
+        what they changed. Raises LiveSessionConflict when `base_version` is not the session's.
+        """
+        session = self.get(session_id)
+        with session.lock:
+            if base_version != session.version:
+                raise LiveSessionConflict(session.version)
+            lines = session.text.split("\n")
+            bounds = [(c.start_line, c.end_line, c.kind, c.name) for c in session.chunks]
+            for edit in edits:
+                lines, bounds = self._apply(lines, bounds, edit)
+            if len(lines) - 1 + sum(len(line) for line in lines) > settings.LIVE_SESSION_MAX_CHARS:
+                raise InvalidEdit(f"Buffer would exceed {settings.LIVE_SESSION_MAX_CHARS} characters")
+            session.text = "\n".join(lines)
+            session.version += 1
+            if self._parses(session.text, session.language):
+                chunks = chunk_file(session.filename, session.text, session.language, settings.ANALYSIS_MAX_CHUNK_LINES)
+            else:
+                chunks = [
+                    CodeChunk(session.filename, session.language, s, e, "\n".join(lines[s - 1:e]), kind, name)
+                    for s, e, kind, name in bounds
+                ]
+            return session, self._refresh(db, session, chunks)
+
+    def _apply(self, lines: List[str], bounds: list, edit: dict) -> Tuple[List[str], list]:
+        # Replace the edit's range and shift the chunk boundaries after it; chunks it touches grow to cover it
+        start_line, end_line = edit["start_line"], edit["end_line"]
+        if not (1 <= start_line <= end_line <= len(lines)):
+            raise InvalidEdit(f"Lines {start_line}-{end_line} are outside the buffer (1-{len(lines)})")
+        start_col, end_col = edit["start_column"], edit["end_column"]
+        if not (1 <= start_col <= len(lines[start_line - 1]) + 1 and 1 <= end_col <= len(lines[end_line - 1]) + 1):
+            raise InvalidEdit(f"Columns of the edit at line {start_line} are outside the buffer")
+        if start_line == end_line and end_col < start_col:
+            raise InvalidEdit(f"The edit at line {start_line} ends before it starts")
+        head = lines[start_line - 1][:start_col - 1]
+        tail = lines[end_line - 1][end_col - 1:]
+        inserted = (head + edit["text"] + tail).split("\n")
+        new_end = start_line + len(inserted) - 1
+        delta = new_end - end_line
+        shifted = []
+        for s, e, kind, name in bounds:
+            if e < start_line:
+                shifted.append((s, e, kind, name))
+            elif s > end_line:
+                shifted.append((s + delta, e + delta, kind, name))
+            else:
+                shifted.append((min(s, start_line), max(e + delta, new_end), kind, name))
+        return lines[:start_line - 1] + inserted + lines[end_line:], shifted
+
+    def _parses(self, text: str, language: str) -> bool:
+        # Only the Python chunker gives up on unparsable input; the generic one is tolerant
+        if language != "python":
+            return True
+        try:
+            ast.parse(text)
+        except (SyntaxError, ValueError):
+            return False
+        return True
+
+    def _refresh(self, db: Session, session: LiveSession, chunks: List[CodeChunk]) -> dict:
+        # Review the chunks without a review, then diff the diagnostics against the last ones sent
+        from app.services.ai_service import AIService, aiservice  # lazy import to avoid circulars
+        from app.services.analysis_service import analysis_service
+
+        keys = {id(chunk): review_cache.chunk_key(chunk) for chunk in chunks}
+        missing = [key for key in keys.values() if key not in session.reviews]
+        cached = review_cache.lookup(db, missing, AIService.PROMPT_VERSION, aiservice.model_name) if missing else {}
+        db.commit()
+        session.reviews.update(cached)
+        to_review = list({keys[id(c)]: c for c in chunks if keys[id(c)] not in session.reviews}.values())
+        live_chunks_total.inc(len(chunks) - len(to_review) - len(cached), source="session")
+        live_chunks_total.inc(len(cached), source="cache")
+        live_chunks_total.inc(len(to_review), source="model")
+
+        def review(chunk: CodeChunk):
+            result = aiservice.review_code(
+                chunk.numbered_text(), priority=AnalysisPriority.INTERACTIVE.value, file_path=chunk.path,
+            )
+            return chunk, result
+
+        if to_review:
+            fresh = []
+            with ThreadPoolExecutor(max_workers=min(settings.LIVE_SESSION_MAX_PARALLEL_REVIEWS, len(to_review))) as pool:
+                for chunk, result in pool.map(review, to_review):
+                    key = keys[id(chunk)]
+                    session.reviews[key] = review_cache.compact(chunk, analysis_service._place_suggestions(chunk, result.suggestions))
+                    if result.cacheable:
+                        fresh.append({
+                            "content_hash": key,
+                            "prompt_version": AIService.PROMPT_VERSION,
+                            "model_name": aiservice.model_name,
+                            "suggestions": session.reviews[key],
+                        })
+            try:
+                review_cache.store(fresh)
+            except Exception as e:
+                # The cache is shared with repository analyses; a failed write only costs a later review
+                print(f"[LiveSessionManager] Failed to store {len(fresh)} chunk reviews: {e}")
+
+        # Reviews of chunks no longer in the buffer are dropped; an undo brings them back from the cache
+        live = set(keys.values())
+        session.reviews = {key: review for key, review in session.reviews.items() if key in live}
+        session.chunks = chunks
+
+        # Ids name the chunk's content, which copy of it this is (copy-pasted code shares a key), and
+        # the finding, so they stay put when a chunk only moves
+        diagnostics: Dict[str, dict] = {}
+        copies: Dict[str, int] = defaultdict(int)
+        for chunk in chunks:
+            key = keys[id(chunk)]
+            copy = copies[key]
+            copies[key] += 1
+            for i, s in enumerate(review_cache.expand(chunk, session.reviews[key])):
+                diagnostics[f"{key[:16]}-{copy}-{i}"] = {
+                    "line": s.get("line_number") or chunk.start_line,
+                    "severity": s.get("severity") or "info",
+                    "message": s.get("comment") or "",
+                    "category": s.get("category") or "general",
+                }
+        previous = session.diagnostics
+        session.diagnostics = diagnostics
+        return {
+            "added": [{"id": d, **diagnostics[d]} for d in diagnostics if d not in previous],
+            "updated": [{"id": d, **diagnostics[d]} for d in diagnostics if d in previous and previous[d] != diagnostics[d]],
+            "removed": [d for d in previous if d not in diagnostics],
+            "chunks_total": len(chunks),
+            "chunks_reviewed": len(to_review),
+        }
+
+    def _expire(self) -> None:
+        # Callers hold self._lock
+        cutoff = time.monotonic() - settings.LIVE_SESSION_TTL_SECONDS
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used >= cutoff:
+                break
+            del self._sessions[session_id]
+        live_sessions_active.set(len(self._sessions))
+
+
+live_sessions = LiveSessionManager()
@@ -0,0 +1,134 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.analysis import AnalysisPriority
+
+# Highest priority first
+PRIORITY_ORDER = [p.value for p in AnalysisPriority]
+
+llm_inflight = metrics.gauge("llm_inflight_calls", "LLM calls currently holding a limiter slot, per priority class")
+llm_waiting = metrics.gauge("llm_waiting_calls", "LLM calls waiting for a limiter slot, per priority class")
+llm_wait_seconds = metrics.histogram(
+    "llm_limiter_wait_seconds",
+    "Time LLM calls waited for a limiter slot, per priority class",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+
+class LLMLimiterTimeout(Exception):
+    """Raised when no LLM slot became available before the caller's timeout (or it gave up waiting)."""
+
+
+class LLMLimiter:
+    """
+    Bounds concurrent LLM calls in this process, split into priority classes.
+
+    Each class may have slots reserved for it that lower classes can never take, so interactive
+    reviews always find capacity even while a bulk scan saturates the rest. When a slot frees up it
+    goes to the highest-priority waiter. Analyses acquire one slot per chunk call, so higher classes
+    overtake lower ones at chunk granularity.
+    """
+
+    def __init__(self, capacity: int, reserved: Dict[str, int]):
+        self.capacity = max(1, capacity)
+        self.reserved = {p: max(0, reserved.get(p, 0)) for p in PRIORITY_ORDER}
+        self._cond = threading.Condition()
+        self._in_use = {p: 0 for p in PRIORITY_ORDER}
+        self._waiting = {p: 0 for p in PRIORITY_ORDER}
+
+    def _normalize(self, priority: Optional[str]) -> str:
+        return priority if priority in self._in_use else AnalysisPriority.NORMAL.value
+
+    def _can_acquire(self, priority: str) -> bool:
+        total = sum(self._in_use.values())
+        if total >= self.capacity:
+            return False
+        if self._in_use[priority] < self.reserved[priority]:
+            return True
+        # Shared slots go to higher-priority waiters first
+        for p in PRIORITY_ORDER:
+            if p == priority:
+                break
+            if self._waiting[p]:
+                return False
+        # Only take a slot that is not held back for another class
+        held_back = sum(
+            max(0, self.reserved[p] - self._in_use[p]) for p in PRIORITY_ORDER if p != priority
+        )
+        return total + held_back < self.capacity
+
+    def acquire(
+        self,
+        priority: Optional[str] = None,
+        timeout: Optional[float] = None,
+        should_abort: Optional[Callable[[], bool]] = None,
+    ) -> str:
+        """
+        Block until a slot is free for `priority`. Returns the normalized priority to pass to release().
+        `should_abort` is checked about twice a second while waiting, outside the limiter's lock,
+        so a cancelled job stops queueing for capacity.
+        """
+        priority = self._normalize(priority)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        started = time.monotonic()
+        with self._cond:
+            self._waiting[priority] += 1
+            llm_waiting.inc(priority=priority)
+            try:
+                while not self._can_acquire(priority):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise LLMLimiterTimeout(f"No {priority} LLM slot available within {timeout:.1f}s")
+                    if should_abort is not None:
+                        # Poll without the lock: should_abort may do I/O (JobContext.is_done queries the
+                        # database), which would stall every release() and acquire() in the process
+                        self._cond.release()
+                        try:
+                            aborted = should_abort()
+                        finally:
+                            self._cond.acquire()
+                        if aborted:
+                            raise LLMLimiterTimeout(f"Gave up waiting for a {priority} LLM slot")
+                        if self._can_acquire(priority):
+                            break
+                        remaining = 0.5 if remaining is None else min(remaining, 0.5)
+                    self._cond.wait(timeout=remaining)
+                self._in_use[priority] += 1
+            finally:
+                self._waiting[priority] -= 1
+                llm_waiting.dec(priority=priority)
+                # A waiter leaving (acquired or timed out) may unblock lower classes
+                self._cond.notify_all()
+        llm_inflight.inc(priority=priority)
+        llm_wait_seconds.observe(time.monotonic() - started, priority=priority)
+        return priority
+
+    def release(self, priority: str) -> None:
+        with self._cond:
+            self._in_use[priority] -= 1
+            self._cond.notify_all()
+        llm_inflight.dec(priority=priority)
+
+    @contextmanager
+    def slot(
+        self,
+        priority: Optional[str] = None,
+        timeout: Optional[float] = None,
+        should_abort: Optional[Callable[[], bool]] = None,
+    ):
+        acquired = self.acquire(priority, timeout, should_abort)
+        try:
+            yield
+        finally:
+            self.release(acquired)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._cond:
+            return {"in_use": dict(self._in_use), "waiting": dict(self._waiting), "capacity": self.capacity}
+
+
+llm_limiter = LLMLimiter(settings.LLM_MAX_CONCURRENCY, settings.LLM_RESERVED_SLOTS)
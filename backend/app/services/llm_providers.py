@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Literal, Optional
+
+import google.generativeai as genai
+from pydantic import TypeAdapter
+from typing_extensions import NotRequired, TypedDict
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+cassette_calls_total = metrics.counter(
+    "llm_cassette_calls_total", "LLM calls through the cassette, by mode (record/replay) and result (recorded/hit/miss)"
+)
+
+SEVERITIES = ("info", "low", "medium", "high", "critical", "suggestion")
+
+# Response schema for review calls in structured output mode, in the provider's (OpenAPI subset) form
+REVIEW_RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "file_path": {"type": "string"},
+            "line_number": {"type": "integer"},
+            "comment": {"type": "string"},
+            "severity": {"type": "string", "format": "enum", "enum": list(SEVERITIES)},
+        },
+        "required": ["line_number", "comment", "severity"],
+    },
+}
+
+
+class ReviewSuggestionSchema(TypedDict):
+    file_path: NotRequired[str]
+    line_number: int
+    comment: str
+    severity: Literal["info", "low", "medium", "high", "critical", "suggestion"]
+
+
+# Validates a whole response body against REVIEW_RESPONSE_SCHEMA; built once, parses and checks in one pass
+review_response_validator = TypeAdapter(List[ReviewSuggestionSchema])
+
+
+class GeminiProvider:
+    """Google Gemini through google-generativeai."""
+
+    name = "gemini"
+
+    def __init__(self, model_name: str):
+        if settings.GEMINI_API_KEY:
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+        self.model = genai.GenerativeModel(model_name)
+
+    @property
+    def available(self) -> bool:
+        return bool(settings.GEMINI_API_KEY)
+
+    def generate(self, prompt: str, timeout: float, response_schema: Optional[dict] = None):
+        """The model's response to `prompt`; with `response_schema`, JSON constrained to it."""
+        generation_config = (
+            {"response_mime_type": "application/json", "response_schema": response_schema} if response_schema else None
+        )
+        return self.model.generate_content(prompt, generation_config=generation_config, request_options={"timeout": timeout})
+
+
+@dataclass
+class StubUsage:
+    total_token_count: int
+
+
+@dataclass
+class StubResponse:
+    text: str
+    usage_metadata: StubUsage
+
+
+# Numbered code lines of a review prompt ("  12 | code")
+_NUMBERED_LINE_RE = re.compile(r"^\s*(\d+) \| (.*)$", re.MULTILINE)
+_DEFINITION_RE = re.compile(r"^\s*(?:async\s+)?(?:def|class|function)\s+(\w+)", re.MULTILINE)
+
+
+class StubProvider:
+    """
+    A local stand-in for the model, for development and load tests without an API key or network.
+
+    Reviews are deterministic findings from simple line rules (eval, TODO/FIXME, long lines),
+    returned as fenced JSON the way models tend to answer in free form, or as bare JSON
+    matching the schema in structured output mode. LLM_STUB_MALFORMED_RATIO of responses are
+    cut off mid-array, as a model hitting its output limit would, to exercise recovery paths.
+    """
+
+    name = "stub"
+    available = True
+
+    def generate(self, prompt: str, timeout: float, response_schema: Optional[dict] = None) -> StubResponse:
+        # Only the reviewed snippet is numbered; referenced definitions are not
+        numbered = _NUMBERED_LINE_RE.findall(prompt)
+        if numbered:
+            body = self._review(numbered)
+            if random.random() < settings.LLM_STUB_MALFORMED_RATIO:
+                body = body[: len(body) * 2 // 3]
+            text = body if response_schema else f"```json\n{body}\n```"
+        else:
+            names = _DEFINITION_RE.findall(prompt)
+            text = f"Defines {', '.join(dict.fromkeys(names))}." if names else "No public definitions."
+        return StubResponse(text, StubUsage((len(prompt) + len(text)) // 4))
+
+    def _review(self, numbered: List[tuple]) -> str:
+        suggestions = []
+        for number, line in numbered:
+            if "eval(" in line:
+                suggestions.append((number, "eval() runs arbitrary code; parse the input instead.", "high"))
+            if "TODO" in line or "FIXME" in line:
+                suggestions.append((number, "Unresolved TODO/FIXME.", "info"))
+            if len(line) > 120:
+                suggestions.append((number, "Line is longer than 120 characters.", "low"))
+        if not suggestions:
+            suggestions.append((numbered[0][0], "No issues found in this snippet.", "info"))
+        return json.dumps(
+            [{"line_number": int(n), "comment": comment, "severity": severity} for n, comment, severity in suggestions],
+            indent=2,
+        )
+
+
+class CassetteMiss(LookupError):
+    """A replayed call whose prompt is not on the cassette."""
+
+
+class CassetteProvider:
+    """
+    Records the calls of another provider to a cassette file, or replays them from it.
+
+    The cassette is append-only JSON lines, one per call: the SHA-256 of the prompt (and response
+    schema), the response text and token count, or the error, and the call's latency. Recording
+    passes every call through and appends it. Replaying serves calls from the file alone, sleeping
+    the recorded latency times LLM_CASSETTE_LATENCY_SCALE, so pipeline changes (chunking, packing,
+    concurrency) can be benchmarked offline against the shape of real traffic. A prompt recorded
+    more than once is answered with its recordings in turn, so retries see what they saw live.
+    """
+
+    def __init__(self, inner, path: str, mode: str):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown LLM_CASSETTE_MODE {mode!r}")
+        self.inner = inner
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Deque[dict]] = defaultdict(deque)
+        if mode == "replay":
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @property
+    def name(self) -> str:
+        # Recording passes real responses through, cached as the provider's own. Replayed ones are
+        # cached under their own model name (see AIService), so a benchmark against an old or
+        # edited cassette never serves its reviews to live analyses
+        if self.mode == "record":
+            return self.inner.name
+        return "replay" if self.inner.name == "gemini" else f"replay:{self.inner.name}"
+
+    @property
+    def available(self) -> bool:
+        return True if self.mode == "replay" else self.inner.available
+
+    @staticmethod
+    def key(prompt: str, response_schema: Optional[dict] = None) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8"))
+        if response_schema:
+            digest.update(json.dumps(response_schema, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def generate(self, prompt: str, timeout: float, response_schema: Optional[dict] = None):
+        key = self.key(prompt, response_schema)
+        if self.mode == "replay":
+            return self._replay(key, timeout)
+        started = time.monotonic()
+        entry = {"k": key}
+        try:
+            response = self.inner.generate(prompt, timeout, response_schema)
+            entry["t"] = response.text
+            usage = getattr(response, "usage_metadata", None)
+            entry["n"] = getattr(usage, "total_token_count", None) or 0
+            return response
+        except Exception as e:
+            entry["e"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            entry["ms"] = round((time.monotonic() - started) * 1000, 1)
+            self._append(entry)
+
+    def _replay(self, key: str, timeout: float) -> StubResponse:
+        with self._lock:
+            recordings = self._entries.get(key)
+            if not recordings:
+                cassette_calls_total.inc(mode="replay", result="miss")
+                raise CassetteMiss(f"No recorded call for prompt {key[:12]} in {self.path}")
+            entry = recordings[0]
+            recordings.rotate(-1)
+        cassette_calls_total.inc(mode="replay", result="hit")
+        delay = entry.get("ms", 0) / 1000 * settings.LLM_CASSETTE_LATENCY_SCALE
+        if delay > 0:
+            time.sleep(min(delay, timeout))
+        if delay > timeout:
+            raise TimeoutError(f"Replayed call took {delay:.1f}s, over the {timeout:.0f}s timeout")
+        if "e" in entry:
+            raise RuntimeError(f"Recorded error: {entry['e']}")
+        return StubResponse(entry["t"], StubUsage(entry.get("n", 0)))
+
+    def _append(self, entry: dict) -> None:
+        line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n"
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            cassette_calls_total.inc(mode="record", result="recorded")
+        except OSError as e:
+            print(f"[CassetteProvider] Failed to record a call to {self.path}: {e}")
+
+    def _load(self) -> None:
+        skipped = 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if "t" not in entry and "e" not in entry:
+                        raise ValueError(line)
+                    self._entries[entry["k"]].append(entry)
+                except (ValueError, KeyError, TypeError):
+                    skipped += 1  # e.g. a line cut off when a recording process was killed
+        calls = sum(len(recordings) for recordings in self._entries.values())
+        print(f"[CassetteProvider] Replaying {calls} calls ({len(self._entries)} prompts) from {self.path}; {skipped} unreadable lines skipped")
+
+
+def create_provider(model_name: str):
+    """The provider named by LLM_PROVIDER ("gemini" or "stub"), recording or replaying per LLM_CASSETTE_MODE."""
+    if settings.LLM_PROVIDER == "stub":
+        provider = StubProvider()
+    elif settings.LLM_PROVIDER == "gemini":
+        provider = GeminiProvider(model_name)
+    else:
+        raise ValueError(f"Unknown LLM_PROVIDER {settings.LLM_PROVIDER!r}")
+    if settings.LLM_CASSETTE_MODE:
+        provider = CassetteProvider(provider, settings.LLM_CASSETTE_PATH, settings.LLM_CASSETTE_MODE)
+    return provider
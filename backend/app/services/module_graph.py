@@ -0,0 +1,161 @@
+import os
+from typing import Dict, Iterable, List, Optional
+
+from app.core.config import settings
+from app.services.job_control import JobContext
+from app.services.parse_cache import parse_cache
+from app.services.symbol_index import SymbolIndex
+from app.utils.ast_parser import CodeChunk
+from app.utils.helpers import read_text
+
+
+class ModuleGraph:
+    """
+    Import graph of a checkout's Python modules (see SymbolIndex.imported_paths), condensed into
+    strongly connected components so import cycles are handled as one unit.
+    """
+
+    def __init__(self, index: SymbolIndex):
+        self.edges: Dict[str, List[str]] = {path: index.imported_paths(path) for path in sorted(index.defs)}
+        self.components = self._condense()  # dependencies before their importers
+        self.component_of: Dict[str, int] = {
+            path: i for i, component in enumerate(self.components) for path in component
+        }
+
+    def _condense(self) -> List[List[str]]:
+        # Iterative Tarjan: a component is emitted only after every component it imports, so the
+        # emission order is already a topological order with leaf modules first
+        order: Dict[str, int] = {}
+        low: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack = set()
+        components: List[List[str]] = []
+        for root in self.edges:
+            if root in order:
+                continue
+            order[root] = low[root] = len(order)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.edges[root]))]
+            while work:
+                node, successors = work[-1]
+                descended = False
+                for succ in successors:
+                    if succ not in self.edges:
+                        continue
+                    if succ not in order:
+                        order[succ] = low[succ] = len(order)
+                        stack.append(succ)
+                        on_stack.add(succ)
+                        work.append((succ, iter(self.edges[succ])))
+                        descended = True
+                        break
+                    if succ in on_stack:
+                        low[node] = min(low[node], order[succ])
+                if descended:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == order[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+        return components
+
+    def schedule(self, files: List[List[CodeChunk]]) -> List[List[CodeChunk]]:
+        """`files` reordered leaf modules first; files outside the graph (other languages) keep their order, last."""
+        last = len(self.components)
+        return sorted(files, key=lambda chunks: self.component_of.get(chunks[0].path, last))
+
+
+class ModuleSummaries:
+    """
+    Short summaries of modules' public APIs, given to the chunks of files that import them in
+    place of the imported files themselves.
+
+    Summaries are written by the model from the module's source (or, when it is unavailable,
+    assembled from the module's signatures and docstrings) and cached per blob, prompt version
+    and model in the parse cache, so a module is summarized once per version. They are produced
+    in dependency order, leaf modules first, ahead of the chunks that need them.
+    """
+
+    def __init__(self, index: SymbolIndex, graph: ModuleGraph, priority: Optional[str] = None, ctx: Optional[JobContext] = None):
+        self.index = index
+        self.graph = graph
+        self.priority = priority
+        self.ctx = ctx
+        self._summaries: Dict[str, str] = {}
+        self._contexts: Dict[str, str] = {}
+
+    def _imports(self, path: str) -> List[str]:
+        # Modules in the same import cycle are reviewed together and do not summarize each other
+        component = self.graph.component_of.get(path)
+        deps = [d for d in self.graph.edges.get(path, []) if self.graph.component_of.get(d) != component]
+        return deps[:settings.ANALYSIS_CONTEXT_MAX_SUMMARIES]
+
+    def prepare(self, paths: Iterable[str]) -> None:
+        """Summarize every module imported by `paths` that is not summarized yet, in dependency order."""
+        from app.services.ai_service import AIService, aiservice  # lazy import to avoid circulars
+
+        needed = {dep for path in paths for dep in self._imports(path)} - set(self._summaries)
+        if not needed:
+            return
+        kind = f"summary:{AIService.PROMPT_VERSION}:{aiservice.model_name}"
+        blobs = {path: self.index.blob_shas.get(path) for path in needed}
+        cached = parse_cache.get_many(kind, [sha for sha in blobs.values() if sha])
+        for component in self.graph.components:
+            for path in component:
+                if path not in needed:
+                    continue
+                if blobs[path] in cached:
+                    self._summaries[path] = cached[blobs[path]]
+                    continue
+                if self.ctx is not None:
+                    self.ctx.raise_if_done()
+                source = read_text(os.path.join(self.index.root, path)) if self.index.root else None
+                summary = aiservice.summarize_module(
+                    path, (source or "")[:settings.ANALYSIS_MODULE_SUMMARY_SOURCE_CHARS], self.priority, self.ctx,
+                ) if source else None
+                if summary and blobs[path]:
+                    parse_cache.put_many(kind, {blobs[path]: summary})
+                self._summaries[path] = summary or self._api_digest(path)
+
+    def context_for(self, path: str) -> str:
+        """Summaries of the modules `path` imports, for its chunks' prompts ("" if none)."""
+        if path not in self._contexts:
+            self.prepare([path])
+            self._contexts[path] = "\n\n".join(
+                f"# Module {dep}\n{self._summaries[dep]}" for dep in self._imports(path) if self._summaries.get(dep)
+            )
+        return self._contexts[path]
+
+    def key_for(self, path: str) -> str:
+        """
+        Stand-in for `context_for(path)` in review-cache keys: the imported modules and their blob
+        SHAs. Model-written summaries are not reproducible, so keying on their text would re-review
+        every importer whenever a summary is rewritten (e.g. after parse-cache eviction).
+        """
+        self.context_for(path)
+        return "\n".join(
+            f"# Module {dep} {self.index.blob_shas.get(dep) or self._summaries[dep]}"
+            for dep in self._imports(path) if self._summaries.get(dep)
+        )
+
+    def _api_digest(self, path: str) -> str:
+        # Public signatures and docstring summaries, when the model cannot write a summary
+        lines = []
+        for d in self.index.defs.get(path, []):
+            if d.kind == "variable" or any(part.startswith("_") for part in d.name.split(".")):
+                continue
+            signature = ("    " if d.kind == "method" else "") + d.signature.split("\n")[-1]  # without decorators
+            lines.append(f"{signature}  # {d.doc.splitlines()[0]}" if d.doc else signature)
+        digest = "\n".join(lines)
+        limit = settings.ANALYSIS_MODULE_SUMMARY_MAX_CHARS
+        return digest if len(digest) <= limit else digest[:limit - 3] + "..."
@@ -0,0 +1,247 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.parse_pool import ParseItem, ParseResult, parse_pool
+from app.utils.ast_parser import PARSER_VERSION, CodeChunk
+from app.utils.helpers import decode_source, git_blob_sha, read_text
+
+parse_cache_lookups_total = metrics.counter("parse_cache_lookups_total", "Parse cache lookups, by artifact kind and result (hit/miss)")
+parse_cache_evictions_total = metrics.counter("parse_cache_evictions_total", "Entries evicted from the parse cache")
+parse_cache_bytes = metrics.gauge("parse_cache_bytes", "Size of the parse cache entries, as last measured by this process")
+
+# SQLite's default limit on bound parameters is far above this
+_LOOKUP_BATCH = 500
+# Access times are only rewritten when older than this, so warm reads stay mostly read-only
+_TOUCH_INTERVAL_SECONDS = 60.0
+# Evict down to this fraction of the budget, so a full cache doesn't evict on every write
+_EVICT_TO = 0.9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    blob_sha TEXT NOT NULL,
+    parser_version TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (blob_sha, parser_version, kind)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS artifacts_accessed ON artifacts (accessed);
+"""
+
+
+class ParseCache:
+    """
+    Local cache of per-blob parse artifacts, keyed by git blob SHA, PARSER_VERSION and an
+    artifact kind (e.g. "chunks:python:200"), so re-analysing a repository only parses the
+    files that changed.
+
+    Entries are small JSON documents in a SQLite file shared by every process on the host
+    (WAL mode, one connection per thread). Entries are evicted least-recently-used once the
+    file holds more than PARSE_CACHE_MAX_BYTES of data. The cache is an optimization only:
+    any SQLite error is logged and treated as a miss.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None  # bytes of entry data, refreshed from the file when evicting
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.PARSE_CACHE_PATH) and settings.PARSE_CACHE_MAX_BYTES > 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(settings.PARSE_CACHE_PATH) or ".", exist_ok=True)
+            conn = sqlite3.connect(settings.PARSE_CACHE_PATH, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, kind: str, blob_shas: Iterable[str]) -> Dict[str, object]:
+        """Cached artifacts of `kind` for the given blobs."""
+        blob_shas = list(dict.fromkeys(blob_shas))
+        if not self.enabled or not blob_shas:
+            return {}
+        found: Dict[str, object] = {}
+        now = time.time()
+        try:
+            conn = self._conn()
+            for i in range(0, len(blob_shas), _LOOKUP_BATCH):
+                batch = blob_shas[i:i + _LOOKUP_BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT blob_sha, data, accessed FROM artifacts"
+                    f" WHERE parser_version = ? AND kind = ? AND blob_sha IN ({marks})",
+                    [PARSER_VERSION, kind, *batch],
+                ).fetchall()
+                stale = []
+                for blob_sha, data, accessed in rows:
+                    found[blob_sha] = json.loads(data)
+                    if accessed < now - _TOUCH_INTERVAL_SECONDS:
+                        stale.append((now, blob_sha, PARSER_VERSION, kind))
+                if stale:
+                    with conn:
+                        conn.executemany(
+                            "UPDATE artifacts SET accessed = ? WHERE blob_sha = ? AND parser_version = ? AND kind = ?", stale
+                        )
+        except sqlite3.Error as e:
+            print(f"[ParseCache] Lookup failed: {e}")
+            return {}
+        parse_cache_lookups_total.inc(len(found), kind=kind.split(":")[0], result="hit")
+        parse_cache_lookups_total.inc(len(blob_shas) - len(found), kind=kind.split(":")[0], result="miss")
+        return found
+
+    def put_many(self, kind: str, artifacts: Dict[str, object]) -> None:
+        """Store artifacts of `kind` by blob SHA, then evict if the cache is over budget."""
+        if not self.enabled or not artifacts:
+            return
+        now = time.time()
+        rows = []
+        for blob_sha, artifact in artifacts.items():
+            data = json.dumps(artifact, separators=(",", ":")).encode("utf-8")
+            rows.append((blob_sha, PARSER_VERSION, kind, data, len(data), now))
+        try:
+            conn = self._conn()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)", rows)
+            with self._lock:
+                # The first write of a process measures the file; later ones keep a running total
+                over = self._size is None or self._size + sum(row[4] for row in rows) > settings.PARSE_CACHE_MAX_BYTES
+                if self._size is not None:
+                    self._size += sum(row[4] for row in rows)
+            if over:
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"[ParseCache] Store failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        # Other processes write to the same file, so measure it rather than trust our running total
+        size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+        target = int(settings.PARSE_CACHE_MAX_BYTES * _EVICT_TO)
+        evicted = 0
+        if size > settings.PARSE_CACHE_MAX_BYTES:
+            # Walk entries oldest-first until enough bytes are covered, then drop them in one statement
+            cutoff = None
+            excess = size - target
+            for accessed, entry_size in conn.execute("SELECT accessed, size FROM artifacts ORDER BY accessed"):
+                excess -= entry_size
+                cutoff = accessed
+                if excess <= 0:
+                    break
+            with conn:
+                evicted = conn.execute("DELETE FROM artifacts WHERE accessed <= ?", (cutoff,)).rowcount
+            size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+            parse_cache_evictions_total.inc(evicted)
+            print(f"[ParseCache] Evicted {evicted} entries; {size} bytes remain")
+        with self._lock:
+            self._size = size
+        parse_cache_bytes.set(size)
+
+    def chunk_files(
+        self, root: Optional[str], items: Sequence[ParseItem], max_lines: int,
+        blob_shas: Optional[Dict[str, str]] = None,
+    ) -> List[ParseResult]:
+        """
+        Like ParsePool.parse, but chunk boundaries of files whose blob is cached are reused and
+        only the rest are parsed. `blob_shas` maps paths read from `root` to their blob SHA (see
+        RepositoryService.blob_shas); the SHA of in-memory contents is computed here.
+        """
+        if not self.enabled:
+            return parse_pool.parse(root, items, max_lines)
+        return self._through(
+            items, blob_shas, [f"chunks:{language}:{max_lines}" for _, language, _ in items],
+            compute=lambda misses: parse_pool.parse(root, misses, max_lines),
+            encode=lambda chunks: [[c.start_line, c.end_line, c.kind, c.name] for c in chunks],
+            decode=lambda item, bounds: self._rebuild(root, item, bounds),
+        )
+
+    def symbol_files(
+        self, root: Optional[str], items: Sequence[ParseItem], blob_shas: Optional[Dict[str, str]] = None,
+    ) -> List[Tuple[str, dict]]:
+        """Like ParsePool.symbols, reusing the cached symbols of unchanged blobs (see chunk_files)."""
+        if not self.enabled:
+            return parse_pool.symbols(root, items)
+        return self._through(
+            items, blob_shas, [f"symbols:{language}" for _, language, _ in items],
+            compute=lambda misses: parse_pool.symbols(root, misses),
+            encode=lambda symbols: symbols,
+            decode=lambda item, symbols: symbols,
+        )
+
+    def fingerprint_files(
+        self, root: Optional[str], items: Sequence[ParseItem], k: int, w: int,
+        blob_shas: Optional[Dict[str, str]] = None,
+    ) -> List[Tuple[str, list]]:
+        """Like ParsePool.fingerprints, reusing the cached fingerprints of unchanged blobs (see chunk_files)."""
+        if not self.enabled:
+            return parse_pool.fingerprints(root, items, k, w)
+        return self._through(
+            items, blob_shas, [f"fingerprints:{language}:{k}:{w}" for _, language, _ in items],
+            compute=lambda misses: parse_pool.fingerprints(root, misses, k, w),
+            encode=lambda fingerprints: fingerprints,
+            decode=lambda item, fingerprints: fingerprints,
+        )
+
+    def _through(
+        self, items: Sequence[ParseItem], blob_shas: Optional[Dict[str, str]], kinds: List[str],
+        compute: Callable[[List[ParseItem]], list], encode: Callable, decode: Callable,
+    ) -> list:
+        # Read-through: (path, artifact) per item, from the cache where possible and `compute` otherwise
+        blob_shas = blob_shas or {}
+        keys: List[Optional[str]] = [
+            git_blob_sha(data) if data is not None else blob_shas.get(path) for path, _, data in items
+        ]
+        cached: Dict[tuple, object] = {}
+        for kind in set(kinds):
+            wanted = [key for key, k in zip(keys, kinds) if k == kind and key]
+            for blob_sha, artifact in self.get_many(kind, wanted).items():
+                cached[(kind, blob_sha)] = artifact
+
+        results: list = [None] * len(items)
+        misses = []
+        for i, (item, key, kind) in enumerate(zip(items, keys, kinds)):
+            artifact = cached.get((kind, key)) if key else None
+            if artifact is None:
+                misses.append(i)
+                continue
+            results[i] = (item[0], decode(item, artifact))
+        if misses:
+            fresh: Dict[str, Dict[str, object]] = {}
+            for i, result in zip(misses, compute([items[i] for i in misses])):
+                results[i] = result
+                if keys[i]:
+                    fresh.setdefault(kinds[i], {})[keys[i]] = encode(result[1])
+            for kind, artifacts in fresh.items():
+                self.put_many(kind, artifacts)
+        return results
+
+    def _rebuild(self, root: Optional[str], item: ParseItem, bounds: list) -> List[CodeChunk]:
+        # Chunk text is always a line slice of the file, so only the boundaries are cached
+        path, language, data = item
+        if not bounds:
+            return []
+        try:
+            source = decode_source(data) if data is not None else read_text(os.path.join(root, path))
+        except OSError:
+            source = None
+        if source is None:
+            return []
+        lines = source.split("\n")
+        return [
+            CodeChunk(path, language, start, end, "\n".join(lines[start - 1:end]), kind, name)
+            for start, end, kind, name in bounds
+        ]
+
+
+parse_cache = ParseCache()
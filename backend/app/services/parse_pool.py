@@ -0,0 +1,161 @@
+"""
+Process pool for the CPU-bound stages of an analysis: parsing source files into chunks,
+extracting their symbols and fingerprinting their token streams.
+
+Under the GIL these would serialize across the dispatcher's worker threads (and stall the API
+if they ran there), so they run in worker processes started through a forkserver that has the
+parsing modules preloaded. Workers receive file paths or raw bytes and return plain chunk
+records, never ASTs, and are replaced after a number of batches to contain memory growth.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.ast_parser import CodeChunk, chunk_file, code_tokens, extract_symbols
+from app.utils.fingerprint import winnow
+from app.utils.helpers import decode_source, read_text
+
+# Imported once in the forkserver so every worker starts with them loaded
+_PRELOAD = ["app.utils.ast_parser", "app.utils.helpers"]
+
+# (relative path, language, contents) -- contents None means read the file under the batch root
+ParseItem = Tuple[str, str, Optional[bytes]]
+ParseResult = Tuple[str, List[CodeChunk]]
+
+parse_files_total = metrics.counter("parse_files_total", "Source files parsed, by stage and where they ran (pool/inline)")
+parse_seconds = metrics.histogram("parse_seconds", "Wall time to parse one checkout or buffer set, by stage and where it ran")
+
+
+def _source(root: Optional[str], item: ParseItem) -> Optional[str]:
+    path, _, data = item
+    if data is not None:
+        return decode_source(data)
+    try:
+        return read_text(os.path.join(root, path))
+    except OSError:
+        return None
+
+
+def parse_batch(root: Optional[str], items: Sequence[ParseItem], max_lines: int) -> List[ParseResult]:
+    """Chunk a batch of files. Runs in pool workers, and inline for small inputs."""
+    results = []
+    for item in items:
+        path, language, _ = item
+        source = _source(root, item)
+        results.append((path, chunk_file(path, source, language, max_lines) if source is not None else []))
+    return results
+
+
+def symbol_batch(root: Optional[str], items: Sequence[ParseItem]) -> List[Tuple[str, dict]]:
+    """Extract the symbols of a batch of files; the pool counterpart of parse_batch."""
+    results = []
+    for item in items:
+        path, language, _ = item
+        source = _source(root, item)
+        results.append((path, extract_symbols(source, path, language) if source is not None else {"defs": [], "imports": []}))
+    return results
+
+
+def fingerprint_batch(root: Optional[str], items: Sequence[ParseItem], k: int, w: int) -> List[Tuple[str, list]]:
+    """Winnowed [fingerprint, line] pairs of a batch of files (see app/utils/fingerprint.py)."""
+    results = []
+    for item in items:
+        path, language, _ = item
+        source = _source(root, item)
+        results.append((path, [list(f) for f in winnow(code_tokens(source, language), k, w)] if source is not None else []))
+    return results
+
+
+class ParsePool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def workers(self) -> int:
+        return settings.PARSE_POOL_WORKERS or os.cpu_count() or 1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                if ctx.get_start_method() == "forkserver":
+                    ctx.set_forkserver_preload(_PRELOAD)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=ctx,
+                    max_tasks_per_child=settings.PARSE_POOL_MAX_TASKS_PER_CHILD,
+                )
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def parse(self, root: Optional[str], items: Sequence[ParseItem], max_lines: int) -> List[ParseResult]:
+        """Chunk `items` (in order), in the pool when they are big enough to be worth the IPC."""
+        return self._run("chunks", parse_batch, root, items, max_lines)
+
+    def symbols(self, root: Optional[str], items: Sequence[ParseItem]) -> List[Tuple[str, dict]]:
+        """Extract the symbols (see ast_parser.extract_symbols) of `items`, in order."""
+        return self._run("symbols", symbol_batch, root, items)
+
+    def fingerprints(self, root: Optional[str], items: Sequence[ParseItem], k: int, w: int) -> List[Tuple[str, list]]:
+        """Winnowed fingerprints of `items`, in order."""
+        return self._run("fingerprints", fingerprint_batch, root, items, k, w)
+
+    def _run(self, stage: str, fn: Callable, root: Optional[str], items: Sequence[ParseItem], *args) -> list:
+        sizes = [self._size(root, item) for item in items]
+        started = time.monotonic()
+        if not settings.PARSE_POOL_ENABLED or self.workers < 2 or sum(sizes) < settings.PARSE_POOL_MIN_BYTES:
+            return self._inline(stage, fn, root, items, args, started)
+
+        # Batches of roughly PARSE_POOL_BATCH_BYTES amortize the per-task IPC
+        batches: List[List[ParseItem]] = [[]]
+        batch_bytes = 0
+        for item, size in zip(items, sizes):
+            if batches[-1] and batch_bytes + size > settings.PARSE_POOL_BATCH_BYTES:
+                batches.append([])
+                batch_bytes = 0
+            batches[-1].append(item)
+            batch_bytes += size
+        try:
+            executor = self._get_executor()
+            futures = [executor.submit(fn, root, batch, *args) for batch in batches]
+            results = [result for future in futures for result in future.result()]
+        except BrokenProcessPool as e:
+            # A worker died (e.g. killed for memory); start a fresh pool next time and finish inline
+            print(f"[ParsePool] Process pool broke, parsing inline: {e}")
+            self.shutdown()
+            return self._inline(stage, fn, root, items, args, started)
+        parse_files_total.inc(len(items), stage=stage, mode="pool")
+        parse_seconds.observe(time.monotonic() - started, stage=stage, mode="pool")
+        return results
+
+    def _inline(self, stage: str, fn: Callable, root: Optional[str], items: Sequence[ParseItem], args: tuple, started: float) -> list:
+        results = fn(root, items, *args)
+        parse_files_total.inc(len(items), stage=stage, mode="inline")
+        parse_seconds.observe(time.monotonic() - started, stage=stage, mode="inline")
+        return results
+
+    def _size(self, root: Optional[str], item: ParseItem) -> int:
+        path, _, data = item
+        if data is not None:
+            return len(data)
+        try:
+            return os.path.getsize(os.path.join(root, path))
+        except OSError:
+            return 0
+
+
+parse_pool = ParsePool()
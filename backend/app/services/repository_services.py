@@ -1,7 +1,16 @@
+import re
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, List
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.db import models
 from app.schemas import repository as repo_schema
 
+_FULL_SHA_RE = re.compile(r"^[0-9a-fA-F]{40}$")
+
 class RepositoryService:
     def get_repository(self, db:Session, repo_id: int):
         return db.query(models.Repository).filter(models.Repository.id==repo_id).first()
@@ -36,5 +45,118 @@ class RepositoryService:
         db.delete(repo)
         db.commit()
         return True
-        
+
+    def is_remote_ref(self, repo, ref: str) -> bool:
+        """Whether resolving `ref` of `repo` asks its remote, i.e. it is a branch or tag of a git repository."""
+        from app.services.snapshot_service import snapshot_service  # lazy import to avoid circulars
+
+        return not (snapshot_service.is_upload_repository(repo) or _FULL_SHA_RE.match(ref) or ref.startswith("-"))
+
+    def resolve_ref(self, repo, ref: str) -> str:
+        """
+        Resolve a branch or tag name to the commit it currently points at.
+        Full commit hashes are returned as-is; if the remote cannot be reached the ref itself is returned.
+        """
+        return self.resolve_refs(repo, [ref])[ref]
+
+    def resolve_refs(self, repo, refs: List[str]) -> Dict[str, str]:
+        """Like resolve_ref for several refs of one repository, with a single `git ls-remote`."""
+        from app.services.snapshot_service import snapshot_service  # lazy import to avoid circulars
+
+        if snapshot_service.is_upload_repository(repo):
+            return snapshot_service.resolve_refs(repo, refs)
+        resolved = {}
+        pending = []
+        for ref in dict.fromkeys(refs):
+            if _FULL_SHA_RE.match(ref):
+                resolved[ref] = ref.lower()
+            elif ref.startswith("-"):
+                resolved[ref] = ref
+            else:
+                pending.append(ref)
+        if not pending:
+            return resolved
+        try:
+            out = subprocess.run(
+                ["git", "ls-remote", repo.url, *pending],
+                capture_output=True,
+                text=True,
+                timeout=settings.GIT_COMMAND_TIMEOUT_SECONDS,
+                check=True,
+            ).stdout
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"[RepositoryService] Could not resolve {', '.join(map(repr, pending))} for {repo.url}: {e}")
+            resolved.update({ref: ref for ref in pending})
+            return resolved
+        remote = {}
+        for line in out.splitlines():
+            sha, _, name = line.partition("\t")
+            remote[name] = sha
+        for ref in pending:
+            resolved[ref] = ref
+            # Prefer branches, then peeled (annotated) tags, then lightweight tags
+            for name in (f"refs/heads/{ref}", f"refs/tags/{ref}^{{}}", f"refs/tags/{ref}", ref):
+                sha = remote.get(name)
+                if sha and _FULL_SHA_RE.match(sha):
+                    resolved[ref] = sha.lower()
+                    break
+        return resolved
+
+    def blob_shas(self, workdir: str) -> Dict[str, str]:
+        """Map each tracked path of a checkout (see `checkout`) to its git blob SHA."""
+        from app.services.snapshot_service import snapshot_service  # lazy import to avoid circulars
+
+        snapshot_blobs = snapshot_service.blob_shas(workdir)
+        if snapshot_blobs is not None:
+            return dict(snapshot_blobs)
+        try:
+            out = subprocess.run(
+                ["git", "-C", workdir, "ls-files", "-s", "-z"],
+                capture_output=True,
+                timeout=settings.GIT_COMMAND_TIMEOUT_SECONDS,
+                check=True,
+            ).stdout
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"[RepositoryService] Could not list blobs of {workdir}: {e}")
+            return {}
+        blobs = {}
+        for entry in out.split(b"\0"):
+            # "<mode> <sha> <stage>\t<path>"
+            meta, _, path = entry.partition(b"\t")
+            fields = meta.split(b" ")
+            if path and len(fields) == 3:
+                blobs[path.decode("utf-8", errors="surrogateescape")] = fields[1].decode("ascii")
+        return blobs
+
+    @contextmanager
+    def checkout(self, repo, commit_hash: str):
+        """
+        Shallow-fetch `commit_hash` (a commit or ref) of `repo` into a temporary directory and yield its path.
+        The directory is removed when the block exits. Upload repositories check out the snapshot
+        whose digest is `commit_hash` instead (see SnapshotService).
+        """
+        from app.services.snapshot_service import snapshot_service  # lazy import to avoid circulars
+
+        if snapshot_service.is_upload_repository(repo):
+            with snapshot_service.checkout(repo, commit_hash) as workdir:
+                yield workdir
+            return
+        workdir = tempfile.mkdtemp(prefix="codenova-checkout-")
+        try:
+            for cmd in (
+                ["git", "init", "-q", workdir],
+                ["git", "-C", workdir, "fetch", "-q", "--depth", "1", repo.url, commit_hash],
+                ["git", "-C", workdir, "checkout", "-q", "FETCH_HEAD"],
+            ):
+                result = subprocess.run(
+                    cmd, capture_output=True, text=True, timeout=settings.GIT_FETCH_TIMEOUT_SECONDS
+                )
+                if result.returncode != 0:
+                    raise RuntimeError(
+                        f"Could not check out {commit_hash} of {repo.url}: {result.stderr.strip() or result.returncode}"
+                    )
+            yield workdir
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
 repository_service=RepositoryService()
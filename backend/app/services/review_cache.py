@@ -0,0 +1,129 @@
+import hashlib
+import threading
+import time
+from typing import Dict, Iterable, List
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.core.metrics import metrics
+from app.models import ChunkReview
+from app.utils.ast_parser import CodeChunk
+
+cache_lookups_total = metrics.counter("review_cache_lookups_total", "Chunk review cache lookups, by result (hit/miss)")
+
+# Keep IN lists well below driver/statement limits on very large analyses
+_LOOKUP_BATCH = 1000
+
+
+class ReviewCache:
+    """
+    Per-chunk review cache keyed by chunk content, prompt version and model.
+
+    Reviews are written as chunks finish, so an analysis retried after its worker died skips
+    every chunk that was already reviewed, and so do later analyses of unchanged code.
+    """
+
+    def chunk_key(self, chunk: CodeChunk, context: str = "") -> str:
+        # The referenced definitions are part of the prompt, so a changed callee re-reviews the chunk
+        raw = f"{chunk.language}\0{chunk.text}\0{context}" if context else f"{chunk.language}\0{chunk.text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, db: Session, keys: Iterable[str], prompt_version: str, model_name: str) -> Dict[str, list]:
+        """Cached suggestions (relative form, see `expand`) for the given chunk keys."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, list] = {}
+        for i in range(0, len(keys), _LOOKUP_BATCH):
+            rows = (
+                db.query(ChunkReview.content_hash, ChunkReview.suggestions)
+                .filter(
+                    ChunkReview.content_hash.in_(keys[i:i + _LOOKUP_BATCH]),
+                    ChunkReview.prompt_version == prompt_version,
+                    ChunkReview.model_name == model_name,
+                )
+                .all()
+            )
+            found.update({content_hash: suggestions for content_hash, suggestions in rows})
+        cache_lookups_total.inc(len(found), result="hit")
+        cache_lookups_total.inc(len(keys) - len(found), result="miss")
+        return found
+
+    def compact(self, chunk: CodeChunk, suggestions: list) -> list:
+        """Suggestions placed on `chunk`, rewritten relative to its first line and without a path."""
+        compacted = []
+        for s in suggestions:
+            entry = {k: v for k, v in s.items() if k not in ("file_path", "line_number")}
+            entry["line_offset"] = s["line_number"] - chunk.start_line
+            compacted.append(entry)
+        return compacted
+
+    def expand(self, chunk: CodeChunk, cached: list) -> list:
+        """Cached suggestions placed back on `chunk`."""
+        expanded = []
+        for entry in cached:
+            s = {k: v for k, v in entry.items() if k != "line_offset"}
+            s["file_path"] = chunk.path
+            s["line_number"] = chunk.start_line + entry.get("line_offset", 0)
+            expanded.append(s)
+        return expanded
+
+    def store(self, entries: List[Dict[str, object]]) -> None:
+        """Insert reviews in one statement; an existing review for the same key is kept."""
+        if not entries:
+            return
+        db = SessionLocal()
+        try:
+            db.execute(pg_insert(ChunkReview).values(entries).on_conflict_do_nothing())
+            db.commit()
+        finally:
+            db.close()
+
+    def writer(self, prompt_version: str, model_name: str, flush_interval: float) -> "ReviewCacheWriter":
+        return ReviewCacheWriter(self, prompt_version, model_name, flush_interval)
+
+
+class ReviewCacheWriter:
+    """
+    Buffers the reviews of one analysis and writes them at most every `flush_interval` seconds
+    (or when forced), so checkpointing costs one insert per interval rather than one per chunk.
+    A crash loses at most the reviews of the last interval.
+    """
+
+    def __init__(self, cache: ReviewCache, prompt_version: str, model_name: str, flush_interval: float):
+        self._cache = cache
+        self.prompt_version = prompt_version
+        self.model_name = model_name
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[str, list] = {}
+        self._last_flush = time.monotonic()
+
+    def add(self, key: str, suggestions: list) -> None:
+        with self._lock:
+            self._pending[key] = suggestions
+        self.flush()
+
+    def flush(self, force: bool = False) -> None:
+        with self._lock:
+            if not self._pending or (not force and time.monotonic() - self._last_flush < self._flush_interval):
+                return
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        entries = [
+            {
+                "content_hash": key,
+                "prompt_version": self.prompt_version,
+                "model_name": self.model_name,
+                "suggestions": suggestions,
+            }
+            for key, suggestions in pending.items()
+        ]
+        try:
+            self._cache.store(entries)
+        except Exception as e:
+            # The cache is an optimization; a lost checkpoint only means re-reviewing those chunks
+            print(f"[ReviewCache] Failed to store {len(entries)} chunk reviews: {e}")
+
+
+review_cache = ReviewCache()
@@ -0,0 +1,152 @@
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import or_, text
+from sqlalchemy.engine import Connection
+
+from app.core.config import settings
+from app.core.database import SessionLocal, engine
+from app.core.metrics import metrics
+from app.models import Analysis, Repository
+from app.services.admission import AdmissionRejected, admission_controller
+from app.services.analysis_service import ACTIVE_STATUSES, analysis_service
+
+# pg advisory lock key held by the scheduler leader ("CodeNova" as a 63-bit integer)
+LEADER_LOCK_KEY = int.from_bytes(b"CodeNova", "big") & 0x7FFFFFFFFFFFFFFF
+
+scheduler_leader = metrics.gauge("analysis_scheduler_leader", "1 while this process holds the re-analysis scheduler lock")
+rescans_scheduled_total = metrics.counter("analysis_rescans_scheduled_total", "Re-analyses of stale repositories scheduled by this process")
+
+
+class StaleAnalysisScheduler:
+    """
+    Periodically re-analyses repositories whose latest analysis is stale: older than
+    ANALYSIS_RESCAN_MAX_AGE_SECONDS, or made with another prompt version or model.
+
+    Every API and worker process runs one, but only the holder of a session-level Postgres
+    advisory lock schedules anything. The lock lives on a connection the leader keeps open, so it
+    passes to another process as soon as the leader dies or loses its connection. Re-analyses are
+    queued in the bulk class with a random not_before spread over ANALYSIS_RESCAN_JITTER_SECONDS.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn: Optional[Connection] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="analysis-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self._release_leadership()
+
+    def _loop(self) -> None:
+        # Replicas started together should not all poll the lock at the same moment
+        delay = random.uniform(0, settings.ANALYSIS_RESCAN_INTERVAL_SECONDS)
+        while not self._stop.wait(delay):
+            delay = settings.ANALYSIS_RESCAN_INTERVAL_SECONDS
+            try:
+                if self.is_leader():
+                    self.run_once()
+            except Exception as e:
+                print(f"[Scheduler] Re-analysis run failed: {e}")
+
+    def is_leader(self) -> bool:
+        """Check that the lock is still held, or try to take it."""
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT 1"))
+                self._conn.commit()
+                return True
+            except Exception as e:
+                print(f"[Scheduler] Lost scheduler leadership: {e}")
+                self._release_leadership()
+        conn = engine.connect()
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": LEADER_LOCK_KEY}).scalar()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._conn = conn
+        scheduler_leader.set(1)
+        print("[Scheduler] Became re-analysis scheduler leader")
+        return True
+
+    def _release_leadership(self) -> None:
+        conn, self._conn = self._conn, None
+        scheduler_leader.set(0)
+        if conn is None:
+            return
+        try:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LEADER_LOCK_KEY})
+            conn.commit()
+        except Exception:
+            pass
+        # Never hand a connection that may still hold the lock back to the pool
+        conn.invalidate()
+        conn.close()
+
+    def run_once(self) -> int:
+        """Queue re-analyses for up to ANALYSIS_RESCAN_BATCH_SIZE stale repositories. Returns how many were created."""
+        from app.services.ai_service import AIService  # lazy import to avoid configuring Gemini at import time
+
+        db = SessionLocal()
+        try:
+            latest = (
+                db.query(
+                    Analysis.repository_id, Analysis.ref, Analysis.commit_hash, Analysis.status,
+                    Analysis.created_at, Analysis.prompt_version, Analysis.model_name,
+                )
+                .distinct(Analysis.repository_id)
+                .order_by(Analysis.repository_id, Analysis.created_at.desc(), Analysis.id.desc())
+                .subquery()
+            )
+            cutoff = datetime.utcnow() - timedelta(seconds=settings.ANALYSIS_RESCAN_MAX_AGE_SECONDS)
+            stale = (
+                db.query(Repository, latest.c.ref, latest.c.commit_hash)
+                .join(latest, latest.c.repository_id == Repository.id)
+                .filter(
+                    latest.c.status.notin_(ACTIVE_STATUSES),
+                    or_(
+                        latest.c.created_at < cutoff,
+                        latest.c.prompt_version.is_distinct_from(AIService.PROMPT_VERSION),
+                        latest.c.model_name.is_distinct_from(settings.GEMINI_MODEL),
+                    ),
+                )
+                .order_by(latest.c.created_at)
+                .limit(settings.ANALYSIS_RESCAN_BATCH_SIZE)
+                .all()
+            )
+            if not stale:
+                return 0
+            try:
+                enqueued = analysis_service.enqueue_bulk(
+                    db, [(repo, ref or commit_hash) for repo, ref, commit_hash in stale],
+                    admission=admission_controller, jitter_seconds=settings.ANALYSIS_RESCAN_JITTER_SECONDS,
+                )
+            except AdmissionRejected as e:
+                print(f"[Scheduler] Skipping re-analysis run: {e}")
+                return 0
+            created = sum(1 for _, was_created in enqueued if was_created)
+            rescans_scheduled_total.inc(created)
+            print(f"[Scheduler] Scheduled {created} re-analyses of {len(stale)} stale repositories")
+            return created
+        finally:
+            db.close()
+
+
+stale_analysis_scheduler = StaleAnalysisScheduler()
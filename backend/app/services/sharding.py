@@ -0,0 +1,409 @@
+import heapq
+import os
+import socket
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import metrics
+from app.models import Analysis, AnalysisShard, Repository
+from app.services.analysis_service import analysis_service
+from app.services.job_control import JobCancelled, JobContext, ProgressTracker, job_registry
+from app.services.llm_limiter import PRIORITY_ORDER
+from app.services.parse_cache import parse_cache
+from app.services.repository_services import repository_service
+from app.utils.helpers import detect_language, iter_source_files
+
+# Identifies this process on the shards it claims, so its heartbeats only touch its own shards
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+shards_processed_total = metrics.counter(
+    "analysis_shards_processed_total", "Analysis shards run by this process, by role (coordinator/stealer) and outcome"
+)
+
+
+@dataclass
+class _Checkout:
+    workdir: str
+    stack: ExitStack
+    users: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class ShardService:
+    """
+    Splits large analyses into shards that several workers review in parallel.
+
+    The worker that runs an analysis (the coordinator) plans shards from the checkout, stores
+    them, and then claims and reviews shards itself. Idle dispatcher workers on any node claim
+    the remaining ones (work stealing), each from its own checkout of the commit. Claims use
+    SELECT ... FOR UPDATE SKIP LOCKED, so claimants never block on one another, and a shard whose
+    worker stopped heartbeating is claimable again. Shards write their own progress and roll it
+    up into the parent; the coordinator merges their results once all of them completed.
+
+    A stealing worker keeps its checkout of a commit for the next shard of the same analysis, until
+    it has gone unused for ANALYSIS_SHARD_CHECKOUT_IDLE_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (repository id, commit) -> checkout of it used for stolen shards
+        self._checkouts: Dict[Tuple[int, str], _Checkout] = {}
+        self._fetch_locks: Dict[Tuple[int, str], threading.Lock] = {}
+
+    def plan(self, workdir: str) -> Optional[List[List[str]]]:
+        """Shard the checkout's files into balanced groups, or None if it is too small to bother."""
+        sizes = []
+        for path, _ in iter_source_files(workdir, settings.ANALYSIS_MAX_FILE_BYTES):
+            try:
+                sizes.append((path, os.path.getsize(os.path.join(workdir, path))))
+            except OSError:
+                continue
+        total = sum(size for _, size in sizes)
+        count = min(settings.ANALYSIS_MAX_SHARDS, total // max(settings.ANALYSIS_SHARD_TARGET_BYTES, 1), len(sizes))
+        if count < 2:
+            return None
+
+        # Units that must stay together: single files, or whole top-level directories
+        units: Dict[str, List[Tuple[str, int]]] = {}
+        for path, size in sizes:
+            unit = path.split("/", 1)[0] if settings.ANALYSIS_SHARD_STRATEGY == "directory" and "/" in path else path
+            units.setdefault(unit, []).append((path, size))
+
+        # Largest unit first into the currently smallest shard (LPT), which keeps shard sizes close
+        bins: List[Tuple[int, int]] = [(0, i) for i in range(count)]
+        members: List[List[str]] = [[] for _ in range(count)]
+        for files in sorted(units.values(), key=lambda fs: -sum(size for _, size in fs)):
+            load, i = heapq.heappop(bins)
+            members[i].extend(path for path, _ in files)
+            heapq.heappush(bins, (load + sum(size for _, size in files), i))
+        shards = [sorted(paths) for paths in members if paths]
+        return shards if len(shards) > 1 else None
+
+    def has_shards(self, db: Session, analysis_id: int) -> bool:
+        return db.query(AnalysisShard.id).filter(AnalysisShard.analysis_id == analysis_id).first() is not None
+
+    def coordinate(
+        self, db: Session, analysis: Analysis, ctx: JobContext, workdir: str, plan: List[List[str]]
+    ) -> list:
+        """
+        Run `analysis` as shards, reviewing shards from this worker's `workdir` until none is left,
+        then wait for shards taken by other workers. Returns the merged suggestions.
+        An analysis resumed after its coordinator died keeps the shards it already has, and
+        gives its failed shards another try.
+        """
+        if not self.has_shards(db, analysis.id):
+            self._create(db, analysis.id, plan, workdir)
+        else:
+            self._requeue_failed(db, analysis.id)
+
+        while True:
+            ctx.raise_if_done()
+            claimed = self.claim(db, analysis_id=analysis.id)
+            if claimed is not None:
+                self._process(db, claimed[0], claimed[1], analysis, workdir, role="coordinator")
+                continue
+            statuses = dict(
+                db.query(AnalysisShard.status, func.count(AnalysisShard.id))
+                .filter(AnalysisShard.analysis_id == analysis.id)
+                .group_by(AnalysisShard.status)
+                .all()
+            )
+            db.commit()
+            if statuses.get("failed"):
+                error = (
+                    db.query(AnalysisShard.error)
+                    .filter(AnalysisShard.analysis_id == analysis.id, AnalysisShard.status == "failed")
+                    .first()
+                )
+                raise RuntimeError(f"{statuses['failed']} of {sum(statuses.values())} shards failed: {error[0] if error else ''}")
+            if set(statuses) <= {"completed"}:
+                break
+            ctx.wait(settings.ANALYSIS_POLL_INTERVAL_SECONDS)
+
+        self._rollup(db, analysis.id)
+        merged = []
+        for (results,) in (
+            db.query(AnalysisShard.results).filter(AnalysisShard.analysis_id == analysis.id).order_by(AnalysisShard.index)
+        ):
+            merged.extend(results or [])
+        db.commit()
+        merged.sort(key=lambda s: str(s.get("file_path", "")))  # stable: keeps line order within a file
+        return merged
+
+    def _create(self, db: Session, analysis_id: int, plan: List[List[str]], workdir: str) -> None:
+        chunk_totals = self._count_chunks(workdir, plan)
+        rows = [
+            {
+                "analysis_id": analysis_id,
+                "index": i,
+                "paths": paths,
+                "bytes": sum(os.path.getsize(os.path.join(workdir, p)) for p in paths),
+                "status": "pending",
+                # Planned up front so the parent's total covers shards nobody has started yet
+                "chunks_total": chunk_totals[i],
+            }
+            for i, paths in enumerate(plan)
+        ]
+        db.execute(pg_insert(AnalysisShard).values(rows).on_conflict_do_nothing())
+        db.query(Analysis).filter(Analysis.id == analysis_id).update(
+            {
+                Analysis.files_total: sum(len(paths) for paths in plan),
+                Analysis.files_done: 0,
+                Analysis.chunks_total: sum(chunk_totals),
+                Analysis.chunks_done: 0,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+        print(f"[ShardService] Split analysis {analysis_id} into {len(plan)} shards")
+
+    def _count_chunks(self, workdir: str, plan: List[List[str]]) -> List[int]:
+        # Chunk boundaries land in the parse cache, so the coordinator's own shards reuse them
+        items = [(path, detect_language(path), None) for paths in plan for path in paths]
+        parsed = parse_cache.chunk_files(workdir, items, settings.ANALYSIS_MAX_CHUNK_LINES, repository_service.blob_shas(workdir))
+        counts = {path: len(chunks) for path, chunks in parsed}
+        return [sum(counts.get(path, 0) for path in paths) for paths in plan]
+
+    def _requeue_failed(self, db: Session, analysis_id: int) -> None:
+        # A resumed coordinator retries failed shards rather than failing the whole analysis for them
+        requeued = (
+            db.query(AnalysisShard)
+            .filter(AnalysisShard.analysis_id == analysis_id, AnalysisShard.status == "failed")
+            .update(
+                {AnalysisShard.status: "pending", AnalysisShard.error: None, AnalysisShard.completed_at: None},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if requeued:
+            print(f"[ShardService] Requeued {requeued} failed shards of analysis {analysis_id}")
+
+    def claim(
+        self, db: Session, lanes: Optional[List[str]] = None, analysis_id: Optional[int] = None
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Claim a shard of a running analysis (of `analysis_id`, or of any analysis in the `lanes`
+        priority classes, highest class and oldest analysis first). Returns (shard id, attempt).
+        """
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=settings.ANALYSIS_LEASE_SECONDS)
+        query = (
+            db.query(AnalysisShard)
+            .join(Analysis, Analysis.id == AnalysisShard.analysis_id)
+            .filter(
+                Analysis.status == "in_progress",
+                or_(
+                    AnalysisShard.status == "pending",
+                    and_(AnalysisShard.status == "in_progress", AnalysisShard.heartbeat_at < stale),
+                ),
+            )
+        )
+        if analysis_id is not None:
+            query = query.filter(AnalysisShard.analysis_id == analysis_id)
+        if lanes is not None:
+            query = query.filter(Analysis.priority.in_(lanes))
+        rank = case({p: i for i, p in enumerate(PRIORITY_ORDER)}, value=Analysis.priority, else_=len(PRIORITY_ORDER))
+        shard = (
+            query.order_by(rank, Analysis.created_at, AnalysisShard.analysis_id, AnalysisShard.index)
+            .with_for_update(skip_locked=True, of=AnalysisShard)
+            .first()
+        )
+        if shard is None:
+            db.commit()
+            return None
+        shard.status = "in_progress"
+        shard.worker = WORKER_ID
+        shard.attempts += 1
+        shard.started_at = now
+        shard.heartbeat_at = now
+        shard.files_done = 0
+        shard.chunks_done = 0
+        shard.tokens_used = 0
+        shard.error = None
+        claimed = (shard.id, shard.attempts)
+        db.commit()
+        return claimed
+
+    def run_stolen(self, db: Session, shard_id: int, attempt: int) -> None:
+        """Review a shard claimed by an idle worker, from a checkout of its own."""
+        shard = db.get(AnalysisShard, shard_id)
+        analysis = db.get(Analysis, shard.analysis_id) if shard else None
+        if analysis is None:
+            return
+        try:
+            repo = db.get(Repository, analysis.repository_id)
+            with self._stolen_checkout(repo, analysis.commit_hash) as workdir:
+                self._process(db, shard_id, attempt, analysis, workdir, role="stealer")
+        except Exception as e:
+            self._fail(db, shard_id, attempt, e)
+            shards_processed_total.inc(role="stealer", outcome="failed")
+
+    @contextmanager
+    def _stolen_checkout(self, repo: Repository, commit_hash: str):
+        # A shared checkout of the commit: fetched once per worker, not once per stolen shard
+        key = (repo.id, commit_hash)
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+        with fetch_lock:  # threads stealing shards of the same commit wait for one fetch
+            with self._lock:
+                checkout = self._checkouts.get(key)
+                if checkout is not None:
+                    checkout.users += 1
+            if checkout is None:
+                stack = ExitStack()
+                try:
+                    workdir = stack.enter_context(repository_service.checkout(repo, commit_hash))
+                except BaseException:
+                    stack.close()
+                    raise
+                checkout = _Checkout(workdir, stack, users=1)
+                with self._lock:
+                    self._checkouts[key] = checkout
+        try:
+            yield checkout.workdir
+        finally:
+            with self._lock:
+                checkout.users -= 1
+                checkout.last_used = time.monotonic()
+            self.prune_checkouts()
+
+    def prune_checkouts(self, max_idle: Optional[float] = None) -> None:
+        """Remove checkouts kept for stolen shards that went unused for `max_idle` (default ANALYSIS_SHARD_CHECKOUT_IDLE_SECONDS)."""
+        cutoff = time.monotonic() - (settings.ANALYSIS_SHARD_CHECKOUT_IDLE_SECONDS if max_idle is None else max_idle)
+        with self._lock:
+            idle = [key for key, c in self._checkouts.items() if c.users == 0 and c.last_used <= cutoff]
+            removed = [self._checkouts.pop(key) for key in idle]
+            for key in idle:
+                self._fetch_locks.pop(key, None)
+        for checkout in removed:
+            checkout.stack.close()
+
+    def _process(self, db: Session, shard_id: int, attempt: int, analysis: Analysis, workdir: str, role: str) -> None:
+        shard = db.get(AnalysisShard, shard_id)
+        analysis_id = analysis.id
+
+        def poll_cancel_reason():
+            row = (
+                db.query(Analysis.status, Analysis.cancel_reason, AnalysisShard.attempts)
+                .join(AnalysisShard, AnalysisShard.analysis_id == Analysis.id)
+                .filter(AnalysisShard.id == shard_id)
+                .first()
+            )
+            db.commit()
+            if row is None or row.status == "cancelled":
+                return (row.cancel_reason if row else None) or "cancelled"
+            if row.status != "in_progress" or row.attempts != attempt:
+                return "lease_lost"
+            return None
+
+        progress = ProgressTracker(
+            lambda values: self._write_progress(shard_id, attempt, analysis_id, values),
+            settings.ANALYSIS_PROGRESS_FLUSH_SECONDS,
+        )
+        ctx = JobContext(analysis_id, analysis.deadline_at, poll_cancel_reason, progress=progress)
+        checkpoints = analysis_service.checkpoint_writer(analysis)
+        job_registry.register(ctx)
+        try:
+            files = analysis_service._chunk_checkout(workdir, shard.paths)
+            progress.set_totals(len(files), sum(len(chunks) for chunks in files))
+            suggestions = analysis_service.review_chunks(
+                db, analysis, files, ctx, progress, checkpoints, analysis_service.symbol_index(workdir),
+            )
+            ctx.raise_if_done()
+            progress.flush(force=True)
+            db.query(AnalysisShard).filter(
+                AnalysisShard.id == shard_id, AnalysisShard.status == "in_progress", AnalysisShard.attempts == attempt
+            ).update(
+                {
+                    AnalysisShard.status: "completed",
+                    AnalysisShard.results: suggestions,
+                    AnalysisShard.completed_at: datetime.utcnow(),
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            shards_processed_total.inc(role=role, outcome="completed")
+        except JobCancelled:
+            db.rollback()
+            shards_processed_total.inc(role=role, outcome="cancelled")
+            if role == "coordinator":
+                raise
+        except Exception as e:
+            db.rollback()
+            self._fail(db, shard_id, attempt, e)
+            shards_processed_total.inc(role=role, outcome="failed")
+        finally:
+            checkpoints.flush(force=True)
+            job_registry.unregister(ctx)
+
+    def _fail(self, db: Session, shard_id: int, attempt: int, error: Exception) -> None:
+        print(f"[ShardService] Shard {shard_id} failed: {error}")
+        db.query(AnalysisShard).filter(
+            AnalysisShard.id == shard_id, AnalysisShard.status == "in_progress", AnalysisShard.attempts == attempt
+        ).update(
+            {AnalysisShard.status: "failed", AnalysisShard.error: str(error), AnalysisShard.completed_at: datetime.utcnow()},
+            synchronize_session=False,
+        )
+        db.commit()
+
+    def _write_progress(self, shard_id: int, attempt: int, analysis_id: int, values: Dict[str, int]) -> None:
+        # Own session, like AnalysisService._write_progress
+        db = SessionLocal()
+        try:
+            db.query(AnalysisShard).filter(
+                AnalysisShard.id == shard_id, AnalysisShard.status == "in_progress", AnalysisShard.attempts == attempt
+            ).update(
+                {getattr(AnalysisShard, k): v for k, v in values.items() if k != "files_total"},
+                synchronize_session=False,
+            )
+            self._rollup(db, analysis_id)
+        finally:
+            db.close()
+
+    def _rollup(self, db: Session, analysis_id: int) -> None:
+        # The parent's counters are the sums over its shards (chunks_total is planned for every shard)
+        files_done, chunks_total, chunks_done, tokens_used = (
+            db.query(
+                func.coalesce(func.sum(AnalysisShard.files_done), 0),
+                func.coalesce(func.sum(AnalysisShard.chunks_total), 0),
+                func.coalesce(func.sum(AnalysisShard.chunks_done), 0),
+                func.coalesce(func.sum(AnalysisShard.tokens_used), 0),
+            )
+            .filter(AnalysisShard.analysis_id == analysis_id)
+            .one()
+        )
+        db.query(Analysis).filter(Analysis.id == analysis_id, Analysis.status == "in_progress").update(
+            {
+                Analysis.files_done: files_done,
+                Analysis.chunks_total: chunks_total,
+                Analysis.chunks_done: chunks_done,
+                Analysis.tokens_used: tokens_used,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+
+    def heartbeat(self, db: Session) -> None:
+        db.query(AnalysisShard).filter(AnalysisShard.worker == WORKER_ID, AnalysisShard.status == "in_progress").update(
+            {AnalysisShard.heartbeat_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+        self.prune_checkouts()
+
+    def discard(self, db: Session, analysis_id: int) -> None:
+        """Drop the shards of a finished analysis; their results live on the analysis now."""
+        db.query(AnalysisShard).filter(AnalysisShard.analysis_id == analysis_id).delete(synchronize_session=False)
+        db.commit()
+
+
+shard_service = ShardService()
@@ -0,0 +1,200 @@
+import hashlib
+import posixpath
+import shutil
+import tempfile
+import random
+import threading
+import os
+import re
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models import Repository, Snapshot
+from app.services.content_store import content_store
+from app.utils.helpers import SKIPPED_DIRS, detect_language
+
+# Repositories whose code is uploaded rather than fetched have URLs of this form
+UPLOAD_URL_PREFIX = "upload://"
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+_BLOB_SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+
+# One manifest entry: (path, git blob SHA, size)
+ManifestEntry = Tuple[str, str, int]
+
+
+class SnapshotService:
+    """
+    Snapshots of uploaded code. An upload repository's analyses name a snapshot digest as their
+    commit; `checkout` of such a repository materializes the snapshot from the content store
+    instead of fetching from git, so the rest of the pipeline is unchanged.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkouts: Dict[str, Dict[str, str]] = {}  # workdir -> path -> blob SHA
+        self._gc_stop = threading.Event()
+        self._gc_thread: Optional[threading.Thread] = None
+
+    def is_upload_repository(self, repo) -> bool:
+        return repo.url.startswith(UPLOAD_URL_PREFIX)
+
+    def create_repository(self, db: Session, name: str, user_id: int) -> Repository:
+        repo = Repository(name=name, url=f"{UPLOAD_URL_PREFIX}{uuid.uuid4().hex}", user_id=user_id)
+        db.add(repo)
+        db.commit()
+        db.refresh(repo)
+        return repo
+
+    def reviewable_path(self, name: str) -> Optional[str]:
+        """Normalized relative path of a file worth reviewing; None for anything else (including `..` escapes)."""
+        name = posixpath.normpath(name.replace("\\", "/").lstrip("/"))
+        parts = name.split("/")
+        if name in (".", "") or ".." in parts or any(part in SKIPPED_DIRS for part in parts[:-1]):
+            return None
+        return name if detect_language(name) else None
+
+    def normalize_manifest(self, entries: List[ManifestEntry]) -> Tuple[List[ManifestEntry], List[str]]:
+        """
+        Split a client's manifest into the entries to keep (reviewable paths, normalized) and the
+        paths to ignore (not reviewable, or over ANALYSIS_MAX_FILE_BYTES). Raises ValueError on a
+        malformed blob SHA; a repeated path keeps its last entry.
+        """
+        kept: Dict[str, ManifestEntry] = {}
+        ignored = []
+        for path, sha, size in entries:
+            sha = sha.lower()
+            if not _BLOB_SHA_RE.match(sha):
+                raise ValueError(f"{path}: {sha!r} is not a git blob SHA (40 hex digits)")
+            name = self.reviewable_path(path)
+            if name is None or size > settings.ANALYSIS_MAX_FILE_BYTES:
+                ignored.append(path)
+            else:
+                kept[name] = (name, sha, size)
+        return list(kept.values()), ignored
+
+    def digest(self, entries: List[ManifestEntry]) -> str:
+        hasher = hashlib.sha256()
+        for path, sha, _ in sorted(entries):
+            hasher.update(f"{path}\0{sha}\n".encode("utf-8", errors="surrogateescape"))
+        return hasher.hexdigest()
+
+    def find(self, db: Session, digest: str, repo_id: Optional[int] = None, user_id: Optional[int] = None) -> Optional[Snapshot]:
+        """The snapshot `digest` of repository `repo_id`, or else the latest one in any of `user_id`'s upload repositories."""
+        query = db.query(Snapshot).filter(Snapshot.digest == digest)
+        if repo_id is not None:
+            return query.filter(Snapshot.repository_id == repo_id).first()
+        return (
+            query.join(Repository, Repository.id == Snapshot.repository_id)
+            .filter(Repository.user_id == user_id, Repository.url.startswith(UPLOAD_URL_PREFIX))
+            .order_by(Snapshot.created_at.desc(), Snapshot.id.desc())
+            .first()
+        )
+
+    def create(self, db: Session, repo: Repository, entries: List[ManifestEntry]) -> Snapshot:
+        """Record a snapshot of `repo` whose blobs are all in the content store; an identical one is reused."""
+        entries = sorted(entries)
+        digest = self.digest(entries)
+        db.execute(
+            pg_insert(Snapshot)
+            .values(
+                repository_id=repo.id,
+                digest=digest,
+                manifest=[list(e) for e in entries],
+                file_count=len(entries),
+                total_bytes=sum(size for _, _, size in entries),
+            )
+            .on_conflict_do_nothing()
+        )
+        db.commit()
+        return db.query(Snapshot).filter(Snapshot.repository_id == repo.id, Snapshot.digest == digest).one()
+
+    def start_gc(self) -> None:
+        """Sweep the content store (see `collect_garbage`) every CONTENT_STORE_GC_INTERVAL_SECONDS on a background thread."""
+        if self._gc_thread is not None:
+            return
+        self._gc_stop.clear()
+        self._gc_thread = threading.Thread(target=self._gc_loop, name="content-store-gc", daemon=True)
+        self._gc_thread.start()
+
+    def stop_gc(self, timeout: float = 5.0) -> None:
+        self._gc_stop.set()
+        if self._gc_thread is not None:
+            self._gc_thread.join(timeout=timeout)
+            self._gc_thread = None
+
+    def _gc_loop(self) -> None:
+        # Processes started together should not all walk the store at the same moment
+        delay = random.uniform(0, settings.CONTENT_STORE_GC_INTERVAL_SECONDS)
+        while not self._gc_stop.wait(delay):
+            delay = settings.CONTENT_STORE_GC_INTERVAL_SECONDS
+            try:
+                self.collect_garbage()
+            except Exception as e:
+                print(f"[SnapshotService] Content store sweep failed: {e}")
+
+    def collect_garbage(self) -> int:
+        """Delete content-store blobs that no snapshot lists and nobody used for CONTENT_STORE_TTL_SECONDS."""
+        referenced = set()
+        db = SessionLocal()
+        try:
+            for (manifest,) in db.query(Snapshot.manifest).yield_per(100):
+                referenced.update(sha for _, sha, _ in manifest)
+        finally:
+            db.close()
+        removed = content_store.prune(referenced, settings.CONTENT_STORE_TTL_SECONDS)
+        if removed:
+            print(f"[SnapshotService] Pruned {removed} unreferenced blobs from the content store")
+        return removed
+
+    def resolve_refs(self, repo, refs: List[str]) -> Dict[str, str]:
+        """Snapshot digests name themselves; any other ref (a branch name, "archive") means the latest snapshot."""
+        db = SessionLocal()
+        try:
+            latest = (
+                db.query(Snapshot.digest)
+                .filter(Snapshot.repository_id == repo.id)
+                .order_by(Snapshot.created_at.desc(), Snapshot.id.desc())
+                .first()
+            )
+        finally:
+            db.close()
+        return {ref: ref if _DIGEST_RE.match(ref) or latest is None else latest.digest for ref in refs}
+
+    @contextmanager
+    def checkout(self, repo, digest: str):
+        """Like RepositoryService.checkout, for a snapshot of an upload repository (see `resolve_refs`)."""
+        digest = self.resolve_refs(repo, [digest])[digest]
+        db = SessionLocal()
+        try:
+            snapshot = db.query(Snapshot).filter(Snapshot.repository_id == repo.id, Snapshot.digest == digest).first()
+            manifest = snapshot.manifest if snapshot else None
+        finally:
+            db.close()
+        if manifest is None:
+            raise RuntimeError(f"Snapshot {digest} of repository {repo.id} not found")
+        workdir = tempfile.mkdtemp(prefix="codenova-snapshot-")
+        try:
+            for path, sha, _ in manifest:
+                content_store.link(sha, os.path.join(workdir, *path.split("/")))
+            with self._lock:
+                self._checkouts[workdir] = {path: sha for path, sha, _ in manifest}
+            yield workdir
+        finally:
+            with self._lock:
+                self._checkouts.pop(workdir, None)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def blob_shas(self, workdir: str) -> Optional[Dict[str, str]]:
+        """Blob SHAs of a snapshot checkout, or None if `workdir` is not one."""
+        with self._lock:
+            return self._checkouts.get(workdir)
+
+
+snapshot_service = SnapshotService()
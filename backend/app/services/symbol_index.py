@@ -0,0 +1,149 @@
+import keyword
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.parse_cache import parse_cache
+from app.services.repository_services import repository_service
+from app.utils.ast_parser import CodeChunk, extract_symbols, module_name
+from app.utils.helpers import iter_source_files
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# Attribute references (`obj.name`), which only resolve to methods defined once in the repository
+_ATTRIBUTE_RE = re.compile(r"\.\s*([A-Za-z_][A-Za-z0-9_]*)")
+_IGNORED_NAMES = set(keyword.kwlist) | {"self", "cls", "__init__"}
+_IMPORT_LINE_RE = re.compile(r"^\s*(from\s+\S+\s+)?import\s")
+
+
+@dataclass
+class SymbolDef:
+    path: str
+    name: str  # qualified within the file, e.g. "AIService.review_code"
+    kind: str  # class, function, method, variable
+    start_line: int
+    end_line: int
+    signature: str
+    doc: str
+
+    @property
+    def short_name(self) -> str:
+        return self.name.rsplit(".", 1)[-1]
+
+    def render(self) -> str:
+        doc = '\n    """' + self.doc.replace("\n", "\n    ") + '"""' if self.doc else ""
+        return f"# {self.path}:{self.start_line} ({self.name})\n{self.signature}{doc}"
+
+
+class SymbolIndex:
+    """
+    Definitions and imports of every file of one commit, used to give each reviewed chunk the
+    signatures and docstrings of what it references without pasting neighbouring files.
+
+    A name in the chunk resolves, in order of preference, to what the chunk's file imports under
+    that name, to a definition in the same file, or to the only definition of that name in the
+    repository. Ambiguous names are left out rather than guessed.
+    """
+
+    def __init__(self, files: Dict[str, dict], root: Optional[str] = None, blob_shas: Optional[Dict[str, str]] = None):
+        self.root = root  # the checkout the files were read from
+        self.blob_shas = blob_shas or {}
+        self.module_paths: Dict[str, str] = {module_name(path): path for path in files}
+        self.defs: Dict[str, List[SymbolDef]] = {}  # by path
+        self.by_short_name: Dict[str, List[SymbolDef]] = {}
+        self.by_module: Dict[str, Dict[str, SymbolDef]] = {}  # module -> qualified name -> def
+        self.imports: Dict[str, Dict[str, Tuple[str, Optional[str]]]] = {}  # path -> alias -> (module, name)
+        for path, symbols in files.items():
+            defs = [SymbolDef(path, *d) for d in symbols.get("defs", [])]
+            self.defs[path] = defs
+            module = self.by_module.setdefault(module_name(path), {})
+            for d in defs:
+                self.by_short_name.setdefault(d.short_name, []).append(d)
+                module[d.name] = d
+            self.imports[path] = {alias: (mod, name) for mod, name, alias in symbols.get("imports", [])}
+
+    def __len__(self) -> int:
+        return sum(len(defs) for defs in self.defs.values())
+
+    def imported_paths(self, path: str) -> List[str]:
+        """Files of the repository that `path` imports at module level (the edges of the import graph)."""
+        found = []
+        for module, name in self.imports.get(path, {}).values():
+            # `from pkg import mod` imports a module; `from mod import name` depends on mod
+            target = self.module_paths.get(f"{module}.{name}") if name else None
+            target = target or self.module_paths.get(module)
+            if target and target != path:
+                found.append(target)
+        return list(dict.fromkeys(found))
+
+    def references(self, chunk: CodeChunk) -> List[SymbolDef]:
+        """Definitions outside `chunk` that it references, most certain first."""
+        imports = dict(self.imports.get(chunk.path, {}))
+        code = []
+        for line in chunk.text.split("\n"):
+            if _IMPORT_LINE_RE.match(line):
+                # Function-level imports; their module paths are not references
+                imports.update({alias: (mod, name) for mod, name, alias in extract_symbols(line.strip(), chunk.path, chunk.language)["imports"]})
+            else:
+                code.append(line)
+        code = "\n".join(code)
+        names = dict.fromkeys(n for n in _IDENTIFIER_RE.findall(code) if n not in _IGNORED_NAMES)
+        attributes = set(_ATTRIBUTE_RE.findall(code))
+        found: Dict[Tuple[str, str], Tuple[int, SymbolDef]] = {}
+
+        def add(rank: int, d: SymbolDef) -> None:
+            if d.path == chunk.path and d.start_line <= chunk.end_line and d.end_line >= chunk.start_line:
+                return  # defined (or enclosing) in the chunk itself
+            key = (d.path, d.name)
+            if key not in found or rank < found[key][0]:
+                found[key] = (rank, d)
+
+        for name in names:
+            if name in imports:
+                # An imported name means what it was imported as: a repository definition, or
+                # something external (or a module) that has no entry here
+                module, imported = imports[name]
+                target = self.by_module.get(module, {}).get(imported) if imported else None
+                if target is not None:
+                    add(0, target)
+                continue
+            candidates = self.by_short_name.get(name, [])
+            local = [d for d in candidates if d.path == chunk.path and d.kind != "method"]
+            if local:
+                for d in local:
+                    add(1, d)
+                continue
+            if len(candidates) == 1 and (candidates[0].kind != "method" or name in attributes):
+                add(2 if candidates[0].kind != "method" else 3, candidates[0])
+        return [d for _, d in sorted(found.values(), key=lambda item: (item[0], item[1].path, item[1].start_line))]
+
+    def context_for(self, chunk: CodeChunk) -> str:
+        """Rendered definitions `chunk` references, within the ANALYSIS_CONTEXT_* limits ("" if none)."""
+        parts: List[str] = []
+        size = 0
+        for d in self.references(chunk)[:settings.ANALYSIS_CONTEXT_MAX_SYMBOLS]:
+            text = d.render()
+            if size + len(text) > settings.ANALYSIS_CONTEXT_MAX_CHARS:
+                break
+            parts.append(text)
+            size += len(text) + 2
+        return "\n\n".join(parts)
+
+
+class SymbolIndexer:
+    def build(self, workdir: str, blob_shas: Optional[Dict[str, str]] = None) -> SymbolIndex:
+        """
+        Index every reviewable file of a checkout. Symbols are cached per blob (see
+        ParseCache.symbol_files), so re-indexing a later commit only parses the files that changed.
+        """
+        if blob_shas is None:
+            blob_shas = repository_service.blob_shas(workdir)
+        items = [
+            (path, language, None)
+            for path, language in iter_source_files(workdir, settings.ANALYSIS_MAX_FILE_BYTES)
+            if language == "python"  # the only language extract_symbols understands so far
+        ]
+        return SymbolIndex(dict(parse_cache.symbol_files(workdir, items, blob_shas)), workdir, blob_shas)
+
+
+symbol_indexer = SymbolIndexer()
@@ -0,0 +1,251 @@
+import datetime
+import hashlib
+import os
+import re
+import threading
+import uuid
+from typing import AsyncIterator, BinaryIO, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import metrics
+from app.models import Upload
+from app.utils.helpers import detect_language
+
+upload_bytes_total = metrics.counter("upload_bytes_total", "Bytes of upload parts received, by outcome (accepted/rejected)")
+uploads_total = metrics.counter("uploads_total", "Uploads by outcome (completed/aborted/expired/corrupt)")
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+# Spool files are read back in blocks of this size when a running hash has to be rebuilt
+_READ_BLOCK = 1024 * 1024
+
+
+class UploadNotFound(Exception):
+    """No such upload, or it expired."""
+
+
+class UploadConflict(Exception):
+    """A part does not start where the upload stands, or the upload is not in a state to take it."""
+
+    def __init__(self, message: str, received: int):
+        super().__init__(message)
+        self.received = received
+
+
+class UploadRejected(ValueError):
+    """A part or upload failed validation (size, checksum)."""
+
+
+class UploadService:
+    """
+    Resumable uploads: initiate with the file's size (and optionally its SHA-256), send parts
+    at increasing offsets, each with its own SHA-256, then complete.
+
+    Parts are streamed straight into the upload's spool file at their offset and only count
+    once their checksum matched, so a failed or interrupted part is simply sent again from
+    `received`. The whole file's SHA-256 is updated part by part as they arrive and checked on
+    completion. Parts of one upload are serialized by a row lock, so any API process can take
+    any part; a process that did not see the earlier parts rebuilds the running hash from the
+    spool file once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # upload id -> (bytes hashed, running SHA-256 of them)
+        self._hashers: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+
+    def path(self, upload_id: str) -> str:
+        return os.path.join(settings.UPLOAD_SPOOL_DIR, upload_id)
+
+    def initiate(
+        self, db: Session, filename: str, size: int, sha256: Optional[str] = None, language: Optional[str] = None,
+    ) -> Upload:
+        if size < 0 or size > settings.UPLOAD_MAX_BYTES:
+            raise UploadRejected(f"Uploads are limited to {settings.UPLOAD_MAX_BYTES} bytes")
+        if sha256 is not None and not _SHA256_RE.match(sha256.lower()):
+            raise UploadRejected("sha256 must be 64 hex digits")
+        self.expire(db)
+        upload = Upload(
+            id=uuid.uuid4().hex,
+            filename=os.path.basename(filename.replace("\\", "/")) or "upload",
+            language=language or detect_language(filename),
+            size=size,
+            sha256=sha256.lower() if sha256 else None,
+        )
+        os.makedirs(settings.UPLOAD_SPOOL_DIR, exist_ok=True)
+        open(self.path(upload.id), "wb").close()
+        db.add(upload)
+        db.commit()
+        db.refresh(upload)
+        return upload
+
+    def get(self, db: Session, upload_id: str) -> Upload:
+        upload = db.query(Upload).filter(Upload.id == upload_id).first()
+        if upload is None:
+            raise UploadNotFound(upload_id)
+        return upload
+
+    async def receive_part(self, upload_id: str, offset: int, body: AsyncIterator[bytes], checksum: str) -> Upload:
+        """
+        Stream one part from `body` into the spool file at `offset`. Raises UploadConflict unless
+        `offset` is the upload's `received`, and UploadRejected when the part is empty, runs past
+        the declared size or UPLOAD_MAX_PART_BYTES, or does not match `checksum` (hex SHA-256).
+        """
+        checksum = checksum.lower()
+        if not _SHA256_RE.match(checksum):
+            raise UploadRejected("The part checksum must be 64 hex digits")
+        # Own session: the row stays locked while the part streams in, across threadpool hops
+        db = SessionLocal()
+        written = 0
+        try:
+            upload = await run_in_threadpool(self._lock_for_part, db, upload_id, offset)
+            whole = (await run_in_threadpool(self._running_hash, upload)).copy()
+            part = hashlib.sha256()
+            limit = min(settings.UPLOAD_MAX_PART_BYTES, upload.size - offset)
+            with open(self.path(upload_id), "r+b") as f:
+                f.seek(offset)
+                async for piece in body:
+                    written += len(piece)
+                    if written > limit:
+                        raise UploadRejected(f"Parts may not exceed {limit} bytes here")
+                    f.write(piece)
+                    part.update(piece)
+                    whole.update(piece)
+            if not written:
+                raise UploadRejected("Empty part")
+            if part.hexdigest() != checksum:
+                raise UploadRejected("Part checksum mismatch; send the part again")
+            upload.received = offset + written
+            upload.parts += 1
+            upload.updated_at = datetime.datetime.utcnow()
+            await run_in_threadpool(self._commit, db, upload)
+            with self._lock:
+                self._hashers[upload_id] = (upload.received, whole)
+            upload_bytes_total.inc(written, outcome="accepted")
+            return upload
+        except BaseException:
+            upload_bytes_total.inc(written, outcome="rejected")
+            await run_in_threadpool(db.rollback)
+            raise
+        finally:
+            await run_in_threadpool(db.close)
+
+    def receive_file(self, db: Session, upload: Upload, stream: BinaryIO) -> Upload:
+        """Spool a whole file from `stream` into a new upload in one go (single-request uploads)."""
+        whole = hashlib.sha256()
+        received = 0
+        with open(self.path(upload.id), "wb") as f:
+            while True:
+                block = stream.read(_READ_BLOCK)
+                if not block:
+                    break
+                received += len(block)
+                if received > upload.size:
+                    raise UploadRejected(f"Uploads are limited to {upload.size} bytes")
+                f.write(block)
+                whole.update(block)
+        upload.size = upload.received = received
+        upload.parts = 1
+        upload.updated_at = datetime.datetime.utcnow()
+        db.commit()
+        with self._lock:
+            self._hashers[upload.id] = (received, whole)
+        upload_bytes_total.inc(received, outcome="accepted")
+        return self.complete(db, upload.id)
+
+    def complete(self, db: Session, upload_id: str) -> Upload:
+        """Finish an upload once every byte arrived, checking the whole file's SHA-256 if one was declared."""
+        upload = db.query(Upload).filter(Upload.id == upload_id).with_for_update().first()
+        if upload is None:
+            raise UploadNotFound(upload_id)
+        if upload.status == "completed":
+            db.commit()
+            return upload
+        if upload.received != upload.size:
+            db.rollback()
+            raise UploadConflict(f"{upload.size - upload.received} bytes are still missing", upload.received)
+        digest = self._running_hash(upload).hexdigest()
+        if upload.sha256 and digest != upload.sha256:
+            # Every part matched its own checksum, so the client declared the wrong file or sent another one
+            self._delete(db, upload)
+            uploads_total.inc(outcome="corrupt")
+            raise UploadRejected(f"The uploaded file's SHA-256 is {digest}, not the declared {upload.sha256}")
+        upload.digest = digest
+        upload.status = "completed"
+        upload.completed_at = upload.updated_at = datetime.datetime.utcnow()
+        db.commit()
+        db.refresh(upload)
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+        uploads_total.inc(outcome="completed")
+        return upload
+
+    def abort(self, db: Session, upload_id: str) -> None:
+        upload = db.query(Upload).filter(Upload.id == upload_id).with_for_update().first()
+        if upload is None:
+            raise UploadNotFound(upload_id)
+        self._delete(db, upload)
+        uploads_total.inc(outcome="aborted")
+
+    def expire(self, db: Session) -> int:
+        """Delete uploads (and their spool files) untouched for UPLOAD_TTL_SECONDS."""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=settings.UPLOAD_TTL_SECONDS)
+        stale = db.query(Upload).filter(Upload.updated_at < cutoff).with_for_update(skip_locked=True).all()
+        for upload in stale:
+            self._delete(db, upload, commit=False)
+        db.commit()
+        if stale:
+            uploads_total.inc(len(stale), outcome="expired")
+            print(f"[UploadService] Expired {len(stale)} uploads")
+        return len(stale)
+
+    def _lock_for_part(self, db: Session, upload_id: str, offset: int) -> Upload:
+        upload = db.query(Upload).filter(Upload.id == upload_id).with_for_update().first()
+        if upload is None:
+            raise UploadNotFound(upload_id)
+        if upload.status != "uploading":
+            raise UploadConflict(f"Upload is already {upload.status}", upload.received)
+        if offset != upload.received:
+            raise UploadConflict(f"The next part starts at offset {upload.received}", upload.received)
+        return upload
+
+    def _commit(self, db: Session, upload: Upload) -> None:
+        db.commit()
+        db.refresh(upload)
+        db.expunge(upload)
+
+    def _running_hash(self, upload: Upload) -> "hashlib._Hash":
+        # SHA-256 of the first `received` bytes, rebuilt from the spool file when this process lacks it
+        with self._lock:
+            hashed, hasher = self._hashers.get(upload.id, (None, None))
+        if hashed == upload.received:
+            return hasher
+        hasher = hashlib.sha256()
+        remaining = upload.received
+        with open(self.path(upload.id), "rb") as f:
+            while remaining:
+                block = f.read(min(_READ_BLOCK, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        with self._lock:
+            self._hashers[upload.id] = (upload.received, hasher)
+        return hasher
+
+    def _delete(self, db: Session, upload: Upload, commit: bool = True) -> None:
+        with self._lock:
+            self._hashers.pop(upload.id, None)
+        try:
+            os.remove(self.path(upload.id))
+        except FileNotFoundError:
+            pass
+        db.delete(upload)
+        if commit:
+            db.commit()
+
+
+upload_service = UploadService()
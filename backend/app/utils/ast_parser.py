@@ -0,0 +1,475 @@
+"""
+Splits source files into reviewable chunks.
+
+Python files are split along top-level definitions using the `ast` module; oversized classes
+are split per method and anything still too long is cut into line windows. Other languages
+are split the same way along top-level declarations, found from bracket depth (and Ruby's
+block keywords) over the linear-time tokens of app/utils/scanner.py.
+
+`extract_symbols` records a file's definitions (with signatures and docstrings) and imports,
+from which the symbol index gives each chunk the definitions it references. `code_tokens`
+produces the normalized token stream clone detection fingerprints.
+"""
+
+import ast
+import io
+import keyword
+import re
+import tokenize
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from app.utils.scanner import CLOSERS, OPENERS, scan
+
+# Bump whenever chunk boundaries or extracted symbols change so cached per-blob artifacts are not reused
+PARSER_VERSION = "3"
+
+DEFAULT_MAX_CHUNK_LINES = 200
+
+
+@dataclass
+class CodeChunk:
+    path: str
+    language: str
+    start_line: int  # 1-based, inclusive
+    end_line: int  # 1-based, inclusive
+    text: str
+    kind: str = "block"  # module, function, class, method, block
+    name: Optional[str] = None
+    # Winnowed fingerprints of the chunk's tokens (see app/utils/fingerprint.py), when clone detection is on
+    fingerprints: Optional[List[int]] = None
+
+    def numbered_text(self) -> str:
+        """The chunk with absolute line numbers, so model findings map straight back to the file."""
+        width = len(str(self.end_line))
+        return "\n".join(
+            f"{n:>{width}} | {line}" for n, line in enumerate(self.text.split("\n"), start=self.start_line)
+        )
+
+
+def _slice(lines: List[str], start: int, end: int) -> str:
+    return "\n".join(lines[start - 1:end])
+
+
+def _windows(
+    lines: List[str], path: str, language: str, max_lines: int, start: int, end: int,
+    kind: str = "block", name: Optional[str] = None,
+) -> List[CodeChunk]:
+    chunks = []
+    for s in range(start, end + 1, max_lines):
+        e = min(s + max_lines - 1, end)
+        text = _slice(lines, s, e)
+        if text.strip():
+            chunks.append(CodeChunk(path, language, s, e, text, kind, name))
+    return chunks
+
+
+def chunk_lines(source: str, path: str, language: str, max_lines: int = DEFAULT_MAX_CHUNK_LINES) -> List[CodeChunk]:
+    """Cut `source` into windows of at most `max_lines` lines."""
+    lines = source.split("\n")
+    return _windows(lines, path, language, max_lines, 1, len(lines))
+
+
+def _node_start(node: ast.AST) -> int:
+    decorators = getattr(node, "decorator_list", None) or []
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _definition_chunks(
+    node: ast.AST, lines: List[str], path: str, max_lines: int, kind: str, prefix: str = "",
+) -> List[CodeChunk]:
+    start, end = _node_start(node), node.end_lineno
+    name = f"{prefix}{node.name}"
+    if end - start + 1 <= max_lines:
+        return [CodeChunk(path, "python", start, end, _slice(lines, start, end), kind, name)]
+
+    if isinstance(node, ast.ClassDef):
+        chunks: List[CodeChunk] = []
+        cursor = start
+        for child in node.body:
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                child_start = _node_start(child)
+                method_chunks = _definition_chunks(child, lines, path, max_lines, "method", f"{name}.")
+                first = method_chunks[0]
+                if child_start > cursor and first.end_line - cursor + 1 <= max_lines:
+                    # Fold the class header / attributes before this method into its chunk
+                    first.start_line = cursor
+                    first.text = _slice(lines, cursor, first.end_line)
+                elif child_start > cursor:
+                    chunks.extend(_windows(lines, path, "python", max_lines, cursor, child_start - 1, "class", name))
+                chunks.extend(method_chunks)
+                cursor = child.end_lineno + 1
+        if cursor <= end:
+            chunks.extend(_windows(lines, path, "python", max_lines, cursor, end, "class", name))
+        return chunks
+
+    return _windows(lines, path, "python", max_lines, start, end, kind, name)
+
+
+def chunk_python(source: str, path: str, max_lines: int = DEFAULT_MAX_CHUNK_LINES) -> List[CodeChunk]:
+    """One chunk per top-level function/class; module-level statements between them are grouped."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return chunk_lines(source, path, "python", max_lines)
+
+    lines = source.split("\n")
+    chunks: List[CodeChunk] = []
+    pending_start: Optional[int] = None
+    pending_end = 0
+
+    def flush_module_block():
+        nonlocal pending_start
+        if pending_start is not None:
+            chunks.extend(_windows(lines, path, "python", max_lines, pending_start, pending_end, "module"))
+            pending_start = None
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            flush_module_block()
+            kind = "class" if isinstance(node, ast.ClassDef) else "function"
+            chunks.extend(_definition_chunks(node, lines, path, max_lines, kind))
+        else:
+            if pending_start is None:
+                pending_start = _node_start(node)
+            pending_end = node.end_lineno
+    flush_module_block()
+    return chunks
+
+
+# A statement goes on past a line ending in one of these, or onto a line starting with one of these
+_CONTINUES_AFTER = set(",=+-*/%&|^?:.<>!~\\([")
+_CONTINUES_BEFORE = {
+    "{", ".", "?", ":", "&", "|", "+", "=", "else", "catch", "finally", "elsif", "rescue", "ensure", "when",
+    "extends", "implements", "where", "throws",
+}
+# First tokens of lines that attach to the declaration below (annotations, decorators, attributes)
+_PREFIX_TOKENS = {"@"}
+_PREFIX_TOKENS_BY_LANGUAGE = {"rust": {"#", "@"}, "csharp": {"[", "@"}}
+# Ruby keywords opening a block closed by `end`; all but `do` only at the start of a statement
+_RUBY_OPENERS = {"def", "class", "module", "if", "unless", "while", "until", "for", "case", "begin"}
+_RUBY_LOOPS = {"while", "until", "for"}
+# Declaration names are looked for in this much of a declaration's first line
+_MAX_HEADER_CHARS = 300
+_CLASS_HEADER_RE = re.compile(
+    r"\b(?:class|interface|struct|enum|trait|impl|namespace|module|object|protocol|extension|record|type)(?:<[^<>]*>)?\s+([A-Za-z_$][\w$]*)"
+)
+_FUNCTION_HEADER_RE = re.compile(r"\b(?:function\*?|func|fn|fun|def|sub)\s+(?:\([^)]*\)\s*)?([A-Za-z_$][\w$.]*)")
+_VARIABLE_HEADER_RE = re.compile(r"^\s*(?:export\s+)?(?:(?:const|let|var|val|type)\s+)?([A-Za-z_$][\w$]*)\s*[:=]")
+_CALL_HEADER_RE = re.compile(r"([A-Za-z_$~][\w$]*)\s*(?:<[^<>()]*>\s*)?\(")
+_NOT_NAMES = {
+    "if", "for", "while", "switch", "catch", "return", "function", "new", "typeof", "sizeof", "await", "async",
+    "import", "var", "let", "const",
+}
+
+
+def _declaration(header: str, in_class: bool) -> Tuple[str, Optional[str]]:
+    # (kind, name) of a declaration from its first line
+    header = header[:_MAX_HEADER_CHARS]
+    m = _CLASS_HEADER_RE.search(header)
+    if m:
+        return "class", m.group(1)
+    member = "method" if in_class else "function"
+    m = _FUNCTION_HEADER_RE.search(header)
+    if m:
+        return member, m.group(1)
+    m = _VARIABLE_HEADER_RE.match(header)
+    if m:
+        return (member if "=>" in header or "function" in header else "block"), m.group(1)
+    for name in _CALL_HEADER_RE.findall(header):
+        if name not in _NOT_NAMES:
+            return member, name
+    return "block", None
+
+
+class _Layout:
+    """Bracket depth and first/last tokens of every line of a file (index 0 is unused)."""
+
+    def __init__(self, source: str, language: str, line_count: int):
+        size = line_count + 2
+        self.depth_start = [0] * size  # depth before the line's first token
+        self.depth_end = [0] * size  # depth after its last token
+        self.first: List[Optional[str]] = [None] * size
+        self.last: List[Optional[str]] = [None] * size
+        self.code = [False] * size  # the line holds (part of) a token
+        self.inside = [False] * size  # a multi-line string or template continues past the line
+        ended = [False] * size
+        depth = 0
+        statement_start = True  # for Ruby's keyword blocks
+        loop_line = 0
+        for tok in scan(source, language):
+            end_line = tok.line + tok.text.count("\n") if tok.kind == "string" else tok.line
+            text = tok.text if tok.kind in ("ident", "punct") else ""
+            if self.first[tok.line] is None:
+                self.first[tok.line] = text
+                self.depth_start[tok.line] = depth
+                if tok.line > 1 and self.last[tok.line - 1] not in _CONTINUES_AFTER:
+                    statement_start = True
+            if tok.kind == "punct" and tok.text in OPENERS:
+                depth += 1
+            elif tok.kind == "punct" and tok.text in CLOSERS:
+                depth = max(depth - 1, 0)
+            elif language == "ruby" and tok.kind == "ident":
+                if tok.text == "end":
+                    depth = max(depth - 1, 0)
+                elif tok.text == "do" and loop_line != tok.line or (statement_start and tok.text in _RUBY_OPENERS):
+                    depth += 1
+                    loop_line = tok.line if tok.text in _RUBY_LOOPS else loop_line
+            statement_start = tok.kind == "punct" and tok.text in ("=", "(", ";", "|")
+            for line in range(tok.line, end_line + 1):
+                self.code[line] = True
+                self.inside[line] = line < end_line
+            self.last[end_line] = text
+            self.depth_end[end_line] = depth
+            ended[end_line] = True
+        # Lines without a token of their own (blank, comments, string interiors) keep the depth before them
+        for line in range(1, size):
+            if not ended[line]:
+                self.depth_end[line] = self.depth_end[line - 1]
+                if self.first[line] is None:
+                    self.depth_start[line] = self.depth_end[line - 1]
+
+
+def _units(layout: _Layout, lines: List[str], start: int, end: int, level: int, prefixes: set) -> List[Tuple[int, int, bool]]:
+    # Statements and declarations at bracket depth `level` within lines start..end, as
+    # (first line, last line, has a body); leading comments belong to what follows them
+    units = []
+    unit_start: Optional[int] = None
+    comment_start: Optional[int] = None
+    statement_first: Optional[str] = None
+    next_code = [0] * (end + 2)
+    following = 0
+    for line in range(end, start - 1, -1):
+        next_code[line] = following
+        if layout.code[line]:
+            following = line
+    for line in range(start, end + 1):
+        if not layout.code[line]:
+            if unit_start is None:
+                if not lines[line - 1].strip():
+                    comment_start = None
+                elif comment_start is None:
+                    comment_start = line
+            continue
+        if unit_start is None:
+            unit_start = comment_start or line
+            comment_start = None
+        if layout.depth_start[line] <= level:
+            statement_first = layout.first[line]
+        following = next_code[line]
+        if (
+            layout.depth_end[line] <= level
+            and not layout.inside[line]
+            and layout.last[line] not in _CONTINUES_AFTER
+            and statement_first not in prefixes
+            and not (following and layout.first[following] in _CONTINUES_BEFORE)
+        ):
+            # A body (or any bracketed part) spanning lines ends on a line that starts deeper
+            units.append((unit_start, line, layout.depth_start[line] > level))
+            unit_start = None
+    if unit_start is not None:
+        last_code = max((line for line in range(unit_start, end + 1) if layout.code[line]), default=unit_start)
+        units.append((unit_start, last_code, True))
+    return units
+
+
+def chunk_generic(source: str, path: str, language: str, max_lines: int = DEFAULT_MAX_CHUNK_LINES) -> List[CodeChunk]:
+    """
+    Like chunk_python for languages without a parser here: one chunk per top-level declaration
+    (a statement with a bracketed body), statements between them grouped, oversized
+    declarations split into their members and anything still too long cut into line windows.
+    """
+    lines = source.split("\n")
+    layout = _Layout(source, language, len(lines))
+    prefixes = _PREFIX_TOKENS_BY_LANGUAGE.get(language, _PREFIX_TOKENS)
+
+    def header(unit_start: int, unit_end: int, level: int) -> str:
+        # First line of the declaration itself, past its comments and annotations
+        for line in range(unit_start, unit_end + 1):
+            if layout.code[line] and layout.depth_start[line] <= level and layout.first[line] not in prefixes:
+                return lines[line - 1][:_MAX_HEADER_CHARS]
+        return lines[unit_start - 1][:_MAX_HEADER_CHARS]
+
+    def group(units: List[Tuple[int, int, bool]], level: int, kind: str, name: Optional[str]) -> List[CodeChunk]:
+        chunks: List[CodeChunk] = []
+        pending: List[Tuple[int, int]] = []  # statements between declarations
+
+        def flush():
+            # Pack whole statements into chunks; a single oversized one is windowed
+            group_start = None
+            group_end = 0
+            for s, e in pending + [(None, None)]:
+                if group_start is not None and (s is None or e - group_start + 1 > max_lines):
+                    chunks.extend(_windows(lines, path, language, max_lines, group_start, group_end, kind, name))
+                    group_start = None
+                if s is not None:
+                    group_start = s if group_start is None else group_start
+                    group_end = e
+            pending.clear()
+
+        for s, e, body in units:
+            if not body or s == e:
+                pending.append((s, e))
+                continue
+            member_kind, member_name = _declaration(header(s, e, level), kind == "class" and level > 0)
+            qualified = f"{name}.{member_name}" if name and member_name else (member_name or name)
+            if e - s + 1 <= max_lines:
+                members = [CodeChunk(path, language, s, e, _slice(lines, s, e), member_kind, qualified)]
+            else:
+                inner = _units(layout, lines, s, e, level + 1, prefixes)
+                if len(inner) > 1:
+                    members = group(inner, level + 1, member_kind, qualified)
+                else:
+                    members = _windows(lines, path, language, max_lines, s, e, member_kind, qualified)
+            if not members:
+                continue
+            first = members[0]
+            if level > 0 and pending and first.end_line - pending[0][0] + 1 <= max_lines:
+                # Fold the enclosing declaration's header / fields before this member into its chunk
+                first.start_line = pending[0][0]
+                first.text = _slice(lines, first.start_line, first.end_line)
+                pending.clear()
+            flush()
+            chunks.extend(members)
+        if level > 0 and pending and chunks and pending[-1][1] - chunks[-1].start_line + 1 <= max_lines:
+            # ...and the closing lines after the last member into its chunk
+            last = chunks[-1]
+            last.end_line = pending[-1][1]
+            last.text = _slice(lines, last.start_line, last.end_line)
+            pending.clear()
+        flush()
+        return chunks
+
+    units = _units(layout, lines, 1, len(lines), 0, prefixes)
+    return group(units, 0, "module", None)
+
+
+def chunk_file(path: str, source: str, language: str, max_lines: int = DEFAULT_MAX_CHUNK_LINES) -> List[CodeChunk]:
+    if language == "python":
+        return chunk_python(source, path, max_lines)
+    return chunk_generic(source, path, language, max_lines)
+
+
+# Docstrings are cut to their first paragraph and at most this many characters
+MAX_DOC_CHARS = 300
+
+
+def module_name(path: str) -> str:
+    """Dotted module name of a Python file path, e.g. "app/utils/ast_parser.py" -> "app.utils.ast_parser"."""
+    parts = path[:-len(".py")].split("/") if path.endswith(".py") else path.split("/")
+    if parts and parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def _signature(node: ast.AST) -> str:
+    decorators = "".join(f"@{ast.unparse(d)}\n" for d in getattr(node, "decorator_list", []))
+    if isinstance(node, ast.ClassDef):
+        bases = ", ".join(ast.unparse(b) for b in node.bases + node.keywords)
+        return f"{decorators}class {node.name}({bases}):" if bases else f"{decorators}class {node.name}:"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{decorators}{prefix} {node.name}({ast.unparse(node.args)}){returns}:"
+
+
+def _doc(node: ast.AST) -> str:
+    doc = (ast.get_docstring(node) or "").split("\n\n")[0].strip()
+    return doc if len(doc) <= MAX_DOC_CHARS else doc[:MAX_DOC_CHARS - 3] + "..."
+
+
+def extract_symbols(source: str, path: str, language: str) -> dict:
+    """
+    Definitions and imports of a file, as compact JSON-ready lists:
+      defs:    [qualified name, kind, start line, end line, signature, docstring summary]
+               (kind is class, function, method or variable; a variable's "signature" is its assignment)
+      imports: [module, imported name or None, local alias]
+    Only Python is understood so far; other languages (and unparsable files) have none.
+    """
+    symbols = {"defs": [], "imports": []}
+    if language != "python":
+        return symbols
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return symbols
+    package = module_name(path).rsplit(".", 1)[0] if "." in module_name(path) else ""
+
+    def visit(body: List[ast.stmt], prefix: str, in_class: bool) -> None:
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                kind = "class" if isinstance(node, ast.ClassDef) else ("method" if in_class else "function")
+                name = f"{prefix}{node.name}"
+                symbols["defs"].append([name, kind, _node_start(node), node.end_lineno, _signature(node), _doc(node)])
+                if isinstance(node, ast.ClassDef):
+                    visit(node.body, f"{name}.", True)
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)) and not prefix:
+                # Module-level constants and singletons, e.g. `aiservice = AIService()`
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                if len(targets) == 1 and isinstance(targets[0], ast.Name):
+                    text = ast.unparse(node)
+                    text = text if len(text) <= MAX_DOC_CHARS else text[:MAX_DOC_CHARS - 3] + "..."
+                    symbols["defs"].append([targets[0].id, "variable", node.lineno, node.end_lineno, text, ""])
+            elif isinstance(node, ast.Import) and not prefix:
+                for alias in node.names:
+                    symbols["imports"].append([alias.name, None, alias.asname or alias.name.split(".")[0]])
+            elif isinstance(node, ast.ImportFrom) and not prefix:
+                module = node.module or ""
+                if node.level:
+                    # Relative import: resolve against this file's package
+                    base = package.split(".") if package else []
+                    base = base[:len(base) - (node.level - 1)] if node.level > 1 else base
+                    module = ".".join(base + ([module] if module else []))
+                for alias in node.names:
+                    if alias.name != "*":
+                        symbols["imports"].append([module, alias.name, alias.asname or alias.name])
+
+    visit(tree.body, "", False)
+    return symbols
+
+
+# Keywords kept verbatim in token streams of languages without a tokenizer here (identifiers
+# are normalized away); the union over the C-like languages is close enough for clone detection
+_GENERIC_KEYWORDS = {
+    "if", "else", "for", "while", "do", "switch", "case", "default", "break", "continue", "return",
+    "try", "catch", "finally", "throw", "throws", "new", "delete", "class", "struct", "interface",
+    "enum", "function", "func", "fn", "def", "var", "let", "const", "static", "public", "private",
+    "protected", "import", "package", "use", "namespace", "void", "null", "nil", "true", "false",
+    "this", "self", "super", "async", "await", "yield", "match", "impl", "trait", "go", "defer",
+}
+_SKIPPED_PY_TOKENS = {
+    tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT,
+    tokenize.ENCODING, tokenize.ENDMARKER,
+}
+
+
+def code_tokens(source: str, language: str) -> List[Tuple[str, int]]:
+    """
+    (token, line) pairs of `source` with comments and layout dropped, identifiers normalized to
+    "ID" and literals to "LIT", so renamed copies of code produce the same stream.
+    """
+    if language == "python":
+        try:
+            tokens = []
+            for tok in tokenize.generate_tokens(io.StringIO(source).readline):
+                if tok.type in _SKIPPED_PY_TOKENS:
+                    continue
+                if tok.type == tokenize.NAME:
+                    text = tok.string if keyword.iskeyword(tok.string) else "ID"
+                elif tok.type in (tokenize.NUMBER, tokenize.STRING):
+                    text = "LIT"
+                else:
+                    text = tok.string
+                tokens.append((text, tok.start[0]))
+            return tokens
+        except (tokenize.TokenError, IndentationError, SyntaxError):
+            pass  # fall back to the generic tokenizer
+    tokens = []
+    for tok in scan(source, language):
+        if tok.kind in ("string", "number"):
+            text = "LIT"
+        elif tok.kind == "ident":
+            text = tok.text if tok.text in _GENERIC_KEYWORDS else "ID"
+        else:
+            text = tok.text
+        tokens.append((text, tok.line))
+    return tokens
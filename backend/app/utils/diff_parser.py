@@ -0,0 +1,183 @@
+"""
+Parses unified diffs (`git diff`, `diff -u`) and applies them to base files.
+
+`parse_unified_diff` reads the diff line by line and yields each file's patch as soon as its
+last hunk ends, so a large diff is never held in memory as a whole. `apply_patch` rebuilds the
+new file from its base and reports which new-file lines the patch touched.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+_HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+_DEV_NULL = "/dev/null"
+
+
+class PatchRejected(ValueError):
+    """The diff is malformed, or a hunk does not match the base file it is applied to."""
+
+
+@dataclass
+class Hunk:
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: List[Tuple[str, str]] = field(default_factory=list)  # (" ", "-" or "+", text without the marker)
+
+
+@dataclass
+class FilePatch:
+    old_path: Optional[str]  # None for an added file
+    new_path: Optional[str]  # None for a deleted file
+    hunks: List[Hunk] = field(default_factory=list)
+    binary: bool = False
+
+    @property
+    def path(self) -> str:
+        return self.new_path or self.old_path
+
+
+def _strip_prefix(path: str) -> Optional[str]:
+    # "a/src/x.py\t2024-01-01 ..." -> "src/x.py"; /dev/null -> None
+    path = path.split("\t", 1)[0].strip()
+    if path == _DEV_NULL:
+        return None
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
+
+
+def parse_unified_diff(lines: Iterable[str]) -> Iterator[FilePatch]:
+    """Yield the patch of each file in the diff, in order. Raises PatchRejected on a malformed hunk."""
+    patch: Optional[FilePatch] = None
+    hunk: Optional[Hunk] = None
+    old_left = new_left = 0
+    pending_old: Optional[str] = None
+
+    for raw in lines:
+        line = raw.rstrip("\n").rstrip("\r")
+        if hunk is not None and (old_left or new_left):
+            marker, text = line[:1] or " ", line[1:]
+            if marker == "\\":
+                continue  # "\ No newline at end of file"
+            if marker not in " -+":
+                raise PatchRejected(f"Hunk of {patch.path} ends early at {line[:80]!r}")
+            hunk.lines.append((marker, text))
+            if marker != "+":
+                old_left -= 1
+            if marker != "-":
+                new_left -= 1
+            if old_left < 0 or new_left < 0:
+                raise PatchRejected(f"Hunk of {patch.path} has more lines than its header says")
+            continue
+        if line.startswith("\\"):
+            continue
+
+        if line.startswith("diff --git "):
+            if patch is not None:
+                yield patch
+            patch, hunk, pending_old = None, None, None
+            parts = line[len("diff --git "):].split(" b/", 1)
+            if len(parts) == 2:
+                patch = FilePatch(_strip_prefix(parts[0]), parts[1])
+        elif line.startswith("--- "):
+            pending_old = line[4:]
+        elif line.startswith("+++ ") and pending_old is not None:
+            old_path, new_path = _strip_prefix(pending_old), _strip_prefix(line[4:])
+            if patch is not None and not patch.hunks:
+                patch.old_path, patch.new_path = old_path, new_path
+            else:
+                if patch is not None:
+                    yield patch
+                patch = FilePatch(old_path, new_path)
+            hunk, pending_old = None, None
+        elif line.startswith("rename from ") and patch is not None:
+            patch.old_path = line[len("rename from "):]
+        elif line.startswith("rename to ") and patch is not None:
+            patch.new_path = line[len("rename to "):]
+        elif line.startswith("new file mode") and patch is not None:
+            patch.old_path = None
+        elif line.startswith("deleted file mode") and patch is not None:
+            patch.new_path = None
+        elif line.startswith("Binary files ") and patch is not None:
+            patch.binary = True
+        elif line.startswith("@@"):
+            match = _HUNK_HEADER_RE.match(line)
+            if match is None or patch is None:
+                raise PatchRejected(f"Unexpected hunk header {line[:80]!r}")
+            old_start, old_count, new_start, new_count = match.groups()
+            hunk = Hunk(
+                int(old_start), 1 if old_count is None else int(old_count),
+                int(new_start), 1 if new_count is None else int(new_count),
+            )
+            old_left, new_left = hunk.old_count, hunk.new_count
+            patch.hunks.append(hunk)
+        # Anything else (index lines, commit messages, mode changes) carries nothing to review
+
+    if hunk is not None and (old_left or new_left):
+        raise PatchRejected(f"Diff ends inside a hunk of {patch.path}")
+    if patch is not None:
+        yield patch
+
+
+def apply_patch(patch: FilePatch, base: str) -> Tuple[str, Set[int], Set[int]]:
+    """
+    Apply `patch` to `base` (the old file's text; "" for an added file). Returns the new text,
+    the new-file lines added or changed, and the new-file lines where lines were only removed.
+    Raises PatchRejected when a context or removed line differs from the base.
+    """
+    old = base.split("\n") if base else []
+    new: List[str] = []
+    added: Set[int] = set()
+    removed_at: Set[int] = set()
+    cursor = 0  # old lines consumed
+    for hunk in patch.hunks:
+        # A hunk removing or keeping nothing (old_count 0) inserts after line old_start
+        start = hunk.old_start if hunk.old_count == 0 else hunk.old_start - 1
+        if start < cursor or start > len(old):
+            raise PatchRejected(f"Hunk at line {hunk.old_start} of {patch.path} does not fit the base file")
+        new.extend(old[cursor:start])
+        cursor = start
+        for marker, text in hunk.lines:
+            if marker == "+":
+                new.append(text)
+                added.add(len(new))
+                continue
+            if cursor >= len(old) or old[cursor].rstrip("\r") != text.rstrip("\r"):
+                raise PatchRejected(
+                    f"Hunk at line {hunk.old_start} of {patch.path} does not match the base file at line {cursor + 1}"
+                )
+            cursor += 1
+            if marker == " ":
+                new.append(text)
+            else:
+                removed_at.add(len(new) + 1)
+    new.extend(old[cursor:])
+    removed_at = {min(line, max(len(new), 1)) for line in removed_at} - added
+    return "\n".join(new), added, removed_at
+
+
+def hunk_regions(patch: FilePatch) -> List[Tuple[int, str, Set[int], Set[int]]]:
+    """
+    Without the base file, the new side of each hunk: (first new line, its text, and as in
+    `apply_patch` the lines added and where lines were only removed). Only as much surrounding
+    code as the diff's context lines is known.
+    """
+    regions = []
+    for hunk in patch.hunks:
+        lines: List[str] = []
+        added: Set[int] = set()
+        removed_at: Set[int] = set()
+        for marker, text in hunk.lines:
+            if marker == "-":
+                removed_at.add(hunk.new_start + len(lines))
+                continue
+            lines.append(text)
+            if marker == "+":
+                added.add(hunk.new_start + len(lines) - 1)
+        if lines:
+            last = hunk.new_start + len(lines) - 1
+            regions.append((hunk.new_start, "\n".join(lines), added, {min(line, last) for line in removed_at} - added))
+    return regions
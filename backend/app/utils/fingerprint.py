@@ -0,0 +1,46 @@
+"""
+Winnowing (Schleimer, Wilkerson & Aiken, 2003) over normalized token streams.
+
+Every k consecutive tokens are hashed; in every window of w consecutive k-gram hashes the
+minimum is kept. Any shared run of at least w + k - 1 tokens is then guaranteed to share a
+fingerprint, while only about 2 / (w + 1) of the k-grams are stored.
+"""
+
+import zlib
+from collections import deque
+from typing import List, Sequence, Tuple
+
+_MOD = (1 << 61) - 1  # fits a signed 64-bit column
+_BASE = 1_000_003
+
+
+def winnow(tokens: Sequence[Tuple[str, int]], k: int, w: int) -> List[Tuple[int, int]]:
+    """(fingerprint, line of the k-gram's first token) for `tokens`, in order of position."""
+    if len(tokens) < k:
+        return []
+    ids = [zlib.crc32(text.encode("utf-8")) for text, _ in tokens]
+    top = pow(_BASE, k - 1, _MOD)
+    hashes = []
+    h = 0
+    for i, token_id in enumerate(ids):
+        if i >= k:
+            h = (h - ids[i - k] * top) % _MOD
+        h = (h * _BASE + token_id) % _MOD
+        if i >= k - 1:
+            hashes.append(h)
+
+    selected: List[Tuple[int, int]] = []
+    window: deque = deque()  # positions of increasing hashes; the front is the window minimum
+    last = -1
+    for i, h in enumerate(hashes):
+        # Rightmost minimum, so a run of equal hashes yields one fingerprint
+        while window and hashes[window[-1]] >= h:
+            window.pop()
+        window.append(i)
+        if window[0] <= i - w:
+            window.popleft()
+        if i >= w - 1 or i == len(hashes) - 1:
+            if window[0] != last:
+                last = window[0]
+                selected.append((hashes[last], tokens[last][1]))
+    return selected
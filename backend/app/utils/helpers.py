@@ -0,0 +1,88 @@
+import hashlib
+import os
+import re
+from typing import Iterator, List, Optional, Tuple
+
+# Mirrors frontend/utils/fileUtils.ts SUPPORTED_LANGUAGES
+LANGUAGE_BY_EXTENSION = {
+    ".py": "python", ".pyw": "python", ".pyi": "python",
+    ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript", ".cjs": "javascript",
+    ".ts": "typescript", ".tsx": "typescript",
+    ".java": "java",
+    ".cpp": "cpp", ".cc": "cpp", ".cxx": "cpp", ".c++": "cpp", ".hpp": "cpp", ".hxx": "cpp",
+    ".c": "c", ".h": "c",
+    ".cs": "csharp",
+    ".go": "go",
+    ".rs": "rust",
+    ".php": "php",
+    ".rb": "ruby",
+    ".kt": "kotlin",
+    ".swift": "swift",
+}
+
+# Vendored, generated and VCS directories that are never reviewed
+SKIPPED_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "bower_components", "vendor", "third_party",
+    "__pycache__", ".venv", "venv", "env", "conda_env", ".tox", ".mypy_cache", ".pytest_cache",
+    "dist", "build", "target", ".next", ".idea", ".vscode",
+}
+
+
+def detect_language(path: str) -> Optional[str]:
+    return LANGUAGE_BY_EXTENSION.get(os.path.splitext(path)[1].lower())
+
+
+def iter_source_files(root: str, max_bytes: int) -> Iterator[Tuple[str, str]]:
+    """Yield (relative path, language) for every reviewable file under `root`, in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIPPED_DIRS)
+        for filename in sorted(filenames):
+            language = detect_language(filename)
+            if language is None:
+                continue
+            full = os.path.join(dirpath, filename)
+            try:
+                if os.path.islink(full) or os.path.getsize(full) > max_bytes:
+                    continue
+            except OSError:
+                continue
+            yield os.path.relpath(full, root).replace(os.sep, "/"), language
+
+
+def read_text(path: str) -> Optional[str]:
+    """Read a source file as UTF-8, or None if it looks binary."""
+    with open(path, "rb") as f:
+        return decode_source(f.read())
+
+
+def decode_source(data: bytes) -> Optional[str]:
+    """Decode source bytes as UTF-8, or None if they look binary."""
+    if b"\0" in data:
+        return None
+    return data.decode("utf-8", errors="replace")
+
+
+_URL_RE = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*://(?:[^@/]+@)?([^/:]+)(?::\d+)?/(.+)$")
+_SCP_LIKE_RE = re.compile(r"^(?:[\w.-]+@)?([\w.-]+):(?!//)(.+)$")
+
+
+def git_blob_sha(data: bytes) -> str:
+    """The SHA git would give `data` as a blob, so buffers share cache entries with checked-out files."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def repository_url_variants(url: str) -> List[str]:
+    """
+    Spellings of the same git remote that may be stored as Repository.url: https/http/ssh/scp-like
+    forms, each with and without a trailing ".git" or "/". Lets a lookup by URL use an index.
+    """
+    url = url.strip()
+    bare = url.rstrip("/")
+    bare = bare[:-4] if bare.endswith(".git") else bare
+    variants = {url, bare, bare + ".git", bare + "/"}
+    m = _URL_RE.match(bare) or _SCP_LIKE_RE.match(bare)
+    if m:
+        host, path = m.group(1).lower(), m.group(2).strip("/")
+        for base in (f"https://{host}/{path}", f"http://{host}/{path}", f"ssh://git@{host}/{path}", f"git@{host}:{path}"):
+            variants.update({base, base + ".git", base + "/"})
+    return sorted(variants)
@@ -0,0 +1,168 @@
+"""
+Extracts the JSON array of a model response in one pass.
+
+Models wrap the array in prose or code fences, leave trailing commas, and get cut off at their
+output limit. `extract_json_array` finds the first top-level array wherever it is, decodes it
+in one call to the C decoder when it is well-formed, else element by element (falling back
+to a tolerant decoder for an element the C one rejects) and, when the output ends early, keeps
+every element that was complete. Every character is looked at a bounded number of times, so
+time is linear in the response length.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+_WHITESPACE_RE = re.compile(r"[ \t\r\n]*")
+_NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_LITERALS = {"true": True, "false": False, "null": None}
+_MAX_DEPTH = 64
+_decoder = json.JSONDecoder(strict=False)
+
+
+@dataclass
+class ExtractedArray:
+    items: List[Any]
+    # False when the response ended (or broke off) inside the array; `items` are the elements before that
+    complete: bool
+    # True when trailing commas or other slips had to be tolerated to read the elements
+    repaired: bool = False
+
+
+class _Truncated(Exception):
+    """The text ends inside the value."""
+
+
+class _Invalid(Exception):
+    """The value is not JSON, even leniently."""
+
+
+def _skip(text: str, i: int) -> int:
+    return _WHITESPACE_RE.match(text, i).end()
+
+
+def _array_start(text: str) -> Optional[int]:
+    # The first "[" opening an array of objects (or an empty one); "[" in prose is passed over
+    i = text.find("[")
+    while i != -1:
+        j = _skip(text, i + 1)
+        if j == len(text) or text[j] in "{]":
+            return i
+        i = text.find("[", j)
+    return None
+
+
+def _lenient_value(text: str, i: int, depth: int = 0) -> Tuple[Any, int]:
+    # Decode one value at text[i] (no leading whitespace), allowing trailing commas in containers
+    n = len(text)
+    if i >= n:
+        raise _Truncated()
+    if depth > _MAX_DEPTH:
+        raise _Invalid()
+    c = text[i]
+    if c == '"':
+        try:
+            return json.decoder.scanstring(text, i + 1, False)
+        except json.JSONDecodeError:
+            raise _Truncated()  # only an unterminated string makes scanstring fail when not strict
+    if c == "{":
+        obj = {}
+        i = _skip(text, i + 1)
+        while True:
+            if i >= n:
+                raise _Truncated()
+            if text[i] == "}":
+                return obj, i + 1
+            if text[i] != '"':
+                raise _Invalid()
+            key, i = _lenient_value(text, i, depth + 1)
+            i = _skip(text, i)
+            if i >= n:
+                raise _Truncated()
+            if text[i] != ":":
+                raise _Invalid()
+            value, i = _lenient_value(text, _skip(text, i + 1), depth + 1)
+            obj[key] = value
+            i = _skip(text, i)
+            if i >= n:
+                raise _Truncated()
+            if text[i] == ",":
+                i = _skip(text, i + 1)
+            elif text[i] != "}":
+                raise _Invalid()
+    if c == "[":
+        items = []
+        i = _skip(text, i + 1)
+        while True:
+            if i >= n:
+                raise _Truncated()
+            if text[i] == "]":
+                return items, i + 1
+            value, i = _lenient_value(text, i, depth + 1)
+            items.append(value)
+            i = _skip(text, i)
+            if i >= n:
+                raise _Truncated()
+            if text[i] == ",":
+                i = _skip(text, i + 1)
+            elif text[i] != "]":
+                raise _Invalid()
+    match = _NUMBER_RE.match(text, i)
+    if match:
+        if match.end() == n:
+            raise _Truncated()  # the number may go on
+        number = match.group()
+        return (float(number) if any(ch in number for ch in ".eE") else int(number)), match.end()
+    for literal, value in _LITERALS.items():
+        if text.startswith(literal, i):
+            return value, i + len(literal)
+        if literal.startswith(text[i:i + len(literal)]) and i + len(literal) > n:
+            raise _Truncated()
+    raise _Invalid()
+
+
+def extract_json_array(text: str) -> Optional[ExtractedArray]:
+    """The first top-level JSON array of objects in `text`, as much of it as is readable; None if there is none."""
+    start = _array_start(text)
+    if start is None:
+        return None
+    try:
+        # Well-formed output is the common case; the whole array in one C call
+        return ExtractedArray(_decoder.raw_decode(text, start)[0], complete=True)
+    except (ValueError, RecursionError):
+        pass  # malformed, or nested past the interpreter's recursion limit; read it element by element
+    n = len(text)
+    result = ExtractedArray([], complete=False)
+    i = start + 1
+    while True:
+        i = _skip(text, i)
+        if i >= n:
+            return result
+        if text[i] == "]":
+            result.complete = True
+            return result
+        if text[i] == ",":
+            # An empty element (",,", "[,") is a slip, not data
+            result.repaired = True
+            i += 1
+            continue
+        try:
+            value, i = _decoder.raw_decode(text, i)
+        except (ValueError, RecursionError):
+            # _lenient_value gives up at _MAX_DEPTH, so deeply nested output ends the array here
+            try:
+                value, i = _lenient_value(text, i)
+            except (_Truncated, _Invalid):
+                return result
+            result.repaired = True
+        result.items.append(value)
+        i = _skip(text, i)
+        if i >= n:
+            return result
+        if text[i] == ",":
+            i = _skip(text, i + 1)
+            if i < n and text[i] == "]":
+                result.repaired = True  # trailing comma
+        elif text[i] != "]":
+            return result
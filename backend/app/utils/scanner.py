@@ -0,0 +1,180 @@
+"""
+Linear-time tokenizer for the non-Python languages CodeNova reviews (C-family, JavaScript /
+TypeScript, Go, Rust, PHP, Ruby, ...), and for Python files the `tokenize` module rejects.
+
+It only needs to be right about what changes the structure of a file: comments, string,
+template and regex literals (so brackets inside them are ignored) and the brackets themselves.
+Every pattern either has disjoint alternatives or is a plain `find`, so no input makes it
+backtrack; unterminated strings or comments end at the end of the line or file instead of
+swallowing the rest of it.
+"""
+
+import re
+from typing import Iterator, NamedTuple, Optional
+
+# Quoted strings stop at an unescaped newline, so one stray quote cannot derail the whole file
+_DOUBLE_QUOTED_RE = re.compile(r'(?:[^"\\\n]|\\[\s\S])*')
+_SINGLE_QUOTED_RE = re.compile(r"(?:[^'\\\n]|\\[\s\S])*")
+# Body of a template literal up to its end or the next `${`
+_TEMPLATE_RE = re.compile(r"(?:[^`\\$]|\\[\s\S]|\$(?!\{))*")
+_RAW_BACKTICK_RE = re.compile(r"[^`]*")
+_REGEX_LITERAL_RE = re.compile(r"/(?:[^/\\\n\[]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[A-Za-z]*")
+_IDENTIFIER_RE = re.compile(r"[\w$]+")
+_NUMBER_RE = re.compile(r"[\w.]+")
+_SPACE_RE = re.compile(r"[ \t\r\f\v]+")
+# Longest regex literal looked for; bounds the work of a `/` that turns out not to start one
+_MAX_REGEX_LITERAL = 1024
+
+OPENERS = {"{", "(", "[", "${"}
+CLOSERS = {"}", ")", "]"}
+
+_TEMPLATE_LANGUAGES = {"javascript", "typescript"}  # `...${expr}...`
+_RAW_BACKTICK_LANGUAGES = {"go", "kotlin"}  # `...` without interpolation (Go raw strings, Kotlin identifiers)
+_REGEX_LANGUAGES = {"javascript", "typescript"}
+# Tokens after which a `/` starts a regex literal rather than a division
+_REGEX_AFTER_PUNCT = set("(,=:[!&|?{};+-*%<>~^") | {"${"}
+_REGEX_AFTER_WORDS = {
+    "return", "typeof", "case", "in", "of", "delete", "void", "throw", "new", "yield", "await", "instanceof", "else",
+}
+
+
+class Token(NamedTuple):
+    kind: str  # ident, number, string, punct
+    text: str
+    line: int  # 1-based
+
+
+def _line_comment_prefixes(language: str) -> tuple:
+    if language in ("python", "ruby"):
+        return ("#",)
+    if language == "php":
+        return ("//", "#")
+    return ("//",)
+
+
+def scan(source: str, language: str) -> Iterator[Token]:
+    """Tokens of `source`, without whitespace and comments. Each punctuation character is its own token."""
+    n = len(source)
+    i = 0
+    line = 1
+    line_comments = _line_comment_prefixes(language)
+    block_comments = language not in ("python", "ruby")
+    prev: Optional[Token] = None
+    no_regex_before = 0
+    # One entry per open bracket; "`" marks a template substitution whose "}" resumes the template
+    brackets = []
+
+    def template(start: int, start_line: int):
+        # Scan a template literal body from `start`; returns (end, line, opened_substitution)
+        m = _TEMPLATE_RE.match(source, start)
+        end = m.end()
+        newlines = source.count("\n", start, end)
+        if end < n and source[end] == "`":
+            return end + 1, start_line + newlines, False
+        if source.startswith("${", end):
+            return end + 2, start_line + newlines, True
+        return end, start_line + newlines, False  # unterminated: runs to the end of the file
+
+    while i < n:
+        c = source[i]
+        if c == "\n":
+            line += 1
+            i += 1
+            continue
+        if c in " \t\r\f\v":
+            i = _SPACE_RE.match(source, i).end()
+            continue
+        if c in "/#" and source.startswith(line_comments, i):
+            j = source.find("\n", i)
+            i = n if j < 0 else j
+            continue
+        if c == "/" and block_comments and source.startswith("/*", i):
+            j = source.find("*/", i + 2)
+            end = n if j < 0 else j + 2
+            line += source.count("\n", i, end)
+            i = end
+            continue
+        if c == "'" and language == "rust" and i + 2 < n and (source[i + 1].isalpha() or source[i + 1] == "_") and source[i + 2] != "'":
+            # A lifetime (`'a`), not a char literal
+            end = _IDENTIFIER_RE.match(source, i + 1).end()
+            prev = Token("ident", source[i:end], line)
+            yield prev
+            i = end
+            continue
+        if c == '"' or c == "'":
+            end = (_DOUBLE_QUOTED_RE if c == '"' else _SINGLE_QUOTED_RE).match(source, i + 1).end()
+            if end < n and source[end] == c:
+                end += 1
+            prev = Token("string", source[i:end], line)
+            line += source.count("\n", i, end)  # escaped newlines
+            yield prev
+            i = end
+            continue
+        if c == "`" and language in _TEMPLATE_LANGUAGES:
+            start_line = line
+            end, line, substitution = template(i + 1, line)
+            prev = Token("string", source[i:end - 2 if substitution else end], start_line)
+            yield prev
+            if substitution:
+                brackets.append("`")
+                prev = Token("punct", "${", line)
+                yield prev
+            i = end
+            continue
+        if c == "`" and language in _RAW_BACKTICK_LANGUAGES:
+            end = _RAW_BACKTICK_RE.match(source, i + 1).end()
+            end = min(end + 1, n)
+            prev = Token("string", source[i:end], line)
+            yield prev
+            line += source.count("\n", i, end)
+            i = end
+            continue
+        if c.isalpha() or c == "_" or c == "$":
+            end = _IDENTIFIER_RE.match(source, i).end()
+            prev = Token("ident", source[i:end], line)
+            yield prev
+            i = end
+            continue
+        if c.isdigit():
+            end = _NUMBER_RE.match(source, i).end()
+            prev = Token("number", source[i:end], line)
+            yield prev
+            i = end
+            continue
+        if c == "/" and language in _REGEX_LANGUAGES and (
+            prev is None
+            or (prev.kind == "punct" and prev.text in _REGEX_AFTER_PUNCT)
+            or (prev.kind == "ident" and prev.text in _REGEX_AFTER_WORDS)
+        ):
+            m = _REGEX_LITERAL_RE.match(source, i, i + _MAX_REGEX_LITERAL) if i >= no_regex_before else None
+            if m:
+                prev = Token("string", m.group(), line)
+                yield prev
+                i = m.end()
+                continue
+            if i >= no_regex_before:
+                # The failed match looked as far as the end of the line; trying again from every
+                # `/` up to there would make long minified lines quadratic
+                j = source.find("\n", i, i + _MAX_REGEX_LITERAL)
+                no_regex_before = i + _MAX_REGEX_LITERAL if j < 0 else j
+        if c in "{([":
+            brackets.append(c)
+        elif c == "}" and brackets and brackets[-1] == "`":
+            # End of a template substitution: close it and continue the template literal
+            brackets.pop()
+            yield Token("punct", "}", line)
+            start_line = line
+            end, line, substitution = template(i + 1, line)
+            prev = Token("string", source[i + 1:end - 2 if substitution else end], start_line)
+            yield prev
+            if substitution:
+                brackets.append("`")
+                prev = Token("punct", "${", line)
+                yield prev
+            i = end
+            continue
+        elif c in "})]" and brackets:
+            brackets.pop()
+        prev = Token("punct", c, line)
+        yield prev
+        i += 1
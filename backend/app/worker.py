@@ -0,0 +1,34 @@
+"""
+Dedicated analysis worker process.
+
+Run with `python -m app.worker` next to (or instead of) the dispatcher embedded in the API.
+Set ANALYSIS_DISPATCHER_ENABLED=false on the API processes to keep all analysis work here.
+"""
+
+import signal
+import threading
+
+# Import models so SQLAlchemy sees mappings before the dispatcher queries them
+from app.models import Repository, Analysis, User  # noqa: F401
+from app.core.config import settings
+from app.services.dispatcher import dispatcher
+from app.services.parse_pool import parse_pool
+from app.services.scheduler import stale_analysis_scheduler
+
+
+def main():
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    dispatcher.start()
+    if settings.ANALYSIS_RESCAN_ENABLED:
+        stale_analysis_scheduler.start()
+    stop.wait()
+    print("[Worker] Shutting down...")
+    stale_analysis_scheduler.stop()
+    dispatcher.stop()
+    parse_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark of reading suggestions out of model responses: the single-pass extractor
+(app/utils/json_extract.py) against the previous fenced-regex / json.loads pipeline.
+
+Each response shape is timed with both and the number of suggestions each recovers is shown.
+Run from the backend directory:  python bench_json_extract.py [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+# Add the app directory to Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from app.utils.json_extract import extract_json_array
+
+
+def legacy_parse(text):
+    """The pipeline AIService used before: fenced regex, then the whole text, else nothing."""
+    m = re.search(r"```(?:json)?\s*(\[.*?\])\s*```", text, flags=re.DOTALL | re.IGNORECASE)
+    if m:
+        try:
+            return json.loads(m.group(1))
+        except Exception:
+            pass
+    try:
+        parsed = json.loads(text)
+        return parsed if isinstance(parsed, list) else []
+    except Exception:
+        return []
+
+
+def single_pass_parse(text):
+    extracted = extract_json_array(text)
+    return extracted.items if extracted is not None else []
+
+
+def suggestion(i):
+    return {
+        "file_path": "app/services/example.py",
+        "line_number": 10 + i,
+        "comment": f"Possible issue #{i}: the loop re-reads the [config] on every pass; hoist it.\nSee \"docs\".",
+        "severity": ("low", "medium", "high")[i % 3],
+    }
+
+
+def shapes():
+    items = [suggestion(i) for i in range(12)]
+    plain = json.dumps(items, indent=2)
+    many = json.dumps([suggestion(i) for i in range(2000)], indent=2)
+    trailing = plain.replace("\n  }", ",\n  }").replace("}\n]", "},\n]")
+    return {
+        "plain array": plain,
+        "fenced, with prose": f"Here is my review [v2]:\n\n```json\n{plain}\n```\n\nLet me know if [anything] is unclear.",
+        "trailing commas": f"```json\n{trailing}\n```",
+        "truncated (token limit)": "```json\n" + plain[: int(len(plain) * 0.8)],
+        "2000 suggestions": f"```json\n{many}\n```",
+        "2000, truncated": "```json\n" + many[: int(len(many) * 0.9)],
+        "unclosed fences": "```[" * 20000 + "\nno JSON here",
+        "prose only": "The code looks fine. " * 5000,
+    }
+
+
+def best_of(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per shape; the fastest is reported")
+    args = parser.parse_args()
+
+    print(f"{'shape':<26}{'bytes':>10}{'legacy ms':>12}{'found':>7}{'single-pass ms':>16}{'found':>7}")
+    for name, text in shapes().items():
+        legacy_time, legacy_found = best_of(legacy_parse, text, args.repeat)
+        new_time, new_found = best_of(single_pass_parse, text, args.repeat)
+        print(
+            f"{name:<26}{len(text):>10}{legacy_time * 1000:>12.2f}{legacy_found:>7}"
+            f"{new_time * 1000:>16.2f}{new_found:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()